@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from account.models import Account, Follower
+from post.models import LikedPost, Comment
+
+
+def _count_by_account(model, account_field, exclude_field=None, **filters):
+    # correlated COUNT(*) of the rows of model pointing at the outer account
+    rows = model.objects.filter(**{account_field: OuterRef('id')}, **filters)
+    if exclude_field is not None:
+        rows = rows.exclude(**{exclude_field: OuterRef('id')})
+    rows = rows.order_by().values(account_field).annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(rows), 0)
+
+
+def counter_expressions():
+    return {
+        'followers_count': _count_by_account(Follower, 'followed'),
+        'following_count': _count_by_account(Follower, 'follower'),
+        'likes_received_count': _count_by_account(LikedPost, 'poster'),
+        # own comments and likes are never notified
+        'unread_comments_count': _count_by_account(Comment, 'poster', 'commentator', read=False),
+        'unread_likes_count': _count_by_account(LikedPost, 'poster', 'liked_account', read=False),
+        'unread_followers_count': _count_by_account(Follower, 'followed', read=False),
+    }
+
+
+def reconcile_account_counters(batch_size=1000):
+    """
+    Recompute the denormalized counters of every account in id ranges of ``batch_size``.
+
+    Every batch is one UPDATE in its own transaction so writers are never blocked for long.
+    Returns the number of updated accounts.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        ids = list(Account.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return updated
+        with transaction.atomic():
+            updated += Account.objects.filter(id__gte=ids[0], id__lte=ids[-1]).update(**counter_expressions())
+        last_id = ids[-1]
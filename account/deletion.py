@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models import F, Q
+
+from account.models import Account, AccountAccessToken, AccountPasscode, Follower
+from post.feed_cache import post_scopes
+from post.deletion import raw_delete, count_in, forget_likes, forget_comments, delete_in_batches, delete_post_rows, \
+    delete_posts
+from post.models import Post, LikedPost, Comment, TimelineEntry
+from server.auth import invalidate_access_tokens
+
+
+def forget_follows(follows):
+    # take the follows off the counters of both accounts
+    Account.objects.filter(id__in=follows.values('followed_id')).update(
+        followers_count=F('followers_count') - count_in(follows, 'followed'),
+        unread_followers_count=F('unread_followers_count') - count_in(follows, 'followed', Q(read=False)))
+    Account.objects.filter(id__in=follows.values('follower_id')).update(
+        following_count=F('following_count') - count_in(follows, 'follower'))
+
+
+def account_rows(account_id):
+    # rows of other tables referencing the account, with the counters they are counted in
+    return [
+        (LikedPost.objects.filter(liked_account=account_id), forget_likes),
+        (Comment.objects.filter(commentator=account_id), forget_comments),
+        (Follower.objects.filter(follower=account_id), forget_follows),
+        (Follower.objects.filter(followed=account_id), forget_follows),
+        (TimelineEntry.objects.filter(account=account_id), None),
+    ]
+
+
+def account_feed_scopes(account_id):
+    # cached feeds showing the posts of the account or the posts it liked, read before they are deleted
+    posts = Post.objects.filter(poster=account_id).order_by().values_list('channel', 'poster_email')
+    liked_posts = (LikedPost.objects.filter(liked_account=account_id).order_by()
+                   .values_list('post__channel', 'poster_email'))
+    feeds = list(posts.distinct()) + list(liked_posts.distinct())
+    return {scope for channel, email in feeds for scope in post_scopes(channel, email)}
+
+
+def delete_account(account, batch_size=None):
+    """
+    Delete ``account`` with everything it published, liked, commented and followed, in batches of ``batch_size``.
+
+    The access tokens go first so the account writes nothing new while its rows are deleted. The account itself and
+    whatever was left are deleted in the last transaction. Returns the number of deleted posts.
+    """
+    tokens = AccountAccessToken.objects.filter(account=account.id)
+    access_tokens = list(tokens.values_list('access_token', flat=True))
+    raw_delete(tokens)
+    invalidate_access_tokens(access_tokens)
+
+    deleted_posts = delete_posts(Post.objects.filter(poster=account.id), batch_size)
+    for rows, forget in account_rows(account.id):
+        delete_in_batches(rows, forget, batch_size)
+
+    with transaction.atomic():
+        deleted_posts += delete_post_rows(Post.objects.filter(poster=account.id))
+        for rows, forget in account_rows(account.id):
+            if forget is not None:
+                forget(rows)
+            raw_delete(rows)
+        raw_delete(AccountAccessToken.objects.filter(account=account.id))
+        raw_delete(AccountPasscode.objects.filter(account_email=account.email))
+        raw_delete(Account.objects.filter(id=account.id))
+    return deleted_posts
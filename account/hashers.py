@@ -0,0 +1,47 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.crypto import constant_time_compare
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2 with the cost of ``PASSWORD_PBKDF2_ITERATIONS``, hashes of another cost are upgraded on login.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class UnsaltedSHA512PasswordHasher(hashers.BasePasswordHasher):
+    """
+    The unsalted sha512 hex digests accounts were created with, only kept so their next login can upgrade them.
+
+    Migration 0010 tagged the stored digests as ``unsalted_sha512$$<hex digest>``.
+    """
+    algorithm = 'unsalted_sha512'
+
+    def salt(self):
+        return ''
+
+    def encode(self, password, salt):
+        if salt != '':
+            raise ValueError('salt must be empty.')
+        return f'{self.algorithm}$${hashlib.sha512(password.encode("utf-8")).hexdigest()}'
+
+    def decode(self, encoded):
+        algorithm, empty, digest = encoded.split('$', 2)
+        assert algorithm == self.algorithm
+        return {'algorithm': algorithm, 'hash': digest, 'salt': None}
+
+    def verify(self, password, encoded):
+        return constant_time_compare(encoded, self.encode(password, ''))
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {'algorithm': decoded['algorithm'], 'hash': hashers.mask_hash(decoded['hash'])}
+
+    def harden_runtime(self, password, encoded):
+        pass
@@ -0,0 +1,104 @@
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from account.models import OutgoingEmail
+
+logger = logging.getLogger('account.mail')
+
+
+def passcode_email(passcode):
+    subject = 'Your passcode'
+    body = f'Your passcode is {passcode}, it expires in 10 minutes.'
+    return subject, body
+
+
+async def aqueue_email(recipient, subject, body):
+    # one insert, the request never talks to the mail server
+    return await OutgoingEmail.objects.acreate(recipient=recipient, subject=subject, body=body)
+
+
+def retry_delay(attempts):
+    # doubled after every failed attempt
+    return datetime.timedelta(seconds=settings.EMAIL_RETRY_SECONDS * 2 ** (attempts - 1))
+
+
+def claim_due_emails(batch_size):
+    """
+    Take up to ``batch_size`` due emails off the queue.
+
+    Their next attempt is pushed back by ``EMAIL_CLAIM_SECONDS``, so other workers skip them and a crashed
+    worker's emails are retried once the claim expires.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # locked rows are left to the worker holding them where the database supports it
+        emails = list(OutgoingEmail.objects.select_for_update(skip_locked=True)
+                      .filter(status=OutgoingEmail.PENDING, next_attempt_datetime__lte=now)
+                      .order_by('next_attempt_datetime', 'id')[:batch_size])
+        OutgoingEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            next_attempt_datetime=now + datetime.timedelta(seconds=settings.EMAIL_CLAIM_SECONDS))
+    return emails
+
+
+def record_failure(email, error):
+    attempts = email.attempts + 1
+    if attempts >= settings.EMAIL_MAX_ATTEMPTS:
+        changes = {'status': OutgoingEmail.FAILED}
+        logger.error('giving up on email %s to %s after %d attempts: %s', email.id, email.recipient, attempts, error)
+    else:
+        changes = {'next_attempt_datetime': timezone.now() + retry_delay(attempts)}
+        logger.warning('email %s to %s failed, attempt %d: %s', email.id, email.recipient, attempts, error)
+    OutgoingEmail.objects.filter(id=email.id).update(attempts=attempts, last_error=str(error), **changes)
+
+
+def deliver_batch(emails):
+    """
+    Send ``emails`` over one mail server connection. Returns ``(sent, failed)``.
+    """
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # the mail server is unreachable, the whole batch is retried later
+        for email in emails:
+            record_failure(email, e)
+        return 0, len(emails)
+
+    sent_ids = []
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, settings.DEFAULT_FROM_EMAIL, [email.recipient],
+                                   connection=connection)
+            try:
+                message.send()
+            except Exception as e:
+                record_failure(email, e)
+            else:
+                sent_ids.append(email.id)
+    finally:
+        connection.close()
+
+    OutgoingEmail.objects.filter(id__in=sent_ids).update(status=OutgoingEmail.SENT, sent_datetime=timezone.now(),
+                                                         attempts=F('attempts') + 1, last_error='')
+    return len(sent_ids), len(emails) - len(sent_ids)
+
+
+def deliver_due_emails(batch_size=None):
+    """
+    Deliver every due email in batches of ``batch_size``. Returns ``(sent, failed)``.
+    """
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    sent = failed = 0
+    while True:
+        emails = claim_due_emails(batch_size)
+        if not emails:
+            return sent, failed
+        batch_sent, batch_failed = deliver_batch(emails)
+        sent += batch_sent
+        failed += batch_failed
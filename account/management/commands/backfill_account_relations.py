@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from account.relations import backfill_account_relations
+
+
+class Command(BaseCommand):
+    help = 'Link the rows that only carry an account email to the account id, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for relation, updated in backfill_account_relations(options['batch_size']).items():
+            self.stdout.write(f'{relation}: {updated} rows linked')
+        self.stdout.write(self.style.SUCCESS('Backfilled account relations.'))
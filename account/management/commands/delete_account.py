@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from account.deletion import account_feed_scopes, delete_account
+from account.models import Account
+from post.feed_cache import invalidate_feeds
+
+
+class Command(BaseCommand):
+    help = 'Delete an account with its posts, likes, comments and follows in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('--batch-size', type=int, help='rows per transaction, DELETE_BATCH_SIZE by default')
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.get(email=options['email'])
+        except Account.DoesNotExist:
+            raise CommandError(f'No account with the email {options["email"]}.')
+        scopes = account_feed_scopes(account.id)
+        deleted_posts = delete_account(account, options['batch_size'])
+        # bump the feeds instead of clearing the cache, which may be shared with other data
+        invalidate_feeds(scopes)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {account.email} and {deleted_posts} posts.'))
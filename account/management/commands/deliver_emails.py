@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from account.mail import deliver_due_emails
+
+
+class Command(BaseCommand):
+    help = 'Deliver the queued emails, with --loop keep polling the queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='emails sent over one mail server connection')
+        parser.add_argument('--loop', action='store_true', help='keep delivering until interrupted')
+        parser.add_argument('--interval', type=float, default=1, help='seconds between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = deliver_due_emails(options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails, {failed} failed.'))
+            if not options['loop']:
+                return
+            if not sent and not failed:
+                time.sleep(options['interval'])
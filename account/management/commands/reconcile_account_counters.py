@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from account.counters import reconcile_account_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute followers, following and received likes counters of every account'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = reconcile_account_counters(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Reconciled counters of {updated} accounts.'))
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_by_email(model, email_field):
+    rows = (model.objects.filter(**{email_field: OuterRef('email')}).order_by().values(email_field)
+            .annotate(total=Count('id')).values('total'))
+    return Coalesce(Subquery(rows), 0)
+
+
+def fill_account_counters(apps, schema_editor):
+    Account = apps.get_model('account', 'Account')
+    Follower = apps.get_model('account', 'Follower')
+    LikedPost = apps.get_model('post', 'LikedPost')
+    Account.objects.update(
+        followers_count=count_by_email(Follower, 'followed_email'),
+        following_count=count_by_email(Follower, 'follower_email'),
+        likes_received_count=count_by_email(LikedPost, 'poster_email'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+        ('post', '0002_liked_post_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='followers_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='following_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='likes_received_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_account_counters, migrations.RunPython.noop),
+    ]
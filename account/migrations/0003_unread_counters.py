@@ -0,0 +1,51 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:42
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_unread(model, email_field, exclude_field=None):
+    rows = model.objects.filter(**{email_field: OuterRef('email')}, read=False)
+    if exclude_field is not None:
+        rows = rows.exclude(**{exclude_field: OuterRef('email')})
+    rows = rows.order_by().values(email_field).annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(rows), 0)
+
+
+def fill_unread_counters(apps, schema_editor):
+    Account = apps.get_model('account', 'Account')
+    Follower = apps.get_model('account', 'Follower')
+    LikedPost = apps.get_model('post', 'LikedPost')
+    Comment = apps.get_model('post', 'Comment')
+    Account.objects.update(
+        unread_comments_count=count_unread(Comment, 'poster_email', 'commentator_email'),
+        unread_likes_count=count_unread(LikedPost, 'poster_email', 'liked_account_email'),
+        unread_followers_count=count_unread(Follower, 'followed_email'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_account_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='unread_comments_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='unread_followers_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='unread_likes_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_unread_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_unread_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follower',
+            index=models.Index(condition=models.Q(('read', False)), fields=['followed_email', 'id'], name='follower_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:44
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def drop_single_column_indexes(table, columns):
+    # drop the indexes in place, altering db_index would make sqlite rebuild the whole table
+    def drop(apps, schema_editor):
+        connection = schema_editor.connection
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        for name, info in constraints.items():
+            if (info['index'] and not info['unique'] and not info['primary_key']
+                    and len(info['columns']) == 1 and info['columns'][0] in columns):
+                schema_editor.execute(f'DROP INDEX {schema_editor.quote_name(name)}')
+
+    return migrations.RunPython(drop, migrations.RunPython.noop)
+
+
+def count_by_email(model, email_field):
+    rows = (model.objects.filter(**{email_field: OuterRef('email')}).order_by().values(email_field)
+            .annotate(total=Count('id')).values('total'))
+    return Coalesce(Subquery(rows), 0)
+
+
+def remove_duplicate_followers(apps, schema_editor):
+    Account = apps.get_model('account', 'Account')
+    Follower = apps.get_model('account', 'Follower')
+
+    # keep the first follow record of every (follower, followed) pair
+    duplicates = (Follower.objects.values('follower_email', 'followed_email')
+                  .annotate(first_id=Min('id'), total=Count('id')).filter(total__gt=1))
+    if not duplicates.exists():
+        return
+    for duplicate in duplicates:
+        Follower.objects.filter(follower_email=duplicate['follower_email'],
+                                followed_email=duplicate['followed_email']).exclude(
+            id=duplicate['first_id']).delete()
+    Account.objects.update(
+        followers_count=count_by_email(Follower, 'followed_email'),
+        following_count=count_by_email(Follower, 'follower_email'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_unread_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                drop_single_column_indexes('account_account', ['name', 'password']),
+                drop_single_column_indexes('account_accountpasscode', ['passcode']),
+                drop_single_column_indexes('account_follower', ['follower_email']),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='account',
+                    name='name',
+                    field=models.CharField(max_length=100),
+                ),
+                migrations.AlterField(
+                    model_name='account',
+                    name='password',
+                    field=models.CharField(max_length=500),
+                ),
+                migrations.AlterField(
+                    model_name='accountpasscode',
+                    name='passcode',
+                    field=models.CharField(max_length=10),
+                ),
+                migrations.AlterField(
+                    model_name='follower',
+                    name='follower_email',
+                    field=models.EmailField(max_length=254),
+                ),
+            ],
+        ),
+        migrations.RunPython(remove_duplicate_followers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follower',
+            constraint=models.UniqueConstraint(fields=('follower_email', 'followed_email'), name='unique_follower'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_foreign_key(model_name, field_name):
+    # adopt an existing id column as a foreign key, sqlite can only add the constraint by rebuilding the table
+    def add(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            return
+        model = apps.get_model('account', model_name)
+        field = model._meta.get_field(field_name)
+        schema_editor.execute(schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
+
+    return migrations.RunPython(add, migrations.RunPython.noop)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_query_shape_indexes'),
+    ]
+
+    operations = [
+        # follower_id already holds the follower account id, only the model state changes
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='follower',
+                    name='follower_id',
+                ),
+                migrations.AddField(
+                    model_name='follower',
+                    name='follower',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='following', to='account.account'),
+                ),
+            ],
+        ),
+        add_foreign_key('follower', 'follower'),
+        # nullable until backfilled, so they are added without rewriting the tables
+        migrations.AddField(
+            model_name='accountaccesstoken',
+            name='account',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='access_tokens', to='account.account'),
+        ),
+        migrations.AddField(
+            model_name='follower',
+            name='followed',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='followers', to='account.account'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:20
+
+from django.db import migrations, transaction
+from django.db.models import OuterRef, Subquery
+
+
+def fill_account_ids(Account, model, account_field, email_field, batch_size=1000):
+    # resolve the email column to account ids in id ranges, one short transaction per batch
+    account_ids = Subquery(Account.objects.filter(email=OuterRef(email_field)).values('id')[:1])
+    last_id = 0
+    while True:
+        ids = list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            model.objects.filter(id__gte=ids[0], id__lte=ids[-1], **{f'{account_field}__isnull': True}).update(
+                **{account_field: account_ids})
+        last_id = ids[-1]
+
+
+def backfill_account_relations(apps, schema_editor):
+    Account = apps.get_model('account', 'Account')
+    fill_account_ids(Account, apps.get_model('account', 'AccountAccessToken'), 'account', 'account_email')
+    fill_account_ids(Account, apps.get_model('account', 'Follower'), 'followed', 'followed_email')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('account', '0006_account_relations'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_account_relations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def remove_orphans(apps, schema_editor):
+    # rows whose email matches no account can not be linked, nothing reaches them anymore
+    apps.get_model('account', 'AccountAccessToken').objects.filter(account__isnull=True).delete()
+    apps.get_model('account', 'Follower').objects.filter(followed__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0007_backfill_account_relations'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_orphans, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='accountaccesstoken',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_tokens', to='account.account'),
+        ),
+        migrations.AlterField(
+            model_name='accountaccesstoken',
+            name='account_email',
+            field=models.EmailField(max_length=254),
+        ),
+        migrations.RemoveConstraint(
+            model_name='follower',
+            name='unique_follower',
+        ),
+        migrations.RemoveIndex(
+            model_name='follower',
+            name='follower_unread_idx',
+        ),
+        migrations.AlterField(
+            model_name='follower',
+            name='followed',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='followers', to='account.account'),
+        ),
+        migrations.AlterField(
+            model_name='follower',
+            name='followed_email',
+            field=models.EmailField(max_length=254),
+        ),
+        migrations.AddConstraint(
+            model_name='follower',
+            constraint=models.UniqueConstraint(fields=('follower', 'followed'), name='unique_follower'),
+        ),
+        migrations.AddIndex(
+            model_name='follower',
+            index=models.Index(condition=models.Q(('read', False)), fields=['followed', 'id'], name='follower_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+
+legacy_prefix = 'unsalted_sha512$$'
+
+
+def tag_legacy_hashes(apps, schema_editor):
+    Account = apps.get_model('account', 'Account')
+    # bare sha512 hex digests, tagged so account.hashers.UnsaltedSHA512PasswordHasher verifies them until login
+    Account.objects.filter(password__regex=r'^[0-9a-f]{128}$').update(
+        password=Concat(Value(legacy_prefix), 'password'))
+
+
+def untag_legacy_hashes(apps, schema_editor):
+    Account = apps.get_model('account', 'Account')
+    Account.objects.filter(password__startswith=legacy_prefix).update(
+        password=Substr('password', len(legacy_prefix) + 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0009_outgoing_email'),
+    ]
+
+    operations = [
+        migrations.RunPython(tag_legacy_hashes, untag_legacy_hashes),
+    ]
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def disable_fanout(apps, schema_editor):
+    Account = apps.get_model('account', 'Account')
+    # their posts were never fanned out, the following feeds have to keep merging them
+    Account.objects.filter(followers_count__gt=settings.TIMELINE_FANOUT_MAX_FOLLOWERS).update(fanout_disabled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0010_tag_legacy_password_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='fanout_disabled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(disable_fanout, migrations.RunPython.noop),
+    ]
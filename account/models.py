@@ -5,18 +5,30 @@ from django.utils.timezone import now
 # Create your models here.
 class Account(models.Model):
     email = models.EmailField(unique=True)
-    name = models.CharField(max_length=100, db_index=True)
-    # sha512 with salt
-    password = models.CharField(max_length=500, db_index=True)
+    name = models.CharField(max_length=100)
+    # django password hash, see PASSWORD_HASHERS
+    password = models.CharField(max_length=500)
     role = models.CharField(max_length=20)
     bio = models.TextField()
     avatar = models.CharField(max_length=1000)
     wallpaper = models.CharField(max_length=1000)
+    # denormalized counters, maintained by follow, like and delete
+    followers_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+    likes_received_count = models.IntegerField(default=0)
+    # unread notifications, maintained by comment, like, follow and the read endpoints
+    unread_comments_count = models.IntegerField(default=0)
+    unread_likes_count = models.IntegerField(default=0)
+    unread_followers_count = models.IntegerField(default=0)
+    # set when a post was published with more than TIMELINE_FANOUT_MAX_FOLLOWERS followers and not fanned out, the
+    # following feeds merge the profile feed from then on, see post.timeline
+    fanout_disabled = models.BooleanField(default=False)
     create_datetime = models.DateTimeField(default=now, blank=True, editable=False)
 
 
 class AccountAccessToken(models.Model):
-    account_email = models.EmailField(db_index=True)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='access_tokens')
+    account_email = models.EmailField()
     # uuid as user access token
     access_token = models.CharField(db_index=True, max_length=100)
     create_datetime = models.DateTimeField(default=now, blank=True, editable=False)
@@ -24,14 +36,51 @@ class AccountAccessToken(models.Model):
 
 class AccountPasscode(models.Model):
     account_email = models.EmailField(db_index=True)
-    passcode = models.CharField(max_length=10, db_index=True)
+    passcode = models.CharField(max_length=10)
     create_datetime = models.DateTimeField(default=now, blank=True, editable=False)
 
 
 class Follower(models.Model):
-    follower_email = models.EmailField(db_index=True)
+    # indexed as the prefix of unique_follower
+    follower = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='following', db_index=False)
+    follower_email = models.EmailField()
     follower_name = models.CharField(max_length=100)
-    follower_id = models.BigIntegerField()
-    followed_email = models.EmailField(db_index=True)
+    followed = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='followers')
+    followed_email = models.EmailField()
     read = models.BooleanField(default=False)
     create_datetime = models.DateTimeField(default=now, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            # an account can follow another account only once
+            models.UniqueConstraint(fields=['follower', 'followed'], name='unique_follower'),
+        ]
+        indexes = [
+            # unread notifications of a followed account after a watermark, only unread rows are indexed
+            models.Index(fields=['followed', 'id'], condition=models.Q(read=False), name='follower_unread_idx'),
+        ]
+
+
+class OutgoingEmail(models.Model):
+    # queued by requests, delivered by the deliver_emails command so no request waits on the mail server
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    status = models.CharField(max_length=10, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    # pending emails are not delivered before this time, pushed back after every failed attempt
+    next_attempt_datetime = models.DateTimeField(default=now)
+    last_error = models.TextField(blank=True, default='')
+    create_datetime = models.DateTimeField(default=now, blank=True, editable=False)
+    sent_datetime = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the delivery queue, sent and failed emails are not indexed
+            models.Index(fields=['next_attempt_datetime', 'id'], condition=models.Q(status='pending'),
+                         name='outgoingemail_pending_idx'),
+        ]
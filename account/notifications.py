@@ -0,0 +1,111 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from account.models import Account, Follower
+from post.models import Comment, LikedPost
+
+# notification type -> (model, owner account field, actor account field, unread counter of the owner)
+notification_types = {
+    'comments': (Comment, 'poster', 'commentator', 'unread_comments_count'),
+    'likes': (LikedPost, 'poster', 'liked_account', 'unread_likes_count'),
+    'followers': (Follower, 'followed', None, 'unread_followers_count'),
+}
+
+
+def is_notified(read_type, owner_id, actor_id):
+    # own comments and likes are not notifications
+    return notification_types[read_type][2] is None or owner_id != actor_id
+
+
+def notify(read_type, owner_id, actor_id, notification_id, **updates):
+    """
+    Count a new notification for the account ``owner_id`` and push it to its streams once committed.
+
+    ``updates`` are other counters of the owner, written in the same UPDATE.
+    """
+    if is_notified(read_type, owner_id, actor_id):
+        counter = notification_types[read_type][3]
+        updates[counter] = F(counter) + 1
+        event = {'type': read_type, 'id': notification_id}
+        transaction.on_commit(lambda: notification_bus.publish(owner_id, event))
+    if updates:
+        Account.objects.filter(id=owner_id).update(**updates)
+
+
+def remove_unread(read_type, owner_id, count, **updates):
+    # ``updates`` are other counters of the owner, written in the same UPDATE
+    if count:
+        counter = notification_types[read_type][3]
+        updates[counter] = F(counter) - count
+    if updates:
+        Account.objects.filter(id=owner_id).update(**updates)
+
+
+def mark_read(read_type, owner_id, notifications):
+    """
+    Mark the unread notifications of the account ``owner_id`` among ``notifications`` as read.
+
+    Returns how many were marked, which is also taken off the owner's unread counter.
+    """
+    model, owner_field, actor_field, counter = notification_types[read_type]
+    rows = notifications.filter(**{owner_field: owner_id}, read=False)
+    if actor_field is not None:
+        rows = rows.exclude(**{actor_field: owner_id})
+    with transaction.atomic():
+        updated = rows.update(read=True)
+        remove_unread(read_type, owner_id, updated)
+    return updated
+
+
+def format_unread_counts(account):
+    return {
+        'comments': account.unread_comments_count,
+        'likes': account.unread_likes_count,
+        'followers': account.unread_followers_count,
+    }
+
+
+class NotificationBus:
+    """
+    In-process fan-out of notification events to the streams of the notified accounts.
+
+    Writers call ``publish`` from any thread, subscribers are asyncio queues of the ASGI event loop.
+    Events only reach streams served by the same process, clients re-sync with unread_counts on reconnect.
+    """
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, account_id):
+        queue = asyncio.Queue(self.max_queue_size)
+        with self._lock:
+            self._subscribers[account_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, account_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(account_id, set())
+            subscribers.difference_update({item for item in subscribers if item[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(account_id, None)
+
+    def publish(self, account_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(account_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._put, queue, event)
+
+    @staticmethod
+    def _put(queue, event):
+        # a stalled client loses events instead of growing memory, it re-syncs on the next snapshot
+        if not queue.full():
+            queue.put_nowait(event)
+
+
+notification_bus = NotificationBus()
@@ -0,0 +1,32 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+# key derivation runs off the event loop, at most PASSWORD_HASH_WORKERS hashes at a time per process
+_executor = ThreadPoolExecutor(settings.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+
+
+def verify_password(password, encoded):
+    """
+    Check ``password`` against the stored hash ``encoded``.
+
+    Returns ``(valid, upgraded)``, ``upgraded`` is a new hash with the preferred hasher and cost when the stored one
+    is outdated, otherwise None.
+    """
+    upgraded = []
+    valid = check_password(password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return valid, upgraded[0] if upgraded else None
+
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+async def ahash_password(password):
+    return await _run(make_password, password)
+
+
+async def averify_password(password, encoded):
+    return await _run(verify_password, password, encoded)
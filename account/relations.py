@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from account.models import Account, AccountAccessToken, Follower
+from post.models import LikedPost, Comment
+
+# account foreign keys that replaced an email column -> the email column they are resolved from
+account_relations = [
+    (AccountAccessToken, 'account', 'account_email'),
+    (Follower, 'followed', 'followed_email'),
+    (LikedPost, 'liked_account', 'liked_account_email'),
+    (LikedPost, 'poster', 'poster_email'),
+    (Comment, 'poster', 'poster_email'),
+]
+
+
+def fill_account_ids(model, account_field, email_field, batch_size=1000):
+    """
+    Resolve ``email_field`` to the account id of ``account_field`` on every row where it is still missing.
+
+    Rows are walked in id ranges of ``batch_size``, every batch is one UPDATE in its own transaction.
+    Returns the number of linked rows.
+    """
+    account_ids = Subquery(Account.objects.filter(email=OuterRef(email_field)).values('id')[:1])
+    updated = 0
+    last_id = 0
+    while True:
+        ids = list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return updated
+        rows = model.objects.filter(id__gte=ids[0], id__lte=ids[-1], **{f'{account_field}__isnull': True})
+        with transaction.atomic():
+            updated += rows.update(**{account_field: account_ids})
+        last_id = ids[-1]
+
+
+def backfill_account_relations(batch_size=1000):
+    return {
+        f'{model._meta.label}.{account_field}': fill_account_ids(model, account_field, email_field, batch_size)
+        for model, account_field, email_field in account_relations
+    }
@@ -1,18 +1,38 @@
-from django.test import TestCase
+import datetime
+import smtplib
+import warnings
+from io import StringIO
+from unittest import mock
 
-from account.models import Account, AccountAccessToken, AccountPasscode, Follower
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from account.hashers import UnsaltedSHA512PasswordHasher
+from account.mail import deliver_due_emails
+from account.models import Account, AccountAccessToken, AccountPasscode, Follower, OutgoingEmail
+from account.notifications import notification_bus
 from django.urls import reverse
+from post.feed_cache import clear_feed_cache
+from post.models import Post, Comment, LikedPost
+from server.auth import account_cache, invalidate_access_tokens
+from server.testcases import QueryCountTestCase
 
 
 # Create your tests here.
 class AccountTestCase(TestCase):
     def setUp(self):
-        Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i',
-                               password='7fcf4ba391c48784edde599889d6e3f1e47a27db36ecc050cc92f259bfac38afad2c68a1ae804d77075e8fb722503f3eca2b2c1006ee6f6c7b7628cb45fffd1d')
-        AccountAccessToken.objects.create(account_email='xi4f3i@gmail.com', access_token='123456')
+        account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i',
+                                         password='unsalted_sha512$$7fcf4ba391c48784edde599889d6e3f1e47a27db36ecc050cc92f259bfac38afad2c68a1ae804d77075e8fb722503f3eca2b2c1006ee6f6c7b7628cb45fffd1d')
+        followed = Account.objects.create(email='bbbb@gmail.com', name='bbbb', password='')
+        AccountAccessToken.objects.create(account=account, account_email='xi4f3i@gmail.com', access_token='123456')
         AccountPasscode.objects.create(account_email='xi4f3i@gmail.com', passcode='123456')
-        Follower.objects.create(follower_email='xi4f3i@gmail.com', follower_name='xi4f3i', follower_id=1,
-                                followed_email='<EMAIL>')
+        Follower.objects.create(follower=account, follower_email='xi4f3i@gmail.com', follower_name='xi4f3i',
+                                followed=followed, followed_email='bbbb@gmail.com')
 
     def test_account_creation(self):
         obj = Account.objects.get(email='xi4f3i@gmail.com')
@@ -33,14 +53,17 @@ class AccountTestCase(TestCase):
 
 class AccountViewTestCase(TestCase):
     def setUp(self):
-        Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i',
-                               password='7fcf4ba391c48784edde599889d6e3f1e47a27db36ecc050cc92f259bfac38afad2c68a1ae804d77075e8fb722503f3eca2b2c1006ee6f6c7b7628cb45fffd1d')
-        Account.objects.create(email='aaaa@gmail.com', name='aaaa',
-                               password='7fcf4ba391c48784edde599889d6e3f1e47a27db36ecc050cc92f259bfac38afad2c68a1ae804d77075e8fb722503f3eca2b2c1006ee6f6c7b7628cb45fffd1d')
-        AccountAccessToken.objects.create(account_email='xi4f3i@gmail.com', access_token='123456')
+        account_cache.clear()
+        self.account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i',
+                                              password='unsalted_sha512$$7fcf4ba391c48784edde599889d6e3f1e47a27db36ecc050cc92f259bfac38afad2c68a1ae804d77075e8fb722503f3eca2b2c1006ee6f6c7b7628cb45fffd1d')
+        self.other = Account.objects.create(email='aaaa@gmail.com', name='aaaa',
+                                            password='unsalted_sha512$$7fcf4ba391c48784edde599889d6e3f1e47a27db36ecc050cc92f259bfac38afad2c68a1ae804d77075e8fb722503f3eca2b2c1006ee6f6c7b7628cb45fffd1d')
+        self.third = Account.objects.create(email='bbbb@gmail.com', name='bbbb', password='')
+        AccountAccessToken.objects.create(account=self.account, account_email='xi4f3i@gmail.com',
+                                          access_token='123456')
         AccountPasscode.objects.create(account_email='xi4f3i@gmail.com', passcode='123456')
-        Follower.objects.create(follower_email='xi4f3i@gmail.com', follower_name='xi4f3i', follower_id=1,
-                                followed_email='<EMAIL>')
+        Follower.objects.create(follower=self.account, follower_email='xi4f3i@gmail.com', follower_name='xi4f3i',
+                                followed=self.third, followed_email='bbbb@gmail.com')
 
     def test_query(self):
         response = self.client.post('/api/account/query', {'id': 1},
@@ -74,6 +97,21 @@ class AccountViewTestCase(TestCase):
         self.assertEqual(response_data["code"], 1)
         self.assertEqual(response_data["data"], True)
 
+    def test_read_notifications(self):
+        Follower.objects.create(follower=self.other, follower_email='aaaa@gmail.com', follower_name='aaaa',
+                                followed=self.account, followed_email='xi4f3i@gmail.com')
+        Follower.objects.create(follower=self.third, follower_email='bbbb@gmail.com', follower_name='bbbb',
+                                followed=self.account, followed_email='xi4f3i@gmail.com')
+        response = self.client.post('/api/account/read_notifications',
+                                    {'access_token': '123456', 'followers': [1, 2], 'up_to': {'followers': 3}},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 1)
+        # follower 1 belongs to another account
+        self.assertEqual(response_data["data"], {'comments': 0, 'likes': 0, 'followers': 2})
+        self.assertFalse(Follower.objects.get(id=1).read)
+
     def test_query_follow_status(self):
         response = self.client.post('/api/account/query_follow_status',
                                     {'access_token': '123456', 'email': 'aaaa@gmail.com'},
@@ -81,4 +119,432 @@ class AccountViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         response_data = response.json()
         self.assertEqual(response_data["code"], 1)
-        self.assertEqual(response_data["data"], False)
\ No newline at end of file
+        self.assertEqual(response_data["data"], False)
+
+    def test_follow_counters(self):
+        response = self.client.post('/api/account/follow', {'access_token': '123456', 'email': 'aaaa@gmail.com'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["data"], True)
+        self.assertEqual(Account.objects.get(email='aaaa@gmail.com').followers_count, 1)
+        self.assertEqual(Account.objects.get(email='xi4f3i@gmail.com').following_count, 1)
+
+        response = self.client.post('/api/account/query', {'access_token': '123456'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["data"]["following"], 1)
+
+        response = self.client.post('/api/account/follow', {'access_token': '123456', 'email': 'aaaa@gmail.com'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["data"], False)
+        self.assertEqual(Account.objects.get(email='aaaa@gmail.com').followers_count, 0)
+        self.assertEqual(Account.objects.get(email='xi4f3i@gmail.com').following_count, 0)
+
+    def test_reconcile_account_counters(self):
+        Follower.objects.create(follower=self.other, follower_email='aaaa@gmail.com', follower_name='aaaa',
+                                followed=self.account, followed_email='xi4f3i@gmail.com')
+        call_command('reconcile_account_counters', stdout=StringIO())
+        account = Account.objects.get(email='xi4f3i@gmail.com')
+        self.assertEqual(account.followers_count, 1)
+        self.assertEqual(account.following_count, 1)
+        self.assertEqual(account.likes_received_count, 0)
+
+    def test_logout_invalidates_token(self):
+        self.client.post('/api/account/query', {'access_token': '123456'}, content_type="application/json")
+        self.client.post('/api/account/logout', {'access_token': '123456'}, content_type="application/json")
+        response = self.client.post('/api/account/query', {'access_token': '123456'},
+                                    content_type="application/json")
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 0)
+        self.assertEqual(response_data["message"], 'Invalid access token!')
+
+    def test_logout_revokes_token_in_other_workers(self):
+        self.client.post('/api/account/query', {'access_token': '123456'}, content_type="application/json")
+        cached = account_cache.get('123456')
+        self.client.post('/api/account/logout', {'access_token': '123456'}, content_type="application/json")
+        # another worker still holds its copy, it reads the revocation from the shared cache
+        account_cache.set('123456', cached)
+        for path, data in (('/api/account/query', {}), ('/api/post/like', {'id': 1})):
+            response = self.client.post(path, {'access_token': '123456', **data}, content_type="application/json")
+            self.assertEqual(response.json()["message"], 'Invalid access token!')
+
+    def test_revocation_survives_feed_cache_clear(self):
+        self.client.post('/api/account/query', {'access_token': '123456'}, content_type="application/json")
+        cached = account_cache.get('123456')
+        self.client.post('/api/account/logout', {'access_token': '123456'}, content_type="application/json")
+        clear_feed_cache()
+        account_cache.set('123456', cached)
+        response = self.client.post('/api/account/query', {'access_token': '123456'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["message"], 'Invalid access token!')
+
+    def test_new_token_after_revocation(self):
+        # a lookup after the revocation is cached again
+        invalidate_access_tokens(['123456'])
+        self.client.post('/api/account/query_follow_status', {'access_token': '123456', 'email': 'aaaa@gmail.com'},
+                         content_type="application/json")
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/account/query_follow_status',
+                                        {'access_token': '123456', 'email': 'aaaa@gmail.com'},
+                                        content_type="application/json")
+        self.assertEqual(response.json()["code"], 1)
+
+    def test_access_token_cached(self):
+        self.client.post('/api/account/query_follow_status', {'access_token': '123456', 'email': 'aaaa@gmail.com'},
+                         content_type="application/json")
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/account/query_follow_status',
+                                        {'access_token': '123456', 'email': 'aaaa@gmail.com'},
+                                        content_type="application/json")
+        self.assertEqual(response.json()["code"], 1)
+
+
+class AccountQueryCountTestCase(QueryCountTestCase):
+    def setUp(self):
+        account_cache.clear()
+        self.account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i', password='')
+        AccountAccessToken.objects.create(account=self.account, account_email='xi4f3i@gmail.com',
+                                          access_token='123456')
+        self.post = Post.objects.create(title='Post Title', content='Post Content', poster_email='xi4f3i@gmail.com',
+                                        poster=self.account, poster_name='xi4f3i', channel='Western_Cuisine')
+
+    def add_rows(self, count):
+        for i in range(count):
+            email = f'user{count}_{i}@gmail.com'
+            user = Account.objects.create(email=email, name='user', password='')
+            Comment.objects.create(post=self.post, poster=self.account, poster_email='xi4f3i@gmail.com',
+                                   commentator=user, commentator_email=email, commentator_name='user',
+                                   comment=f'comment {i}')
+            LikedPost.objects.create(liked_account=user, liked_account_email=email, liked_account_name='user',
+                                     post=self.post, poster=self.account, poster_email='xi4f3i@gmail.com')
+            Follower.objects.create(follower=user, follower_email=email, follower_name='user',
+                                    followed=self.account, followed_email='xi4f3i@gmail.com')
+
+    def test_query(self):
+        self.assertConstantQueries(1, '/api/account/query', {'id': self.account.id})
+
+    def test_query_notification(self):
+        self.assertConstantQueries(3, '/api/account/query_notification', {'access_token': '123456'})
+
+    def test_query_follow_status(self):
+        self.assertConstantQueries(1, '/api/account/query_follow_status',
+                                   {'access_token': '123456', 'email': 'aaaa@gmail.com'})
+
+
+class NotificationTestCase(TestCase):
+    def setUp(self):
+        account_cache.clear()
+        self.account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i', password='')
+        other = Account.objects.create(email='aaaa@gmail.com', name='aaaa', password='')
+        AccountAccessToken.objects.create(account=self.account, account_email='xi4f3i@gmail.com',
+                                          access_token='123456')
+        AccountAccessToken.objects.create(account=other, account_email='aaaa@gmail.com', access_token='654321')
+        self.post = Post.objects.create(title='Post Title', content='Post Content', poster_email='xi4f3i@gmail.com',
+                                        poster=self.account, poster_name='xi4f3i', channel='Western_Cuisine')
+
+    def post_json(self, path, data):
+        return self.client.post(path, data, content_type="application/json").json()
+
+    def unread_counts(self):
+        return self.post_json('/api/account/unread_counts', {'access_token': '123456'})["data"]
+
+    def test_unread_counts(self):
+        self.post_json('/api/post/comment', {'access_token': '654321', 'id': self.post.id, 'comment': 'yummy'})
+        self.post_json('/api/post/comment', {'access_token': '123456', 'id': self.post.id, 'comment': 'thanks'})
+        self.post_json('/api/post/like', {'access_token': '654321', 'id': self.post.id})
+        self.post_json('/api/account/follow', {'access_token': '654321', 'email': 'xi4f3i@gmail.com'})
+        # own comments are not notified
+        self.assertEqual(self.unread_counts(), {'comments': 1, 'likes': 1, 'followers': 1})
+
+        self.post_json('/api/post/like', {'access_token': '654321', 'id': self.post.id})
+        self.post_json('/api/account/read_notifications', {'access_token': '123456', 'up_to': {'comments': 10}})
+        self.assertEqual(self.unread_counts(), {'comments': 0, 'likes': 0, 'followers': 1})
+
+        follower = Follower.objects.get(followed_email='xi4f3i@gmail.com')
+        self.post_json('/api/account/read_notification', {'access_token': '123456', 'type': 'followers',
+                                                          'id': follower.id})
+        self.assertEqual(self.unread_counts(), {'comments': 0, 'likes': 0, 'followers': 0})
+
+    def test_query_notification_since_id(self):
+        for i in range(5):
+            user = Account.objects.create(email=f'user{i}@gmail.com', name=f'user{i}', password='')
+            Follower.objects.create(follower=user, follower_email=f'user{i}@gmail.com', follower_name=f'user{i}',
+                                    followed=self.account, followed_email='xi4f3i@gmail.com')
+        first_id = Follower.objects.order_by('id').first().id
+
+        data = self.post_json('/api/account/query_notification',
+                              {'access_token': '123456', 'since_ids': {'followers': first_id}, 'limit': 2})["data"]
+        self.assertEqual([follower["id"] for follower in data["followers"]], [first_id + 2, first_id + 1])
+        self.assertEqual(len(data["comments"]), 0)
+
+        data = self.post_json('/api/account/query_notification',
+                              {'access_token': '123456', 'since_ids': {'followers': first_id + 2}})["data"]
+        self.assertEqual([follower["id"] for follower in data["followers"]], [first_id + 4, first_id + 3])
+
+    async def test_notification_stream(self):
+        response = await self.async_client.get('/api/account/notification_stream', {'access_token': '123456'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        snapshot = await anext(events)
+        self.assertEqual(snapshot, b'event: unread_counts\ndata: {"comments": 0, "likes": 0, "followers": 0}\n\n')
+
+        notification_bus.publish(self.account.id, {'type': 'comments', 'id': 1})
+        event = await anext(events)
+        self.assertEqual(event, b'event: notification\ndata: {"type": "comments", "id": 1}\n\n')
+        await events.aclose()
+
+    def test_notification_stream_under_wsgi(self):
+        # a WSGI server reads the whole response, so it ends instead of streaming heartbeats forever
+        with mock.patch('account.views.stream_heartbeat_seconds', 0.01), warnings.catch_warnings():
+            warnings.filterwarnings('ignore', 'StreamingHttpResponse must consume asynchronous iterators')
+            response = self.client.get('/api/account/notification_stream', {'access_token': '123456'})
+            content = b''.join(response)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(content, b'event: unread_counts\ndata: {"comments": 0, "likes": 0, "followers": 0}\n\n')
+        self.assertFalse(notification_bus._subscribers)
+
+
+class AccountDeletionTestCase(TestCase):
+    def setUp(self):
+        account_cache.clear()
+        clear_feed_cache()
+        self.account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i',
+                                              password=UnsaltedSHA512PasswordHasher().encode('admin123', ''))
+        self.other = Account.objects.create(email='aaaa@gmail.com', name='aaaa', password='')
+        AccountAccessToken.objects.create(account=self.account, account_email='xi4f3i@gmail.com',
+                                          access_token='123456')
+        own_post = Post.objects.create(title='Own Post', content='Own Content', poster=self.account,
+                                       poster_email='xi4f3i@gmail.com', poster_name='xi4f3i', channel='Soups')
+        other_post = Post.objects.create(title='Other Post', content='Other Content', poster=self.other,
+                                         poster_email='aaaa@gmail.com', poster_name='aaaa', channel='Desserts')
+        for liked_account, post in ((self.account, own_post), (self.other, own_post), (self.account, other_post)):
+            LikedPost.objects.create(liked_account=liked_account, liked_account_email=liked_account.email,
+                                     liked_account_name=liked_account.name, post=post, poster=post.poster,
+                                     poster_email=post.poster_email)
+        for commentator, post in ((self.other, own_post), (self.account, other_post), (self.account, other_post)):
+            Comment.objects.create(post=post, poster=post.poster, poster_email=post.poster_email,
+                                   commentator=commentator, commentator_email=commentator.email,
+                                   commentator_name=commentator.name, comment='comment')
+        Follower.objects.create(follower=self.account, follower_email='xi4f3i@gmail.com', follower_name='xi4f3i',
+                                followed=self.other, followed_email='aaaa@gmail.com')
+        Follower.objects.create(follower=self.other, follower_email='aaaa@gmail.com', follower_name='aaaa',
+                                followed=self.account, followed_email='xi4f3i@gmail.com')
+        call_command('reconcile_account_counters', stdout=StringIO())
+        Post.objects.filter(id=other_post.id).update(likes=1)
+
+    def assertCountersReconciled(self):
+        counters = list(Account.objects.order_by('id').values())
+        call_command('reconcile_account_counters', stdout=StringIO())
+        self.assertEqual(counters, list(Account.objects.order_by('id').values()))
+
+    def test_delete(self):
+        response = self.client.post('/api/account/delete', {'access_token': '123456', 'password': 'admin123'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["code"], 1)
+
+        self.assertEqual(list(Account.objects.values_list('email', flat=True)), ['aaaa@gmail.com'])
+        self.assertEqual(list(Post.objects.values_list('title', 'likes')), [('Other Post', 0)])
+        self.assertFalse(LikedPost.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follower.objects.exists())
+        self.assertFalse(AccountAccessToken.objects.exists())
+        other = Account.objects.get(id=self.other.id)
+        self.assertEqual((other.followers_count, other.following_count, other.likes_received_count), (0, 0, 0))
+        self.assertCountersReconciled()
+
+        response = self.client.post('/api/account/query', {'access_token': '123456'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["message"], 'Invalid access token!')
+
+    def test_delete_wrong_password(self):
+        response = self.client.post('/api/account/delete', {'access_token': '123456', 'password': 'wrong'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["message"], 'Invalid password!')
+        self.assertTrue(Account.objects.filter(id=self.account.id).exists())
+
+    def test_delete_account_command(self):
+        call_command('delete_account', 'xi4f3i@gmail.com', '--batch-size', '1', stdout=StringIO())
+        self.assertFalse(Account.objects.filter(id=self.account.id).exists())
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(LikedPost.objects.exists())
+        self.assertCountersReconciled()
+
+    def test_delete_account_command_keeps_revocations(self):
+        self.client.post('/api/account/query', {'access_token': '123456'}, content_type="application/json")
+        cached = account_cache.get('123456')
+        # a cached feed with the like of the account
+        response = self.client.post('/api/post/query', {'type': 'Desserts'}, content_type="application/json")
+        self.assertEqual(response.json()["data"][0]["likes"], 1)
+
+        call_command('delete_account', 'xi4f3i@gmail.com', stdout=StringIO())
+        response = self.client.post('/api/post/query', {'type': 'Desserts'}, content_type="application/json")
+        self.assertEqual(response.json()["data"][0]["likes"], 0)
+        # another worker still holds its copy of the token
+        account_cache.set('123456', cached)
+        response = self.client.post('/api/account/query', {'access_token': '123456'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["message"], 'Invalid access token!')
+
+
+class BackfillAccountRelationsTestCase(TransactionTestCase):
+    # the command runs between the migrations that add the nullable id columns and the ones that enforce them
+    before_backfill = [('account', '0006_account_relations'), ('post', '0006_account_relations')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_backfill(self):
+        apps = self.migrate(self.before_backfill)
+        account = apps.get_model('account', 'Account').objects.create(email='xi4f3i@gmail.com', name='xi4f3i',
+                                                                      password='')
+        other = apps.get_model('account', 'Account').objects.create(email='aaaa@gmail.com', name='aaaa', password='')
+        post = apps.get_model('post', 'Post').objects.create(title='Post Title', content='Post Content', poster=account,
+                                                             poster_email='xi4f3i@gmail.com', poster_name='xi4f3i',
+                                                             channel='Soups')
+        apps.get_model('post', 'LikedPost').objects.create(liked_account_email='aaaa@gmail.com',
+                                                           liked_account_name='aaaa', post=post,
+                                                           poster_email='xi4f3i@gmail.com')
+        apps.get_model('post', 'Comment').objects.create(post=post, poster_email='xi4f3i@gmail.com', commentator=other,
+                                                         commentator_email='aaaa@gmail.com', commentator_name='aaaa',
+                                                         comment='comment')
+        apps.get_model('account', 'Follower').objects.create(follower=other, follower_email='aaaa@gmail.com',
+                                                             follower_name='aaaa', followed_email='xi4f3i@gmail.com')
+        apps.get_model('account', 'AccountAccessToken').objects.create(account_email='xi4f3i@gmail.com',
+                                                                       access_token='123456')
+
+        stdout = StringIO()
+        call_command('backfill_account_relations', '--batch-size', '1', stdout=stdout)
+        self.assertIn('post.LikedPost.poster: 1 rows linked', stdout.getvalue())
+        like = apps.get_model('post', 'LikedPost').objects.get()
+        self.assertEqual((like.liked_account_id, like.poster_id), (other.id, account.id))
+        self.assertEqual(apps.get_model('post', 'Comment').objects.get().poster_id, account.id)
+        self.assertEqual(apps.get_model('account', 'Follower').objects.get().followed_id, account.id)
+        self.assertEqual(apps.get_model('account', 'AccountAccessToken').objects.get().account_id, account.id)
+
+
+class UnreachableEmailBackend(BaseEmailBackend):
+    def open(self):
+        raise smtplib.SMTPConnectError(421, 'Service not available')
+
+    def send_messages(self, email_messages):
+        return 0
+
+
+class RejectingEmailBackend(BaseEmailBackend):
+    # rejects the mail of one recipient, delivers the others to the locmem outbox
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            if message.to == ['rejected@gmail.com']:
+                raise smtplib.SMTPRecipientsRefused({'rejected@gmail.com': (550, 'No such user')})
+        return mail.get_connection('django.core.mail.backends.locmem.EmailBackend').send_messages(email_messages)
+
+
+class EmailDeliveryTestCase(TestCase):
+
+    def send_passcode(self, email):
+        return self.client.post('/api/account/send_passcode', {'email': email},
+                                content_type="application/json").json()
+
+    def test_send_passcode_queues_email(self):
+        response = self.send_passcode('xi4f3i@gmail.com')
+        self.assertEqual(response['code'], 1)
+        # nothing is sent inside the request
+        self.assertEqual(mail.outbox, [])
+        queued = OutgoingEmail.objects.get()
+        self.assertEqual(queued.recipient, 'xi4f3i@gmail.com')
+        self.assertEqual(queued.status, OutgoingEmail.PENDING)
+
+        out = StringIO()
+        call_command('deliver_emails', stdout=out)
+        self.assertIn('Sent 1 emails, 0 failed.', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['xi4f3i@gmail.com'])
+        self.assertIn(response['data'], mail.outbox[0].body)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (OutgoingEmail.SENT, 1))
+
+        # sent emails are not sent again
+        self.assertEqual(deliver_due_emails(), (0, 0))
+
+    @override_settings(EMAIL_BATCH_SIZE=2)
+    def test_batches_and_rejected_recipients(self):
+        for email in ('a@gmail.com', 'rejected@gmail.com', 'b@gmail.com'):
+            self.send_passcode(email)
+
+        with self.settings(EMAIL_BACKEND='account.tests.RejectingEmailBackend'), \
+                self.assertLogs('account.mail', 'WARNING'):
+            self.assertEqual(deliver_due_emails(), (2, 1))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['a@gmail.com', 'b@gmail.com'])
+
+        rejected = OutgoingEmail.objects.get(recipient='rejected@gmail.com')
+        self.assertEqual((rejected.status, rejected.attempts), (OutgoingEmail.PENDING, 1))
+        self.assertIn('No such user', rejected.last_error)
+        self.assertGreater(rejected.next_attempt_datetime, timezone.now())
+
+    @override_settings(EMAIL_BACKEND='account.tests.UnreachableEmailBackend', EMAIL_MAX_ATTEMPTS=3)
+    def test_retries_until_max_attempts(self):
+        self.send_passcode('xi4f3i@gmail.com')
+        queued = OutgoingEmail.objects.get()
+
+        with self.assertLogs('account.mail', 'WARNING'):
+            for attempts in range(1, 4):
+                self.assertEqual(deliver_due_emails(), (0, 1))
+                # not due before its backoff
+                self.assertEqual(deliver_due_emails(), (0, 0))
+                queued.refresh_from_db()
+                self.assertEqual(queued.attempts, attempts)
+                OutgoingEmail.objects.update(next_attempt_datetime=timezone.now() - datetime.timedelta(seconds=1))
+
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutgoingEmail.FAILED)
+        self.assertEqual(deliver_due_emails(), (0, 0))
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+class PasswordHashingTestCase(TestCase):
+
+    def setUp(self):
+        account_cache.clear()
+        self.account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i',
+                                              password=UnsaltedSHA512PasswordHasher().encode('admin123', ''))
+
+    def login(self, password):
+        return self.client.post('/api/account/login', {'email': 'xi4f3i@gmail.com', 'password': password},
+                                content_type="application/json").json()
+
+    def test_legacy_hash_upgraded_on_login(self):
+        self.assertEqual(self.login('wrong')['message'], 'Account does not exist!')
+        self.account.refresh_from_db()
+        self.assertTrue(self.account.password.startswith('unsalted_sha512$$'))
+
+        self.assertEqual(self.login('admin123')['code'], 1)
+        self.account.refresh_from_db()
+        self.assertTrue(self.account.password.startswith('pbkdf2_sha256$1000$'))
+
+        self.assertEqual(self.login('admin123')['code'], 1)
+        self.assertEqual(self.login('wrong')['message'], 'Account does not exist!')
+
+    def test_cost_change_rehashes_on_login(self):
+        self.login('admin123')
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.assertEqual(self.login('admin123')['code'], 1)
+        self.account.refresh_from_db()
+        self.assertTrue(self.account.password.startswith('pbkdf2_sha256$2000$'))
+
+    def test_unknown_email(self):
+        response = self.client.post('/api/account/login', {'email': 'nobody@gmail.com', 'password': 'admin123'},
+                                    content_type="application/json").json()
+        self.assertEqual(response['message'], 'Account does not exist!')
+
+    def test_signup_hashes_password(self):
+        AccountPasscode.objects.create(account_email='aaaa@gmail.com', passcode='123456')
+        response = self.client.post('/api/account/signup', {'name': 'aaaa', 'email': 'aaaa@gmail.com',
+                                                            'password': 'secret', 'passcode': '123456'},
+                                    content_type="application/json").json()
+        self.assertEqual(response['code'], 1)
+        password = Account.objects.get(email='aaaa@gmail.com').password
+        self.assertTrue(password.startswith('pbkdf2_sha256$1000$'))
+        self.assertNotIn('secret', password)
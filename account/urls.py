@@ -6,11 +6,15 @@ urlpatterns = [
     path('query', views.query, name='query'),
     path('login', views.login, name='login'),
     path('logout', views.logout, name='logout'),
+    path('delete', views.delete, name='delete'),
     path('signup', views.signup, name='signup'),
     path('send_passcode', views.send_passcode, name='send_passcode'),
     path('query_follow_status', views.query_follow_status, name='query_follow_status'),
     path('follow', views.follow, name='follow'),
     path('query_notification', views.query_notification, name='query_notification'),
     path('read_notification', views.read_notification, name='read_notification'),
+    path('read_notifications', views.read_notifications, name='read_notifications'),
+    path('unread_counts', views.unread_counts, name='unread_counts'),
+    path('notification_stream', views.notification_stream, name='notification_stream'),
 
 ]
\ No newline at end of file
@@ -1,21 +1,34 @@
-import hashlib
+import asyncio
 import json
 import random
 import uuid
 
-from django.core.mail import send_mail
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F, Q
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 
+from account.deletion import account_feed_scopes, delete_account
+from account.mail import aqueue_email, passcode_email
 from account.models import AccountAccessToken, Account, AccountPasscode, Follower
+from account.passwords import ahash_password, averify_password
+from account.notifications import notification_types, notification_bus, notify, remove_unread, mark_read, \
+    format_unread_counts
+from post.feed_cache import ainvalidate_feeds
 from post.models import LikedPost, Comment
+from post.timeline import backfill_timeline, drop_from_timeline
+from server.auth import aresolve_account, invalidate_access_tokens
+from server.pagination import PaginationError, parse_limit
 from server.request_helper import validate_request_data
 from server.response_helper import generate_failed_response, generate_successful_response, \
     generate_missing_fields_response, \
-    generate_account_response, format_comments, format_likes, format_followers
+    generate_account_response, format_comments, format_likes, format_followers, with_post_title
 
 
 # Create your views here.
-def query(request):
+async def query(request):
     try:
         req = json.loads(request.body)
         access_token = req.get('access_token', None)
@@ -26,20 +39,14 @@ def query(request):
 
         if access_token is None:
             # query other's profile
-            account = Account.objects.get(id=account_id)
-            followers = Follower.objects.filter(followed_email=account.email).count()
-            likes = LikedPost.objects.filter(poster_email=account.email).count()
+            account = await Account.objects.aget(id=account_id)
 
-            return generate_account_response(account, followers, 0, likes)
+            return generate_account_response(account)
 
-        # query account
-        account_access_token = AccountAccessToken.objects.get(access_token=access_token)
-        account = Account.objects.get(email=account_access_token.account_email)
-
-        followers = Follower.objects.filter(followed_email=account.email).count()
-        likes = LikedPost.objects.filter(poster_email=account.email).count()
+        # query account, reloaded since the cached account may hold outdated counters
+        account = await Account.objects.aget(id=(await aresolve_account(request, access_token)).id)
 
-        return generate_account_response(account, followers, 0, likes)
+        return generate_account_response(account)
     except AccountAccessToken.DoesNotExist:
         return generate_failed_response('Invalid access token!')
     except Account.DoesNotExist:
@@ -50,7 +57,7 @@ def query(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def logout(request):
+async def logout(request):
     try:
         req = json.loads(request.body)
         access_token = req.get('access_token', None)
@@ -59,12 +66,43 @@ def logout(request):
             return generate_failed_response('Access token is missing!')
 
         # delete access token
-        account_access_token = AccountAccessToken.objects.get(access_token=access_token)
-        account_access_token.delete()
+        account_access_token = await AccountAccessToken.objects.aget(access_token=access_token)
+        await account_access_token.adelete()
+        invalidate_access_tokens([access_token])
+
+        return generate_successful_response(None)
+    except AccountAccessToken.DoesNotExist:
+        return generate_failed_response('Invalid access token!')
+    except json.JSONDecodeError:
+        return generate_failed_response('Invalid JSON!')
+    except Exception as e:
+        return generate_failed_response('An unexpected error occurred.', data=str(e))
+
+
+async def delete(request):
+    try:
+        req = json.loads(request.body)
+        missing_fields = validate_request_data(req, ['access_token', 'password'])
+        if missing_fields:
+            return generate_missing_fields_response(missing_fields)
+
+        # validate account access token, the account is reloaded for its current password hash
+        access_token = req.get('access_token')
+        account = await Account.objects.aget(id=(await aresolve_account(request, access_token)).id)
+
+        # deleting an account asks for its password again
+        valid, _ = await averify_password(req.get('password'), account.password)
+        if not valid:
+            return generate_failed_response('Invalid password!')
 
+        scopes = await sync_to_async(account_feed_scopes)(account.id)
+        await sync_to_async(delete_account)(account)
+        await ainvalidate_feeds(scopes)
         return generate_successful_response(None)
     except AccountAccessToken.DoesNotExist:
         return generate_failed_response('Invalid access token!')
+    except Account.DoesNotExist:
+        return generate_failed_response('Account does not exist!')
     except json.JSONDecodeError:
         return generate_failed_response('Invalid JSON!')
     except Exception as e:
@@ -74,7 +112,7 @@ def logout(request):
 max_diff_seconds = 10 * 60  # 10 min
 
 
-def signup(request):
+async def signup(request):
     try:
         req = json.loads(request.body)
 
@@ -87,28 +125,27 @@ def signup(request):
         passcode = req.get('passcode', None)
 
         # validate passcode
-        account_passcode = AccountPasscode.objects.get(account_email=email, passcode=passcode)
+        account_passcode = await AccountPasscode.objects.aget(account_email=email, passcode=passcode)
         diff = timezone.now() - account_passcode.create_datetime
         if diff.total_seconds() > max_diff_seconds:
-            account_passcode.delete()
+            await account_passcode.adelete()
             return generate_failed_response('Expired passcode!')
 
         name = req.get('name', None)
         password = req.get('password', None)
-        password_hash = hashlib.sha512(password.encode('utf-8')).hexdigest()
+        password_hash = await ahash_password(password)
 
         # generate a new account
         account = Account(name=name, email=email, password=password_hash)
+        await account.asave()
 
         # generate a new token
         access_token = uuid.uuid4().hex
-        account_access_token = AccountAccessToken(account_email=email, access_token=access_token)
-
-        account.save()
-        account_access_token.save()
-        account_passcode.delete()
+        account_access_token = AccountAccessToken(account=account, account_email=email, access_token=access_token)
+        await account_access_token.asave()
+        await account_passcode.adelete()
 
-        return generate_account_response(account, 0, 0, 0, access_token)
+        return generate_account_response(account, access_token)
     except AccountPasscode.DoesNotExist:
         return generate_failed_response('Invalid passcode!')
     except json.JSONDecodeError:
@@ -117,7 +154,7 @@ def signup(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def login(request):
+async def login(request):
     try:
         req = json.loads(request.body)
         missing_fields = validate_request_data(req, ['email', 'password'])
@@ -126,26 +163,34 @@ def login(request):
 
         email = req.get('email', None)
         password = req.get('password', None)
-        password_hash = hashlib.sha512(password.encode('utf-8')).hexdigest()
 
-        account = Account.objects.get(email=email, password=password_hash)
-
-        # delete existing tokens
         try:
-            AccountAccessToken.objects.get(account_email=account.email).delete()
-        except Exception as e:
-            # do nothing
-            print(e)
+            account = await Account.objects.aget(email=email)
+        except Account.DoesNotExist:
+            # hash anyway, so unknown emails take as long as wrong passwords
+            await ahash_password(password)
+            raise
+        valid, upgraded = await averify_password(password, account.password)
+        if not valid:
+            return generate_failed_response('Account does not exist!')
+        if upgraded is not None:
+            # outdated hasher or cost, the password is only known here
+            account.password = upgraded
+            await Account.objects.filter(id=account.id).aupdate(password=upgraded)
+
+        # delete existing tokens, revoked once deleted so no worker caches them again
+        existing_tokens = AccountAccessToken.objects.filter(account=account)
+        revoked_tokens = [token async for token in existing_tokens.values_list('access_token', flat=True)]
+        await existing_tokens.filter(access_token__in=revoked_tokens).adelete()
+        invalidate_access_tokens(revoked_tokens)
 
         # generate a new token
         access_token = uuid.uuid4().hex
-        account_access_token = AccountAccessToken(account_email=account.email, access_token=access_token)
-        account_access_token.save()
+        account_access_token = AccountAccessToken(account=account, account_email=account.email,
+                                                  access_token=access_token)
+        await account_access_token.asave()
 
-        followers = Follower.objects.filter(followed_email=account.email).count()
-        likes = LikedPost.objects.filter(poster_email=account.email).count()
-
-        return generate_account_response(account, followers, 0, likes, access_token)
+        return generate_account_response(account, access_token)
     except Account.DoesNotExist:
         return generate_failed_response('Account does not exist!')
     except json.JSONDecodeError:
@@ -154,7 +199,7 @@ def login(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def send_passcode(request):
+async def send_passcode(request):
     try:
         req = json.loads(request.body)
         email = req.get('email', None)
@@ -169,14 +214,17 @@ def send_passcode(request):
 
         # delete expired passcode
         try:
-            AccountPasscode.objects.get(account_email=email).delete()
+            await (await AccountPasscode.objects.aget(account_email=email)).adelete()
         except Exception as e:
             # do nothing
             print(e)
 
         # save the new passcode
         account_passcode = AccountPasscode(account_email=email, passcode=passcode)
-        account_passcode.save()
+        await account_passcode.asave()
+
+        # delivered by the deliver_emails worker, the response does not wait on the mail server
+        await aqueue_email(email, *passcode_email(passcode))
         return generate_successful_response(passcode)
     except json.JSONDecodeError:
         return generate_failed_response('Invalid JSON!')
@@ -184,7 +232,7 @@ def send_passcode(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def query_follow_status(request):
+async def query_follow_status(request):
     try:
         req = json.loads(request.body)
         access_token = req.get('access_token', None)
@@ -194,11 +242,10 @@ def query_follow_status(request):
             return generate_failed_response('Access token or email address is missing!')
 
         # query account
-        account_access_token = AccountAccessToken.objects.get(access_token=access_token)
+        account = await aresolve_account(request, access_token)
 
         # query follow status
-        follow_status = Follower.objects.filter(follower_email=account_access_token.account_email,
-                                                followed_email=poster_email).count() > 0
+        follow_status = await Follower.objects.filter(follower=account, followed__email=poster_email).acount() > 0
 
         return generate_successful_response(follow_status)
     except AccountAccessToken.DoesNotExist:
@@ -211,7 +258,40 @@ def query_follow_status(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def follow(request):
+def toggle_follow(account, target_account):
+    """
+    Drop the follow record of ``account`` on ``target_account``, otherwise record a new one. Returns the status.
+    """
+    with transaction.atomic():
+        # drop an existing follow record, otherwise record a new one
+        followers = Follower.objects.filter(follower=account, followed=target_account)
+        deleted_unread, _ = followers.filter(read=False).delete()
+        deleted = deleted_unread + followers.delete()[0]
+        if deleted:
+            delta = -deleted
+            follow_status = False
+            remove_unread('followers', target_account.id, deleted_unread)
+        else:
+            follower = Follower(follower=account, follower_email=account.email, follower_name=account.name,
+                                followed=target_account, followed_email=target_account.email)
+            follower.save()
+            notify('followers', target_account.id, account.id, follower.id)
+            delta = 1
+            follow_status = True
+
+        # keep the denormalized counters of both accounts in step
+        Account.objects.filter(id=target_account.id).update(followers_count=F('followers_count') + delta)
+        Account.objects.filter(id=account.id).update(following_count=F('following_count') + delta)
+
+        # the following feed starts with the latest posts of a followed account
+        if follow_status:
+            backfill_timeline(account.id, target_account.id)
+        else:
+            drop_from_timeline(account.id, target_account.id)
+    return follow_status
+
+
+async def follow(request):
     try:
         req = json.loads(request.body)
         access_token = req.get('access_token', None)
@@ -221,25 +301,13 @@ def follow(request):
             return generate_failed_response('Access token or ID is missing!')
 
         # query account
-        account_access_token = AccountAccessToken.objects.get(access_token=access_token)
-        account = Account.objects.get(email=account_access_token.account_email)
+        account = await aresolve_account(request, access_token)
 
         # query target account
-        target_account = Account.objects.get(email=target_email)
+        target_account = await Account.objects.aget(email=target_email)
 
-        # query follow record
-        follow_status = Follower.objects.filter(follower_email=account.email,
-                                                followed_email=target_account.email).count() > 0
-
-        # update follow status
-        if follow_status:
-            Follower.objects.filter(follower_email=account.email, followed_email=target_account.email).delete()
-            follow_status = False
-        else:
-            follower = Follower(follower_email=account.email, follower_name=account.name, follower_id=account.id,
-                                followed_email=target_account.email)
-            follower.save()
-            follow_status = True
+        # the async ORM has no transactions, the toggle runs in a worker thread
+        follow_status = await sync_to_async(toggle_follow)(account, target_account)
 
         return generate_successful_response(follow_status)
     except AccountAccessToken.DoesNotExist:
@@ -252,7 +320,20 @@ def follow(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def query_notification(request):
+async def after_watermark(notifications, since_id=None, limit=None):
+    if since_id is None:
+        notifications = notifications.order_by('-id')
+        notifications = notifications if limit is None else notifications[:limit]
+        return [notification async for notification in notifications]
+
+    # page forward from the watermark so no notification is skipped, then return newest first
+    notifications = notifications.filter(id__gt=since_id).order_by('id')
+    if limit is not None:
+        notifications = notifications[:limit]
+    return [notification async for notification in notifications][::-1]
+
+
+async def query_notification(request):
     try:
         req = json.loads(request.body)
         access_token = req.get('access_token', None)
@@ -260,29 +341,35 @@ def query_notification(request):
         if access_token is None:
             return generate_failed_response('Access token is missing!')
 
+        # per type watermarks, only notifications newer than what the client already has are returned
+        since_ids = req.get('since_ids') or {}
+        if not isinstance(since_ids, dict) or not all(
+                isinstance(since_id, int) for since_id in since_ids.values()):
+            return generate_failed_response('Invalid since_ids!')
+        limit = parse_limit(req.get('limit')) if 'limit' in req else None
+
         # query account
-        account_access_token = AccountAccessToken.objects.get(access_token=access_token)
-        account = Account.objects.get(email=account_access_token.account_email)
-        account_email = account.email
+        account_id = (await aresolve_account(request, access_token)).id
 
         # query comments which not read
-        comments = Comment.objects.filter(poster_email=account_email, read=False).exclude(
-            commentator_email=account_email).order_by('-id')
+        comments = with_post_title(Comment.objects.filter(poster=account_id, read=False).exclude(
+            commentator=account_id))
 
         # query likes which not read
-        likes = LikedPost.objects.filter(poster_email=account_email, read=False).exclude(
-            liked_account_email=account_email).order_by('-id')
+        likes = LikedPost.objects.filter(poster=account_id, read=False).exclude(liked_account=account_id)
 
         # query follower records which not read
-        followers = Follower.objects.filter(followed_email=account_email, read=False).order_by('-id')
+        followers = Follower.objects.filter(followed=account_id, read=False)
 
         data = {
-            'comments': format_comments(comments),
-            'likes': format_likes(likes),
-            'followers': format_followers(followers),
+            'comments': format_comments(await after_watermark(comments, since_ids.get('comments'), limit)),
+            'likes': format_likes(await after_watermark(likes, since_ids.get('likes'), limit)),
+            'followers': format_followers(await after_watermark(followers, since_ids.get('followers'), limit)),
         }
 
         return generate_successful_response(data)
+    except PaginationError as e:
+        return generate_failed_response(str(e))
     except AccountAccessToken.DoesNotExist:
         return generate_failed_response('Invalid access token!')
     except Account.DoesNotExist:
@@ -293,7 +380,7 @@ def query_notification(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def read_notification(request):
+async def read_notification(request):
     try:
         req = json.loads(request.body)
         missing_fields = validate_request_data(req, ['access_token', 'id', 'type'])
@@ -302,27 +389,20 @@ def read_notification(request):
 
         # validate account access token
         access_token = req.get('access_token', None)
-        AccountAccessToken.objects.get(access_token=access_token)
+        await aresolve_account(request, access_token)
 
         target_id = req.get('id')
         read_type = req.get('type')
 
-        # update read field
-        if read_type == 'comments':
-            comment = Comment.objects.get(id=target_id)
-            comment.read = True
-            comment.save()
-        elif read_type == 'likes':
-            liked_post = LikedPost.objects.get(id=target_id)
-            liked_post.read = True
-            liked_post.save()
-        elif read_type == 'followers':
-            follower = Follower.objects.get(id=target_id)
-            follower.read = True
-            follower.save()
-        else:
+        if read_type not in notification_types:
             return generate_failed_response('Invalid type!')
 
+        # update read field and the unread counter of the notified account
+        model, owner_field = notification_types[read_type][:2]
+        notification = await model.objects.aget(id=target_id)
+        await sync_to_async(mark_read)(read_type, getattr(notification, f'{owner_field}_id'),
+                                       model.objects.filter(id=target_id))
+
         return generate_successful_response(True)
     except AccountAccessToken.DoesNotExist:
         return generate_failed_response('Invalid access token!')
@@ -332,3 +412,138 @@ def read_notification(request):
         return generate_failed_response('Invalid JSON!')
     except Exception as e:
         return generate_failed_response('An unexpected error occurred.', data=str(e))
+
+
+def mark_all_read(account_id, filters):
+    # one set based UPDATE per table, scoped to the caller's notifications
+    data = {}
+    with transaction.atomic():
+        for read_type, condition in filters.items():
+            if condition is None:
+                data[read_type] = 0
+                continue
+            model = notification_types[read_type][0]
+            data[read_type] = mark_read(read_type, account_id, model.objects.filter(condition))
+    return data
+
+
+async def read_notifications(request):
+    try:
+        req = json.loads(request.body)
+        access_token = req.get('access_token', None)
+
+        if access_token is None:
+            return generate_failed_response('Access token is missing!')
+
+        # query account
+        account = await aresolve_account(request, access_token)
+
+        # each type accepts a list of ids and/or an "all up to id" watermark
+        up_to = req.get('up_to') or {}
+        if not isinstance(up_to, dict):
+            return generate_failed_response('Invalid up_to!')
+
+        filters = {}
+        for read_type in notification_types:
+            ids = req.get(read_type) or []
+            max_id = up_to.get(read_type)
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                return generate_failed_response(f'Invalid {read_type} IDs!')
+            if max_id is not None and not isinstance(max_id, int):
+                return generate_failed_response(f'Invalid {read_type} watermark!')
+
+            condition = Q(id__in=ids) if ids else None
+            if max_id is not None:
+                condition = Q(id__lte=max_id) if condition is None else condition | Q(id__lte=max_id)
+            filters[read_type] = condition
+
+        data = await sync_to_async(mark_all_read)(account.id, filters)
+
+        return generate_successful_response(data)
+    except AccountAccessToken.DoesNotExist:
+        return generate_failed_response('Invalid access token!')
+    except Account.DoesNotExist:
+        return generate_failed_response('Account does not exist!')
+    except json.JSONDecodeError:
+        return generate_failed_response('Invalid JSON!')
+    except Exception as e:
+        return generate_failed_response('An unexpected error occurred.', data=str(e))
+
+
+async def unread_counts(request):
+    try:
+        req = json.loads(request.body)
+        access_token = req.get('access_token', None)
+
+        if access_token is None:
+            return generate_failed_response('Access token is missing!')
+
+        # read the maintained counters instead of scanning the notification tables
+        account = await Account.objects.aget(id=(await aresolve_account(request, access_token)).id)
+
+        return generate_successful_response(format_unread_counts(account))
+    except AccountAccessToken.DoesNotExist:
+        return generate_failed_response('Invalid access token!')
+    except Account.DoesNotExist:
+        return generate_failed_response('Account does not exist!')
+    except json.JSONDecodeError:
+        return generate_failed_response('Invalid JSON!')
+    except Exception as e:
+        return generate_failed_response('An unexpected error occurred.', data=str(e))
+
+
+stream_heartbeat_seconds = 15
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+async def notification_stream(request):
+    """
+    Server-sent events of the account's notifications, starting with a snapshot of its unread counts.
+
+    Under ASGI the stream stays open with heartbeats. A WSGI server reads the whole response before sending it and
+    would pin a worker thread forever, so there the response ends after the first notification or after
+    ``stream_heartbeat_seconds``, and EventSource reconnects like a long poll.
+    """
+    # EventSource can only send the access token in the query string
+    access_token = request.GET.get('access_token', None)
+    if access_token is None:
+        return generate_failed_response('Access token is missing!')
+
+    try:
+        account = await aresolve_account(request, access_token)
+        account = await Account.objects.aget(id=account.id)
+    except AccountAccessToken.DoesNotExist:
+        return generate_failed_response('Invalid access token!')
+    except Account.DoesNotExist:
+        return generate_failed_response('Account does not exist!')
+
+    streaming = isinstance(request, ASGIRequest)
+
+    async def events():
+        # subscribed from the loop that iterates the response, which is not the loop of the view under WSGI
+        queue = notification_bus.subscribe(account.id)
+        try:
+            # start with a snapshot so reconnecting clients re-sync
+            yield format_event('unread_counts', format_unread_counts(account))
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), stream_heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    if not streaming:
+                        return
+                    # keep proxies from closing an idle connection
+                    yield ': heartbeat\n\n'
+                    continue
+                yield format_event('notification', event)
+                if not streaming:
+                    return
+        finally:
+            notification_bus.unsubscribe(account.id, queue)
+
+    return StreamingHttpResponse(events(), content_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
@@ -0,0 +1,8 @@
+import os
+
+import django
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+    django.setup()
@@ -0,0 +1,170 @@
+"""
+Compare email keyed and id keyed account references on the like and follow tables.
+
+Both layouts are built in throwaway SQLite databases with emails shaped like the ones in site_data.json,
+then the size of their indexes and the time of the lookups and joins the views run are reported.
+
+Usage: python -m benchmarks.account_relations [--accounts 2000] [--likes 100000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import timeit
+
+# account reference column type and the columns holding a reference, per layout
+layouts = {
+    'email': {
+        'reference': 'varchar(254)',
+        'like_account': 'liked_account_email',
+        'like_poster': 'poster_email',
+        'follower': 'follower_email',
+        'followed': 'followed_email',
+        'account_key': 'email',
+    },
+    'id': {
+        'reference': 'bigint',
+        'like_account': 'liked_account_id',
+        'like_poster': 'poster_id',
+        'follower': 'follower_id',
+        'followed': 'followed_id',
+        'account_key': 'id',
+    },
+}
+
+
+def build_rows(accounts, likes, seed=0):
+    rng = random.Random(seed)
+    emails = [f'{i:07d}X@student.gla.ac.uk' if i % 2 else f'user{i:06d}@gmail.com' for i in range(1, accounts + 1)]
+    posts = [(post_id, rng.randrange(accounts) + 1) for post_id in range(1, likes // 10 + 1)]
+    like_rows = set()
+    while len(like_rows) < likes:
+        like_rows.add((rng.randrange(len(posts)), rng.randrange(accounts) + 1))
+    follow_rows = set()
+    while len(follow_rows) < likes // 5:
+        follower, followed = rng.randrange(accounts) + 1, rng.randrange(accounts) + 1
+        if follower != followed:
+            follow_rows.add((follower, followed))
+    return emails, posts, sorted(like_rows), sorted(follow_rows)
+
+
+def page_bytes(connection):
+    page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+    return page_count * connection.execute('PRAGMA page_size').fetchone()[0]
+
+
+def create_layout(path, layout, emails, posts, likes, follows):
+    columns = layouts[layout]
+    reference = columns['reference']
+
+    def key(account_id):
+        return emails[account_id - 1] if layout == 'email' else account_id
+
+    connection = sqlite3.connect(path)
+    connection.executescript(f'''
+        CREATE TABLE account (id integer PRIMARY KEY, email varchar(254) NOT NULL UNIQUE);
+        CREATE TABLE post (id integer PRIMARY KEY, {columns['like_poster']} {reference} NOT NULL);
+        CREATE TABLE likedpost (id integer PRIMARY KEY, post_id bigint NOT NULL,
+            {columns['like_account']} {reference} NOT NULL, {columns['like_poster']} {reference} NOT NULL,
+            read bool NOT NULL);
+        CREATE TABLE follower (id integer PRIMARY KEY, {columns['follower']} {reference} NOT NULL,
+            {columns['followed']} {reference} NOT NULL, read bool NOT NULL);
+    ''')
+    with connection:
+        connection.executemany('INSERT INTO account VALUES (?, ?)', enumerate(emails, 1))
+        connection.executemany('INSERT INTO post VALUES (?, ?)', [(post_id, key(poster)) for post_id, poster in posts])
+        connection.executemany(
+            f'INSERT INTO likedpost (post_id, {columns["like_account"]}, {columns["like_poster"]}, read) '
+            'VALUES (?, ?, ?, ?)',
+            [(posts[post][0], key(account), key(posts[post][1]), i % 3 == 0) for i, (post, account) in
+             enumerate(likes)])
+        connection.executemany(
+            f'INSERT INTO follower ({columns["follower"]}, {columns["followed"]}, read) VALUES (?, ?, ?)',
+            [(key(follower), key(followed), i % 3 == 0) for i, (follower, followed) in enumerate(follows)])
+
+    # the indexes and unique constraints of the models, keyed by the layout's reference columns
+    indexes = {
+        'unique_liked_post': f'CREATE UNIQUE INDEX unique_liked_post ON likedpost (post_id, {columns["like_account"]})',
+        'likedpost_account_feed_idx': f'CREATE INDEX likedpost_account_feed_idx ON likedpost '
+                                      f'({columns["like_account"]}, post_id)',
+        'likedpost_poster_idx': f'CREATE INDEX likedpost_poster_idx ON likedpost ({columns["like_poster"]})',
+        'likedpost_unread_idx': f'CREATE INDEX likedpost_unread_idx ON likedpost ({columns["like_poster"]}, id) '
+                                'WHERE NOT read',
+        'post_poster_feed_idx': f'CREATE INDEX post_poster_feed_idx ON post ({columns["like_poster"]}, id DESC)',
+        'unique_follower': f'CREATE UNIQUE INDEX unique_follower ON follower '
+                           f'({columns["follower"]}, {columns["followed"]})',
+        'follower_followed_idx': f'CREATE INDEX follower_followed_idx ON follower ({columns["followed"]})',
+        'follower_unread_idx': f'CREATE INDEX follower_unread_idx ON follower ({columns["followed"]}, id) '
+                               'WHERE NOT read',
+    }
+    sizes = {}
+    for name, sql in indexes.items():
+        before = page_bytes(connection)
+        connection.execute(sql)
+        sizes[name] = page_bytes(connection) - before
+    connection.execute('ANALYZE')
+    return connection, sizes
+
+
+def lookups(layout):
+    columns = layouts[layout]
+    account = 'SELECT {key} FROM account WHERE email = ?'.format(key=columns['account_key'])
+    return {
+        # the views receive emails, the id layout resolves them through the account email index
+        'liked_feed': f'SELECT id FROM post WHERE id IN (SELECT post_id FROM likedpost '
+                      f'WHERE {columns["like_account"]} = ({account})) ORDER BY id DESC LIMIT 20',
+        'follow_status': f'SELECT COUNT(*) FROM follower WHERE {columns["follower"]} = ({account}) '
+                         f'AND {columns["followed"]} = ({account})',
+        'unread_likes': f'SELECT id FROM likedpost WHERE {columns["like_poster"]} = ({account}) AND NOT read '
+                        'ORDER BY id DESC',
+    }
+
+
+def join_query(layout):
+    # every like joined to its poster account, the shape of the counter reconciliation
+    columns = layouts[layout]
+    return (f'SELECT account.id, COUNT(*) FROM likedpost JOIN account '
+            f'ON account.{columns["account_key"]} = likedpost.{columns["like_poster"]} GROUP BY account.id')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=2000)
+    parser.add_argument('--likes', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    emails, posts, likes, follows = build_rows(args.accounts, args.likes)
+    rng = random.Random(1)
+    samples = [(rng.choice(emails), rng.choice(emails)) for _ in range(args.lookups)]
+
+    results = {'accounts': args.accounts, 'likes': len(likes), 'follows': len(follows), 'layouts': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for layout in layouts:
+            connection, sizes = create_layout(os.path.join(directory, f'{layout}.sqlite3'), layout,
+                                              emails, posts, likes, follows)
+            timings = {}
+            for name, sql in lookups(layout).items():
+                arguments = [(email, other)[:sql.count('?')] for email, other in samples]
+                seconds = min(timeit.repeat(
+                    lambda: [connection.execute(sql, params).fetchall() for params in arguments],
+                    number=1, repeat=args.repeat))
+                timings[name] = round(seconds / len(arguments) * 1e6, 2)
+            sql = join_query(layout)
+            join_seconds = min(timeit.repeat(lambda: connection.execute(sql).fetchall(), number=1,
+                                             repeat=args.repeat))
+            connection.close()
+            results['layouts'][layout] = {
+                'index_bytes': sizes,
+                'total_index_bytes': sum(sizes.values()),
+                'lookup_us': timings,
+                'join_ms': round(join_seconds * 1000, 3),
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+"""
+Load test every JSON endpoint of api/account and api/post against a seeded throwaway database.
+
+Every endpoint is driven through the Django test client in process, which also counts the queries per request,
+and through real gunicorn (WSGI) and uvicorn (ASGI) servers. Latency percentiles, throughput and queries per
+request are printed as JSON, ``benchmarks.compare`` diffs two of these reports.
+
+notification_stream is left out, benchmarks.connections holds streams open while it measures the other endpoints.
+
+Usage: python -m benchmarks.api_load [--accounts 1000] [--posts 10000] [--requests 200] [--concurrency 8]
+                                     [--targets client gunicorn uvicorn] [--output report.json]
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks import setup_django
+from benchmarks import dataset
+
+base_dir = Path(__file__).resolve().parent.parent
+
+
+class Context:
+    """
+    Shared state of the payload builders, builders run before the timed requests of their endpoint.
+    """
+
+    def __init__(self, accounts, posts, random_seed=0):
+        self.accounts = accounts
+        self.posts = posts
+        self.rng = random.Random(random_seed)
+        self._counter = itertools.count()
+        # login replaces the tokens of its account, so it gets an account no other endpoint uses
+        self.login_account = accounts
+
+    def unique(self):
+        return next(self._counter)
+
+    def account(self):
+        return self.rng.randrange(1, self.accounts)
+
+    def token(self):
+        return dataset.access_token(self.account())
+
+    def post_id(self):
+        return self.rng.randrange(1, self.posts + 1)
+
+
+def new_access_token(context):
+    from account.models import Account, AccountAccessToken
+
+    account = Account.objects.get(email=dataset.account_email(context.account()))
+    token = f'benchmark-logout-{context.unique()}-{time.time_ns()}'
+    AccountAccessToken.objects.create(account=account, account_email=account.email, access_token=token)
+    return token
+
+
+def new_passcode(context):
+    from account.models import AccountPasscode
+
+    email = f'signup{context.unique()}-{time.time_ns()}@benchmark.test'
+    AccountPasscode.objects.create(account_email=email, passcode='123456')
+    return {'name': 'signup', 'email': email, 'password': dataset.password, 'passcode': '123456'}
+
+
+def own_post(context):
+    from account.models import Account
+    from post.models import Post
+
+    index = context.account()
+    account = Account.objects.get(email=dataset.account_email(index))
+    post = Post.objects.create(title='Disposable Post', content='Removed by the benchmark.', images='',
+                               poster=account, poster_email=account.email, poster_name=account.name,
+                               channel='Soups')
+    return {'access_token': dataset.access_token(index), 'id': post.id}
+
+
+def notification_id(context):
+    from post.models import LikedPost
+
+    return LikedPost.objects.filter(id__gte=context.rng.randrange(1, 1000)).values_list('id', flat=True).first()
+
+
+# endpoint name -> (path, payload builder)
+endpoints = {
+    'account/query': ('/api/account/query', lambda c: {'id': c.account()}),
+    'account/query:own': ('/api/account/query', lambda c: {'access_token': c.token()}),
+    'account/login': ('/api/account/login', lambda c: {'email': dataset.account_email(c.login_account),
+                                                        'password': dataset.password}),
+    'account/logout': ('/api/account/logout', lambda c: {'access_token': new_access_token(c)}),
+    'account/signup': ('/api/account/signup', new_passcode),
+    'account/send_passcode': ('/api/account/send_passcode',
+                              lambda c: {'email': f'passcode{c.unique()}-{time.time_ns()}@benchmark.test'}),
+    'account/query_follow_status': ('/api/account/query_follow_status',
+                                    lambda c: {'access_token': c.token(), 'email': dataset.account_email(c.account())}),
+    'account/follow': ('/api/account/follow',
+                       lambda c: {'access_token': c.token(), 'email': dataset.account_email(c.account())}),
+    'account/query_notification': ('/api/account/query_notification',
+                                   lambda c: {'access_token': c.token(), 'limit': 20}),
+    'account/read_notification': ('/api/account/read_notification',
+                                  lambda c: {'access_token': c.token(), 'type': 'likes', 'id': notification_id(c)}),
+    'account/read_notifications': ('/api/account/read_notifications',
+                                   lambda c: {'access_token': c.token(), 'up_to': {'comments': c.rng.randrange(1000)}}),
+    'account/unread_counts': ('/api/account/unread_counts', lambda c: {'access_token': c.token()}),
+    'post/query:All': ('/api/post/query', lambda c: {'type': 'All', 'limit': 20}),
+    'post/query:channel': ('/api/post/query', lambda c: {'type': 'Japanese_Cuisine', 'limit': 20}),
+    'post/query:publish': ('/api/post/query', lambda c: {'type': 'publish', 'limit': 20,
+                                                         'email': dataset.account_email(c.account())}),
+    'post/query:like': ('/api/post/query', lambda c: {'type': 'like', 'limit': 20,
+                                                      'email': dataset.account_email(c.account())}),
+    'post/query:following': ('/api/post/query', lambda c: {'type': 'following', 'access_token': c.token(),
+                                                           'limit': 20}),
+    'post/query:trending': ('/api/post/query', lambda c: {'type': 'Japanese_Cuisine', 'order': 'trending',
+                                                          'limit': 20}),
+    'post/query:summary': ('/api/post/query', lambda c: {'type': 'Desserts', 'limit': 20, 'projection': 'summary'}),
+    'post/detail': ('/api/post/detail', lambda c: {'id': c.post_id()}),
+    'post/search': ('/api/post/search', lambda c: {'keyword': c.rng.choice(['salmon', 'soup', 'cake', 'rice']),
+                                                   'limit': 20}),
+    'post/publish': ('/api/post/publish', lambda c: {'access_token': c.token(), 'title': 'Benchmark Post',
+                                                     'content': 'Published by the benchmark.', 'channel': 'Soups'}),
+    'post/query_comments': ('/api/post/query_comments', lambda c: {'id': c.post_id()}),
+    'post/query_like_status': ('/api/post/query_like_status', lambda c: {'access_token': c.token(),
+                                                                         'id': c.post_id()}),
+    'post/like': ('/api/post/like', lambda c: {'access_token': c.token(), 'id': c.post_id()}),
+    'post/comment': ('/api/post/comment', lambda c: {'access_token': c.token(), 'id': c.post_id(),
+                                                     'comment': 'Benchmark comment'}),
+    'post/delete': ('/api/post/delete', own_post),
+    # the post dialog, compare with post/query_comments, account/query_follow_status and post/query_like_status
+    'batch:post_dialog': ('/api/batch', lambda c: {'access_token': c.token(), 'requests': [
+        {'path': 'post/query_comments', 'data': {'id': c.post_id()}},
+        {'path': 'account/query_follow_status', 'data': {'email': dataset.account_email(c.account())}},
+        {'path': 'post/query_like_status', 'data': {'id': c.post_id()}},
+    ]}),
+}
+
+
+class ClientTarget:
+    """
+    Requests through the Django test client, in the benchmark process.
+    """
+    name = 'client'
+    counts_queries = True
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def request(self, path, payload):
+        from django.db import connection
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(path, payload, content_type='application/json')
+        return response.status_code, response.content, len(queries)
+
+    def finish_thread(self):
+        from django.db import connection
+
+        connection.close()
+
+
+class ServerTarget:
+    """
+    Requests over HTTP to a server process started on the benchmark database.
+    """
+    name = None
+    counts_queries = False
+    # seconds a request may wait for its response
+    timeout = 30
+
+    def __init__(self, database, workers):
+        self.database = database
+        self.workers = workers
+        self.process = None
+        self.port = None
+        self._local = threading.local()
+
+    def command(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        env = dict(os.environ, DATABASE_NAME=str(self.database), DJANGO_SETTINGS_MODULE='server.settings')
+        self.process = subprocess.Popen([sys.executable, '-m', *self.command()], cwd=base_dir, env=env)
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                return self
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f'{self.name} did not start')
+                time.sleep(0.1)
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            # workers stuck in a request do not stop gracefully
+            self.process.kill()
+            self.process.wait()
+        return False
+
+    def request(self, path, payload):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection('127.0.0.1', self.port,
+                                                                              timeout=self.timeout)
+        try:
+            connection.request('POST', path, json.dumps(payload), {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            return response.status, response.read(), None
+        except TimeoutError:
+            # a late response must not be read as the answer to the next request
+            connection.close()
+            raise
+        except (http.client.HTTPException, OSError):
+            # the server closed the kept alive connection, retry once on a new one
+            connection.close()
+            connection.request('POST', path, json.dumps(payload), {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            return response.status, response.read(), None
+
+    def finish_thread(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class GunicornTarget(ServerTarget):
+    """
+    gunicorn with sync (threaded) workers on the WSGI application, the async views run through async_to_sync.
+    """
+    name = 'gunicorn'
+
+    def __init__(self, database, workers, threads):
+        super().__init__(database, workers)
+        self.threads = threads
+
+    def command(self):
+        return ['gunicorn', 'server.wsgi:application', '--bind', f'127.0.0.1:{self.port}',
+                '--workers', str(self.workers), '--threads', str(self.threads), '--log-level', 'warning']
+
+
+class UvicornTarget(ServerTarget):
+    """
+    uvicorn on the ASGI application, as many worker processes as gunicorn.
+    """
+    name = 'uvicorn'
+
+    def command(self):
+        return ['uvicorn', 'server.asgi:application', '--host', '127.0.0.1', '--port', str(self.port),
+                '--workers', str(self.workers), '--log-level', 'warning']
+
+
+def create_target(name, database, workers, threads):
+    if name == 'client':
+        return ClientTarget()
+    if name == 'gunicorn':
+        return GunicornTarget(database, workers, threads)
+    return UvicornTarget(database, workers)
+
+
+def percentile(values, fraction):
+    # nearest rank on sorted values
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+def run_endpoint(target, path, payloads, concurrency):
+    chunks = [payloads[i::concurrency] for i in range(concurrency)]
+
+    def worker(chunk):
+        samples = []
+        try:
+            for payload in chunk:
+                started = time.perf_counter()
+                try:
+                    status, body, queries = target.request(path, payload)
+                    ok = status == 200 and json.loads(body).get('code') == 1
+                except (http.client.HTTPException, OSError):
+                    # timed out or dropped by the server
+                    ok, queries = False, None
+                elapsed = time.perf_counter() - started
+                samples.append((elapsed, ok, queries))
+        finally:
+            target.finish_thread()
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = [sample for chunk in executor.map(worker, chunks) for sample in chunk]
+    wall_seconds = time.perf_counter() - started
+
+    latencies = sorted(sample[0] * 1000 for sample in samples)
+    queries = [sample[2] for sample in samples if sample[2] is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if not sample[1]),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'throughput_rps': round(len(samples) / wall_seconds, 1),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def run_target(target, context, requests, concurrency, selected):
+    results = {}
+    with target:
+        for name, (path, build) in endpoints.items():
+            if selected and name not in selected:
+                continue
+            payloads = [build(context) for _ in range(requests)]
+            results[name] = run_endpoint(target, path, payloads, concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--likes', type=int, default=50000)
+    parser.add_argument('--comments', type=int, default=20000)
+    parser.add_argument('--follows', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint and target')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--targets', nargs='+', choices=['client', 'gunicorn', 'uvicorn'],
+                        default=['client', 'gunicorn', 'uvicorn'])
+    parser.add_argument('--endpoints', nargs='*', choices=list(endpoints), help='defaults to every endpoint')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn and uvicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--database', help='sqlite file to seed, a temporary file by default')
+    parser.add_argument('--output', help='also write the report to this file')
+    args = parser.parse_args()
+
+    directory = None
+    database = args.database
+    if database is None:
+        directory = tempfile.TemporaryDirectory()
+        database = os.path.join(directory.name, 'benchmark.sqlite3')
+    os.environ['DATABASE_NAME'] = database
+
+    setup_django()
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+
+    # accept the test client host and keep mail in memory
+    setup_test_environment()
+    try:
+        call_command('migrate', verbosity=0)
+        counts = dataset.seed(args.accounts, args.posts, args.likes, args.comments, args.follows)
+        context = Context(args.accounts, args.posts)
+
+        report = {
+            'config': {key: value for key, value in vars(args).items() if key not in ('database', 'output')},
+            'dataset': counts,
+            'targets': {},
+        }
+        for name in args.targets:
+            target = create_target(name, database, args.workers, args.threads)
+            report['targets'][name] = run_target(target, context, args.requests, args.concurrency, args.endpoints)
+    finally:
+        if directory is not None:
+            directory.cleanup()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
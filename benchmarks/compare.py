@@ -0,0 +1,62 @@
+"""
+Compare two api_load reports and flag the endpoints that got slower.
+
+Exits with status 1 when a p99 latency grew, or a throughput dropped, by more than the threshold.
+
+Usage: python -m benchmarks.compare baseline.json current.json [--threshold 0.2]
+"""
+import argparse
+import json
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before
+
+
+def compare(baseline, current, threshold):
+    rows = []
+    regressions = []
+    for target, endpoints in current['targets'].items():
+        for endpoint, result in endpoints.items():
+            before = baseline['targets'].get(target, {}).get(endpoint)
+            if before is None:
+                continue
+            row = {
+                'target': target,
+                'endpoint': endpoint,
+                'p50': change(before['p50_ms'], result['p50_ms']),
+                'p99': change(before['p99_ms'], result['p99_ms']),
+                'throughput': change(before['throughput_rps'], result['throughput_rps']),
+                'queries': (None if before['queries_per_request'] is None or result['queries_per_request'] is None
+                            else round(result['queries_per_request'] - before['queries_per_request'], 2)),
+                'errors': result['errors'] - before['errors'],
+            }
+            rows.append(row)
+            if ((row['p99'] or 0) > threshold or (row['throughput'] or 0) < -threshold
+                    or (row['queries'] or 0) > 0 or row['errors'] > 0):
+                regressions.append(row)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative change, 0.2 is 20%%')
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+    with open(args.current, encoding='utf-8') as file:
+        current = json.load(file)
+
+    rows, regressions = compare(baseline, current, args.threshold)
+    print(json.dumps({'changes': rows, 'regressions': regressions}, indent=2))
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Load test the API while notification streams, requests that wait for events, hold connections open.
+
+A sync worker thread stays pinned by each waiting request, so once gunicorn's workers x threads streams are open
+the rest of the traffic queues behind them. uvicorn keeps the streams on its event loop and the same worker
+processes go on serving the other endpoints. Each stream count gets freshly started servers.
+
+Usage: python -m benchmarks.connections [--streams 0 16 256] [--workers 2] [--threads 4] [--concurrency 16]
+                                        [--targets gunicorn uvicorn] [--output report.json]
+"""
+import argparse
+import json
+import os
+import select
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import setup_django
+from benchmarks import dataset
+from benchmarks.api_load import Context, create_target, endpoints, run_endpoint
+
+default_endpoints = ['post/query:All', 'post/detail', 'account/unread_counts']
+
+
+def open_streams(port, count, accounts, timeout):
+    """
+    Open ``count`` notification streams and return them with how many got a response within ``timeout`` seconds.
+    """
+    streams = []
+    for i in range(count):
+        stream = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+        path = f'/api/account/notification_stream?access_token={dataset.access_token(i % accounts + 1)}'
+        stream.sendall(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n'.encode())
+        streams.append(stream)
+
+    pending = set(streams)
+    responded = 0
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        readable, _, _ = select.select(list(pending), [], [], max(0.0, deadline - time.monotonic()))
+        for stream in readable:
+            if stream.recv(65536):
+                responded += 1
+            pending.discard(stream)
+    return streams, responded
+
+
+def run_level(target, context, streams, args):
+    with target:
+        held, responded = open_streams(target.port, streams, args.accounts, args.timeout)
+        try:
+            results = {}
+            for name in args.endpoints:
+                path, build = endpoints[name]
+                payloads = [build(context) for _ in range(args.requests)]
+                results[name] = run_endpoint(target, path, payloads, args.concurrency)
+        finally:
+            for stream in held:
+                stream.close()
+    return {'streams': streams, 'streams_responding': responded, 'endpoints': results}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--likes', type=int, default=20000)
+    parser.add_argument('--comments', type=int, default=5000)
+    parser.add_argument('--follows', type=int, default=5000)
+    parser.add_argument('--streams', nargs='+', type=int, default=[0, 16, 256],
+                        help='notification streams held open during each run')
+    parser.add_argument('--requests', type=int, default=100, help='requests per endpoint and run')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=2, help='seconds before a request counts as an error')
+    parser.add_argument('--targets', nargs='+', choices=['gunicorn', 'uvicorn'], default=['gunicorn', 'uvicorn'])
+    parser.add_argument('--endpoints', nargs='+', choices=list(endpoints), default=default_endpoints)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn and uvicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--output', help='also write the report to this file')
+    args = parser.parse_args()
+
+    directory = tempfile.TemporaryDirectory()
+    database = os.path.join(directory.name, 'benchmark.sqlite3')
+    os.environ['DATABASE_NAME'] = database
+
+    setup_django()
+    from django.core.management import call_command
+
+    try:
+        call_command('migrate', verbosity=0)
+        counts = dataset.seed(args.accounts, args.posts, args.likes, args.comments, args.follows)
+        context = Context(args.accounts, args.posts)
+
+        report = {
+            'config': {key: value for key, value in vars(args).items() if key != 'output'},
+            'dataset': counts,
+            'targets': {},
+        }
+        for name in args.targets:
+            levels = report['targets'][name] = []
+            for streams in args.streams:
+                target = create_target(name, database, args.workers, args.threads)
+                target.timeout = args.timeout
+                levels.append(run_level(target, context, streams, args))
+    finally:
+        directory.cleanup()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
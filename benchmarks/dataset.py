@@ -0,0 +1,124 @@
+"""
+Synthetic dataset for the API benchmarks, the posts and comments of site_data.json are used as templates.
+"""
+import datetime
+import json
+import random
+from pathlib import Path
+
+fixture_path = Path(__file__).resolve().parent.parent / 'site_data.json'
+
+# every seeded account logs in with this password
+password = 'admin123'
+batch_size = 1000
+
+
+def account_email(index):
+    return f'user{index}@benchmark.test'
+
+
+def access_token(index):
+    return f'benchmark-token-{index}'
+
+
+def load_templates():
+    with open(fixture_path, encoding='utf-8') as file:
+        fixture = json.load(file)
+    posts = [item['fields'] for item in fixture if item['model'] == 'post.post']
+    comments = [item['fields']['comment'] for item in fixture if item['model'] == 'post.comment']
+    return posts, comments
+
+
+def unique_pairs(rng, count, left, right, exclude_equal=False):
+    # distinct (left, right) index pairs, sorted so rows are inserted in index order
+    count = min(count, left * right - (min(left, right) if exclude_equal else 0))
+    pairs = set()
+    while len(pairs) < count:
+        pair = (rng.randrange(left), rng.randrange(right))
+        if not (exclude_equal and pair[0] == pair[1]):
+            pairs.add(pair)
+    return sorted(pairs)
+
+
+def seed(accounts=1000, posts=10000, likes=50000, comments=20000, follows=10000, random_seed=0):
+    """
+    Fill the current database with a reproducible dataset and return the number of rows per table.
+
+    Accounts ``user<i>@benchmark.test`` own the access token ``benchmark-token-<i>``.
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.db.models import Count, OuterRef, Subquery
+    from django.db.models.functions import Coalesce
+
+    from account.counters import reconcile_account_counters
+    from account.models import Account, AccountAccessToken, Follower
+    from post.models import Post, LikedPost, Comment, TimelineEntry, TrendingPost
+    from post.timeline import rebuild_timelines
+    from post.trending import update_trending
+
+    rng = random.Random(random_seed)
+    post_templates, comment_templates = load_templates()
+    # one hash shared by every account, hashing thousands at the login cost would dominate the setup
+    password_hash = make_password(password)
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    account_rows = Account.objects.bulk_create([
+        Account(email=account_email(i), name=f'user{i}', password=password_hash, role='', bio='', avatar='',
+                wallpaper='') for i in range(1, accounts + 1)
+    ], batch_size=batch_size)
+    AccountAccessToken.objects.bulk_create([
+        AccountAccessToken(account=account, account_email=account.email, access_token=access_token(i))
+        for i, account in enumerate(account_rows, 1)
+    ], batch_size=batch_size)
+
+    post_rows = []
+    for i in range(posts):
+        template = post_templates[i % len(post_templates)]
+        poster = rng.choice(account_rows)
+        post_rows.append(Post(title=f"{template['title']} {i}", content=template['content'],
+                              images=template['images'], poster=poster, poster_email=poster.email,
+                              poster_name=poster.name, channel=template['channel'],
+                              create_datetime=now - datetime.timedelta(minutes=posts - i)))
+    post_rows = Post.objects.bulk_create(post_rows, batch_size=batch_size)
+
+    LikedPost.objects.bulk_create([
+        LikedPost(liked_account=account_rows[a], liked_account_email=account_rows[a].email,
+                  liked_account_name=account_rows[a].name, post=post_rows[p], poster_id=post_rows[p].poster_id,
+                  poster_email=post_rows[p].poster_email, read=rng.random() < 0.5)
+        for p, a in unique_pairs(rng, likes, len(post_rows), len(account_rows))
+    ], batch_size=batch_size)
+
+    comment_rows = []
+    for i in range(comments):
+        post = rng.choice(post_rows)
+        commentator = rng.choice(account_rows)
+        comment_rows.append(Comment(post=post, poster_id=post.poster_id, poster_email=post.poster_email,
+                                    commentator=commentator, commentator_email=commentator.email,
+                                    commentator_name=commentator.name,
+                                    comment=comment_templates[i % len(comment_templates)],
+                                    read=rng.random() < 0.5))
+    Comment.objects.bulk_create(comment_rows, batch_size=batch_size)
+
+    Follower.objects.bulk_create([
+        Follower(follower=account_rows[a], follower_email=account_rows[a].email, follower_name=account_rows[a].name,
+                 followed=account_rows[b], followed_email=account_rows[b].email, read=rng.random() < 0.5)
+        for a, b in unique_pairs(rng, follows, len(account_rows), len(account_rows), exclude_equal=True)
+    ], batch_size=batch_size)
+
+    # counters are derived from the rows, like after loaddata
+    like_counts = (LikedPost.objects.filter(post_id=OuterRef('id')).order_by().values('post_id')
+                   .annotate(total=Count('id')).values('total'))
+    Post.objects.update(likes=Coalesce(Subquery(like_counts), 0))
+    reconcile_account_counters()
+    rebuild_timelines()
+    update_trending()
+
+    return {
+        'accounts': Account.objects.count(),
+        'posts': Post.objects.count(),
+        'likes': LikedPost.objects.count(),
+        'comments': Comment.objects.count(),
+        'follows': Follower.objects.count(),
+        'timeline_entries': TimelineEntry.objects.count(),
+        'trending_posts': TrendingPost.objects.count(),
+    }
@@ -0,0 +1,193 @@
+"""
+Compare deleting a popular post and its poster's account through Django's collector and through post.deletion.
+
+A seeded database gets one popular post, liked by ``--popular-likes`` accounts and with ``--popular-comments``
+comments. Every run starts from a fresh copy of that database and reports its time, its queries, its transactions
+and the database time of its longest transaction, which is how long other writers wait behind it.
+
+collector runs the delete view as it was before post.deletion and Account.delete() for the account, set_based
+deletes the post in one transaction, batched deletes ``--batch-size`` rows per transaction. Django's collector only
+deletes without fetching the rows while no delete signal has a receiver, ``--delete-receiver`` connects one.
+
+Usage: python -m benchmarks.deletion [--accounts 20000] [--likes 100000] [--popular-likes 20000]
+                                     [--batch-size 1000] [--delete-receiver] [--output report.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import setup_django
+from benchmarks import dataset
+
+
+def add_popular_post(likes, comments):
+    from account.models import Account
+    from post.models import Post, LikedPost, Comment
+
+    poster = Account.objects.get(email=dataset.account_email(1))
+    post = Post.objects.create(title='Popular Post', content='Liked by everyone.', images='', poster=poster,
+                               poster_email=poster.email, poster_name=poster.name, channel='Soups')
+    likers = list(Account.objects.exclude(id=poster.id).order_by('id')[:likes])
+    LikedPost.objects.bulk_create([
+        LikedPost(liked_account=account, liked_account_email=account.email, liked_account_name=account.name,
+                  post=post, poster=poster, poster_email=poster.email) for account in likers
+    ], batch_size=dataset.batch_size)
+    Comment.objects.bulk_create([
+        Comment(post=post, poster=poster, poster_email=poster.email, commentator=likers[i % len(likers)],
+                commentator_email=likers[i % len(likers)].email, commentator_name=likers[i % len(likers)].name,
+                comment='So good') for i in range(comments)
+    ], batch_size=dataset.batch_size)
+    Post.objects.filter(id=post.id).update(likes=len(likers))
+    return post.id, poster.id
+
+
+def collector_post(post_id, account_id, batch_size):
+    from django.db import transaction
+    from django.db.models import F
+
+    from account.models import Account
+    from account.notifications import remove_unread
+    from post.models import Post, LikedPost, Comment
+
+    # the delete view before post.deletion
+    post = Post.objects.get(id=post_id)
+    likes = LikedPost.objects.filter(post_id=post_id, poster=account_id)
+    comments = Comment.objects.filter(post_id=post_id, poster=account_id)
+    with transaction.atomic():
+        remove_unread('comments', account_id, comments.filter(read=False).exclude(commentator=account_id).count())
+        remove_unread('likes', account_id, likes.filter(read=False).exclude(liked_account=account_id).count())
+        comments.delete()
+        deleted_likes, _ = likes.delete()
+        post.delete()
+        Account.objects.filter(id=account_id).update(likes_received_count=F('likes_received_count') - deleted_likes)
+
+
+def set_based_post(post_id, account_id, batch_size):
+    from post.deletion import delete_post_rows
+    from post.models import Post
+
+    delete_post_rows(Post.objects.filter(id=post_id))
+
+
+def batched_post(post_id, account_id, batch_size):
+    from post.deletion import delete_posts
+    from post.models import Post
+
+    delete_posts(Post.objects.filter(id=post_id), batch_size)
+
+
+def collector_account(post_id, account_id, batch_size):
+    from django.db import transaction
+
+    from account.models import Account
+
+    # leaves the counters of the other accounts stale
+    with transaction.atomic():
+        Account.objects.filter(id=account_id).delete()
+
+
+def batched_account(post_id, account_id, batch_size):
+    from account.deletion import delete_account
+    from account.models import Account
+
+    delete_account(Account.objects.get(id=account_id), batch_size)
+
+
+scenarios = {
+    'post:collector': collector_post,
+    'post:set_based': set_based_post,
+    'post:batched': batched_post,
+    'account:collector': collector_account,
+    'account:batched': batched_account,
+}
+
+
+def run_scenario(scenario, database, snapshot, post_id, account_id, batch_size):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    # every scenario deletes from the same rows
+    connection.close()
+    for suffix in ('-wal', '-shm'):
+        Path(database + suffix).unlink(missing_ok=True)
+    shutil.copyfile(snapshot, database)
+
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        scenario(post_id, account_id, batch_size)
+        seconds = time.perf_counter() - started
+
+    # database time between one BEGIN and the next
+    transactions = []
+    for query in queries.captured_queries:
+        if query['sql'].startswith('BEGIN'):
+            transactions.append(0.0)
+        elif transactions:
+            transactions[-1] += float(query['time'])
+    return {
+        'seconds': round(seconds, 3),
+        'queries': len(queries),
+        'transactions': len(transactions),
+        'max_transaction_ms': round(max(transactions, default=0) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=20000)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--likes', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=20000)
+    parser.add_argument('--follows', type=int, default=20000)
+    parser.add_argument('--popular-likes', type=int, default=20000, help='likes of the popular post, at most '
+                                                                         'accounts - 1')
+    parser.add_argument('--popular-comments', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per transaction of the batched runs')
+    parser.add_argument('--delete-receiver', action='store_true', help='connect a post_delete receiver, as audit '
+                                                                        'logs and cache invalidation apps do')
+    parser.add_argument('--scenarios', nargs='+', choices=list(scenarios), default=list(scenarios))
+    parser.add_argument('--output', help='also write the report to this file')
+    args = parser.parse_args()
+
+    directory = tempfile.TemporaryDirectory()
+    database = os.path.join(directory.name, 'benchmark.sqlite3')
+    snapshot = os.path.join(directory.name, 'snapshot.sqlite3')
+    os.environ['DATABASE_NAME'] = database
+
+    setup_django()
+    from django.core.management import call_command
+    from django.db import connection
+    from django.db.models.signals import post_delete
+
+    if args.delete_receiver:
+        post_delete.connect(lambda **kwargs: None, weak=False)
+    try:
+        call_command('migrate', verbosity=0)
+        counts = dataset.seed(args.accounts, args.posts, args.likes, args.comments, args.follows)
+        post_id, account_id = add_popular_post(args.popular_likes, args.popular_comments)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        connection.close()
+        shutil.copyfile(database, snapshot)
+
+        report = {
+            'config': {key: value for key, value in vars(args).items() if key != 'output'},
+            'dataset': counts,
+            'scenarios': {name: run_scenario(scenarios[name], database, snapshot, post_id, account_id,
+                                             args.batch_size) for name in args.scenarios},
+        }
+    finally:
+        directory.cleanup()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Compare the stdlib and orjson response encoders on a synthetic post feed.
+
+Usage: python -m benchmarks.json_encoding [--posts 5000] [--repeat 20]
+"""
+import argparse
+import datetime
+import json
+import timeit
+
+from benchmarks import setup_django
+
+
+def build_payload(posts):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        'code': 1,
+        'data': [{
+            'id': i,
+            'title': f'Recipe {i}',
+            'content': 'Slice, season and simmer. ' * 40,
+            'images': '',
+            'poster_email': f'user{i % 100}@gmail.com',
+            'poster_id': i % 100,
+            'poster_name': f'user{i % 100}',
+            'likes': i % 50,
+            'views': i % 500,
+            'channel': 'Chinese_Cuisine',
+            'create_datetime': now - datetime.timedelta(minutes=i),
+        } for i in range(posts)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from server.response_helper import json_encoders, orjson, format_datetime
+
+    payload = build_payload(args.posts)
+    # the rows of the formatters, their datetimes formatted while they are built
+    formatted = {'code': 1, 'data': [{**post, 'create_datetime': format_datetime(post['create_datetime'])}
+                                     for post in payload['data']]}
+    results = {'posts': args.posts, 'repeat': args.repeat, 'encoders': {}}
+    for name, (encode, _) in json_encoders.items():
+        if name == 'orjson' and orjson is None:
+            continue
+        results['encoders'][name] = {
+            'best_ms': round(min(timeit.repeat(lambda: encode(payload), number=1, repeat=args.repeat)) * 1000, 3),
+            'formatted_best_ms': round(
+                min(timeit.repeat(lambda: encode(formatted), number=1, repeat=args.repeat)) * 1000, 3),
+            'bytes': len(encode(payload)),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Measure the cost of password hashing, in process and as login throughput of a uvicorn server.
+
+For every PBKDF2 iteration count the hasher is timed on one thread, then the accounts get a hash of that cost and
+login is load tested. Each uvicorn worker verifies on ``--hash-workers`` threads, with the default of one thread a
+worker keeps at most one core busy, so the login throughput is divided by the cores the workers can use.
+
+Usage: python -m benchmarks.password_hashing [--iterations 260000 870000] [--accounts 100] [--requests 200]
+                                             [--workers 2] [--hash-workers 1] [--output report.json]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import setup_django
+from benchmarks import dataset
+from benchmarks.api_load import UvicornTarget, run_endpoint
+
+
+def time_hashing(count):
+    from django.contrib.auth.hashers import make_password
+
+    started = time.perf_counter()
+    for _ in range(count):
+        make_password(dataset.password)
+    seconds = (time.perf_counter() - started) / count
+    return {'hash_ms': round(seconds * 1000, 3), 'hashes_per_second_per_core': round(1 / seconds, 1)}
+
+
+def run_level(iterations, database, args):
+    from django.contrib.auth.hashers import make_password
+    from django.test.utils import override_settings
+
+    from account.models import Account
+
+    with override_settings(PASSWORD_PBKDF2_ITERATIONS=iterations):
+        result = time_hashing(args.hashes)
+        # every login verifies at the cost under test instead of upgrading the hash first
+        Account.objects.update(password=make_password(dataset.password))
+
+    os.environ['PASSWORD_PBKDF2_ITERATIONS'] = str(iterations)
+    payloads = [{'email': dataset.account_email(i % args.accounts + 1), 'password': dataset.password}
+                for i in range(args.requests)]
+    with UvicornTarget(database, args.workers) as target:
+        login = run_endpoint(target, '/api/account/login', payloads, args.concurrency)
+    cores = min(args.workers * args.hash_workers, os.cpu_count() or 1)
+    login['throughput_per_core_rps'] = round(login['throughput_rps'] / cores, 1)
+    return {'iterations': iterations, **result, 'login': login}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', nargs='+', type=int, help='PBKDF2 iterations, PASSWORD_PBKDF2_ITERATIONS '
+                                                                  'by default')
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--hashes', type=int, default=20, help='hashes timed in process per iteration count')
+    parser.add_argument('--requests', type=int, default=200, help='logins per iteration count')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2, help='uvicorn worker processes')
+    parser.add_argument('--hash-workers', type=int, default=1, help='hashing threads per worker process')
+    parser.add_argument('--output', help='also write the report to this file')
+    args = parser.parse_args()
+
+    directory = tempfile.TemporaryDirectory()
+    database = os.path.join(directory.name, 'benchmark.sqlite3')
+    os.environ['DATABASE_NAME'] = database
+    os.environ['PASSWORD_HASH_WORKERS'] = str(args.hash_workers)
+
+    setup_django()
+    from django.conf import settings
+    from django.core.management import call_command
+
+    try:
+        call_command('migrate', verbosity=0)
+        counts = dataset.seed(args.accounts, posts=0, likes=0, comments=0, follows=0)
+
+        report = {
+            'config': {key: value for key, value in vars(args).items() if key != 'output'},
+            'dataset': counts,
+            'cpu_count': os.cpu_count(),
+            'levels': [run_level(iterations, database, args)
+                       for iterations in args.iterations or [settings.PASSWORD_PBKDF2_ITERATIONS]],
+        }
+    finally:
+        directory.cleanup()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def restore_search_index(sender, using, **kwargs):
+    from post.search import ensure_search_index
+    ensure_search_index(using)
 
 
 class PostConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'post'
+
+    def ready(self):
+        # migrations that rebuild post_post on SQLite drop the search index triggers
+        post_migrate.connect(restore_search_index, sender=self)
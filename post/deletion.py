@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from account.models import Account
+from post.models import Post, LikedPost, Comment, TimelineEntry, TrendingPost
+
+
+def raw_delete(rows):
+    # one DELETE ... WHERE, QuerySet.delete would fetch the rows and their cascades for the deletion signals
+    return rows._raw_delete(rows.db)
+
+
+def count_in(rows, field, *conditions):
+    # correlated COUNT(*) of ``rows`` pointing at the outer row through ``field``
+    rows = (rows.filter(*conditions, **{field: OuterRef('id')}).order_by().values(field)
+            .annotate(total=Count('id')).values('total'))
+    return Coalesce(Subquery(rows), 0)
+
+
+def forget_likes(likes):
+    # take the likes off the counters of their posts and posters, own likes are never notified
+    Post.objects.filter(id__in=likes.values('post_id')).update(likes=F('likes') - count_in(likes, 'post'))
+    Account.objects.filter(id__in=likes.values('poster_id')).update(
+        likes_received_count=F('likes_received_count') - count_in(likes, 'poster'),
+        unread_likes_count=F('unread_likes_count') - count_in(likes, 'poster', Q(read=False),
+                                                              ~Q(liked_account=F('poster'))))
+
+
+def forget_comments(comments):
+    Account.objects.filter(id__in=comments.values('poster_id')).update(
+        unread_comments_count=F('unread_comments_count') - count_in(comments, 'poster', Q(read=False),
+                                                                    ~Q(commentator=F('poster'))))
+
+
+def delete_in_batches(rows, forget=None, batch_size=None):
+    """
+    Delete ``rows`` in id order, ``batch_size`` rows per transaction, so writers are never blocked for long.
+
+    ``forget(batch)`` runs in the transaction of each batch before it is deleted, to update the counters the rows
+    were counted in. Returns the number of deleted rows.
+    """
+    batch_size = batch_size or settings.DELETE_BATCH_SIZE
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(rows.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            batch = rows.model.objects.filter(id__in=ids)
+            if forget is not None:
+                forget(batch)
+            deleted += raw_delete(batch)
+
+
+def delete_post_rows(posts):
+    """
+    Delete ``posts`` with their likes, comments and timeline entries in set based statements, in one transaction.
+
+    Returns the number of deleted posts.
+    """
+    likes = LikedPost.objects.filter(post__in=posts)
+    comments = Comment.objects.filter(post__in=posts)
+    with transaction.atomic():
+        forget_likes(likes)
+        forget_comments(comments)
+        raw_delete(likes)
+        raw_delete(comments)
+        raw_delete(TimelineEntry.objects.filter(post__in=posts))
+        raw_delete(TrendingPost.objects.filter(post__in=posts))
+        return raw_delete(posts)
+
+
+def delete_posts(posts, batch_size=None):
+    """
+    Delete ``posts`` ``batch_size`` posts at a time, the likes, comments and timeline entries of every batch are
+    deleted first in batches of their own.
+
+    Returns the number of deleted posts.
+    """
+    batch_size = batch_size or settings.DELETE_BATCH_SIZE
+    deleted = 0
+    while True:
+        post_ids = list(posts.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not post_ids:
+            return deleted
+        delete_in_batches(LikedPost.objects.filter(post_id__in=post_ids), forget_likes, batch_size)
+        delete_in_batches(Comment.objects.filter(post_id__in=post_ids), forget_comments, batch_size)
+        delete_in_batches(TimelineEntry.objects.filter(post_id__in=post_ids), batch_size=batch_size)
+        # likes and comments added since their batches go with the posts
+        deleted += delete_post_rows(Post.objects.filter(id__in=post_ids))
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+
+from server.cache import LRUCache, TieredCache, aget_shared
+
+# serialized feed pages, keyed by scope generation so a bump makes old pages unreachable
+feed_cache = TieredCache(settings.FEED_CACHE_ALIAS, settings.FEED_CACHE_LOCAL_SIZE, settings.FEED_CACHE_TIMEOUT)
+# scope -> generation, read from the shared cache at most every FEED_CACHE_GENERATION_TTL seconds so a page hit stays
+# in the process, bumps of this worker are seen at once and bumps of the others within that time
+_generations = LRUCache(settings.FEED_CACHE_LOCAL_SIZE, settings.FEED_CACHE_GENERATION_TTL)
+
+
+def feed_scope(query_type, email=None):
+    # liked feeds are per viewer and change whenever any liked post changes, so they are not cached
+    if query_type == 'like':
+        return None
+    if query_type == 'publish':
+        return f'publish:{email}'
+    return query_type
+
+
+def post_scopes(channel, poster_email):
+    # every cached feed a post can appear in
+    return ['All', channel, f'publish:{poster_email}']
+
+
+def _generation_key(scope):
+    return f'feed:generation:{scope}'
+
+
+def _generation(scope):
+    generation = _generations.get(scope)
+    if generation is not None:
+        return generation
+    shared = feed_cache.shared
+    key = _generation_key(scope)
+    generation = shared.get(key)
+    if generation is None:
+        # start from the clock so an evicted counter never resurrects old pages
+        shared.add(key, time.time_ns(), None)
+        generation = shared.get(key)
+    _generations.set(scope, generation)
+    return generation
+
+
+async def _ageneration(scope):
+    generation = _generations.get(scope)
+    if generation is not None:
+        return generation
+    shared = feed_cache.shared
+    key = _generation_key(scope)
+    generation = await aget_shared(shared, key)
+    if generation is None:
+        await shared.aadd(key, time.time_ns(), None)
+        generation = await aget_shared(shared, key)
+    _generations.set(scope, generation)
+    return generation
+
+
+def _params_digest(params):
+    return hashlib.md5(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _page_key(scope, params):
+    return f'feed:{scope}:{_generation(scope)}:{_params_digest(params)}'
+
+
+async def _apage_key(scope, params):
+    return f'feed:{scope}:{await _ageneration(scope)}:{_params_digest(params)}'
+
+
+def get_feed_page(scope, params):
+    """
+    Return ``(key, page)``, the page is None on a miss and should be stored under ``key`` with ``set_feed_page``.
+
+    The key is taken before the feed is queried, a bump while the query runs leaves the page in the old generation.
+    """
+    if scope is None:
+        return None, None
+    key = _page_key(scope, params)
+    return key, feed_cache.get(key)
+
+
+def set_feed_page(key, data):
+    if key is not None:
+        feed_cache.set(key, data)
+
+
+async def aget_feed_page(scope, params):
+    if scope is None:
+        return None, None
+    key = await _apage_key(scope, params)
+    return key, await feed_cache.aget(key)
+
+
+async def aset_feed_page(key, data):
+    if key is not None:
+        await feed_cache.aset(key, data)
+
+
+def invalidate_feeds(scopes):
+    shared = feed_cache.shared
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            generation = shared.incr(key)
+        except ValueError:
+            generation = time.time_ns()
+            shared.set(key, generation, None)
+        _generations.set(scope, generation)
+
+
+async def ainvalidate_feeds(scopes):
+    shared = feed_cache.shared
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            generation = await shared.aincr(key)
+        except ValueError:
+            generation = time.time_ns()
+            await shared.aset(key, generation, None)
+        _generations.set(scope, generation)
+
+
+def clear_feed_cache():
+    _generations.clear()
+    feed_cache.clear()
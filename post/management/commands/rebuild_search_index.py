@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from post.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of posts in bulk'
+
+    def handle(self, *args, **options):
+        if rebuild_search_index():
+            self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
+        else:
+            self.stdout.write('Search index is only available on SQLite, nothing to rebuild.')
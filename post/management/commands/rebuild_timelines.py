@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from account.models import Account
+from post.timeline import rebuild_timeline, rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the following feeds from the follows, after follows were changed outside the API or '
+            'TIMELINE_FANOUT_MAX_FOLLOWERS changed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='only rebuild the timeline of this account')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['email'] is None:
+            rebuilt = rebuild_timelines(options['batch_size'])
+        else:
+            try:
+                rebuild_timeline(Account.objects.get(email=options['email']).id)
+            except Account.DoesNotExist:
+                raise CommandError(f'No account with the email {options["email"]}.')
+            rebuilt = 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timelines.'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from post.feed_cache import invalidate_feeds
+from post.models import TrendingPost
+from post.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = 'Score the recent posts for the trending rankings, with --loop keep scoring periodically'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='keep scoring until interrupted')
+        parser.add_argument('--interval', type=float, default=300, help='seconds between two scorings')
+
+    def handle(self, *args, **options):
+        while True:
+            scored, removed = update_trending(options['batch_size'])
+            # cached ranking pages are kept with the feeds of their channel
+            channels = TrendingPost.objects.order_by().values_list('channel', flat=True).distinct()
+            invalidate_feeds(['All', *channels])
+            self.stdout.write(self.style.SUCCESS(f'Scored {scored} posts, removed {removed}.'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:35
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    LikedPost = apps.get_model('post', 'LikedPost')
+    Post = apps.get_model('post', 'Post')
+
+    # keep the first like of every (post, account) pair
+    duplicates = (LikedPost.objects.values('post_id', 'liked_account_email')
+                  .annotate(first_id=Min('id'), total=Count('id')).filter(total__gt=1))
+    for duplicate in duplicates:
+        LikedPost.objects.filter(post_id=duplicate['post_id'],
+                                 liked_account_email=duplicate['liked_account_email']).exclude(
+            id=duplicate['first_id']).delete()
+
+    # counters drifted by racing read-modify-write updates, recount them from the like records
+    like_counts = (LikedPost.objects.filter(post_id=OuterRef('id')).order_by().values('post_id')
+                   .annotate(total=Count('id')).values('total'))
+    Post.objects.update(likes=Coalesce(Subquery(like_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='likedpost',
+            constraint=models.UniqueConstraint(fields=('post', 'liked_account_email'), name='unique_liked_post'),
+        ),
+    ]
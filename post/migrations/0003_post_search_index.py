@@ -0,0 +1,64 @@
+from django.db import migrations
+
+create_statements = [
+    # external content table, the text itself stays in post_post
+    """
+    CREATE VIRTUAL TABLE post_post_search USING fts5(
+        title, content, content='post_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER post_post_search_insert AFTER INSERT ON post_post BEGIN
+        INSERT INTO post_post_search(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER post_post_search_delete AFTER DELETE ON post_post BEGIN
+        INSERT INTO post_post_search(post_post_search, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    # likes and views updates do not touch the index
+    """
+    CREATE TRIGGER post_post_search_update AFTER UPDATE OF title, content ON post_post BEGIN
+        INSERT INTO post_post_search(post_post_search, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO post_post_search(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    "INSERT INTO post_post_search(post_post_search) VALUES('rebuild')",
+]
+
+drop_statements = [
+    'DROP TRIGGER IF EXISTS post_post_search_update',
+    'DROP TRIGGER IF EXISTS post_post_search_delete',
+    'DROP TRIGGER IF EXISTS post_post_search_insert',
+    'DROP TABLE IF EXISTS post_post_search',
+]
+
+
+def create_search_index(apps, schema_editor):
+    # fts5 is sqlite only, other databases fall back to icontains search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in create_statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in drop_statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0002_liked_post_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0003_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('read', False)), fields=['poster_email', 'id'], name='comment_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='likedpost',
+            index=models.Index(condition=models.Q(('read', False)), fields=['poster_email', 'id'], name='likedpost_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def drop_single_column_indexes(table, columns):
+    # drop the indexes in place, altering db_index would make sqlite rebuild the whole table
+    def drop(apps, schema_editor):
+        connection = schema_editor.connection
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        for name, info in constraints.items():
+            if (info['index'] and not info['unique'] and not info['primary_key']
+                    and len(info['columns']) == 1 and info['columns'][0] in columns):
+                schema_editor.execute(f'DROP INDEX {schema_editor.quote_name(name)}')
+
+    return migrations.RunPython(drop, migrations.RunPython.noop)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0004_unread_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                drop_single_column_indexes('post_post', ['title', 'poster_email', 'poster_id', 'channel']),
+                drop_single_column_indexes('post_likedpost', ['liked_account_email', 'post_id']),
+                drop_single_column_indexes('post_comment', ['poster_email', 'commentator_email', 'commentator_id']),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='comment',
+                    name='commentator_email',
+                    field=models.EmailField(max_length=254),
+                ),
+                migrations.AlterField(
+                    model_name='comment',
+                    name='commentator_id',
+                    field=models.BigIntegerField(),
+                ),
+                migrations.AlterField(
+                    model_name='comment',
+                    name='poster_email',
+                    field=models.EmailField(max_length=254),
+                ),
+                migrations.AlterField(
+                    model_name='likedpost',
+                    name='liked_account_email',
+                    field=models.EmailField(max_length=254),
+                ),
+                migrations.AlterField(
+                    model_name='likedpost',
+                    name='post',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='post.post'),
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='channel',
+                    field=models.CharField(max_length=100),
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='poster_email',
+                    field=models.EmailField(max_length=254),
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='poster_id',
+                    field=models.BigIntegerField(),
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='title',
+                    field=models.CharField(max_length=200),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='likedpost',
+            index=models.Index(fields=['liked_account_email', 'post'], name='likedpost_account_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['channel', '-id'], name='post_channel_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['poster_email', '-id'], name='post_poster_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_foreign_key(model_name, field_name):
+    # adopt an existing id column as a foreign key, sqlite can only add the constraint by rebuilding the table
+    def add(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            return
+        model = apps.get_model('post', model_name)
+        field = model._meta.get_field(field_name)
+        schema_editor.execute(schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
+
+    return migrations.RunPython(add, migrations.RunPython.noop)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0006_account_relations'),
+        ('post', '0005_query_shape_indexes'),
+    ]
+
+    operations = [
+        # poster_id and commentator_id already hold account ids, only the model state changes
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='post',
+                    name='poster_id',
+                ),
+                migrations.AddField(
+                    model_name='post',
+                    name='poster',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='posts', to='account.account'),
+                ),
+                migrations.RemoveField(
+                    model_name='comment',
+                    name='commentator_id',
+                ),
+                migrations.AddField(
+                    model_name='comment',
+                    name='commentator',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='account.account'),
+                ),
+            ],
+        ),
+        add_foreign_key('post', 'poster'),
+        add_foreign_key('comment', 'commentator'),
+        # nullable until backfilled, so they are added without rewriting the tables
+        migrations.AddField(
+            model_name='likedpost',
+            name='liked_account',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='account.account'),
+        ),
+        migrations.AddField(
+            model_name='likedpost',
+            name='poster',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_likes', to='account.account'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='poster',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='received_comments', to='account.account'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def remove_orphans(apps, schema_editor):
+    # rows whose email matches no account can not be linked, nothing reaches them anymore
+    apps.get_model('post', 'LikedPost').objects.filter(liked_account__isnull=True).delete()
+    apps.get_model('post', 'LikedPost').objects.filter(poster__isnull=True).delete()
+    apps.get_model('post', 'Comment').objects.filter(poster__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0007_backfill_account_relations'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_orphans, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_poster_feed_idx',
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['poster', '-id'], name='post_poster_feed_idx'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='likedpost',
+            name='unique_liked_post',
+        ),
+        migrations.RemoveIndex(
+            model_name='likedpost',
+            name='likedpost_account_feed_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='likedpost',
+            name='likedpost_unread_idx',
+        ),
+        migrations.AlterField(
+            model_name='likedpost',
+            name='liked_account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='account.account'),
+        ),
+        migrations.AlterField(
+            model_name='likedpost',
+            name='poster',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_likes', to='account.account'),
+        ),
+        migrations.AlterField(
+            model_name='likedpost',
+            name='poster_email',
+            field=models.EmailField(max_length=254),
+        ),
+        migrations.AddConstraint(
+            model_name='likedpost',
+            constraint=models.UniqueConstraint(fields=('post', 'liked_account'), name='unique_liked_post'),
+        ),
+        migrations.AddIndex(
+            model_name='likedpost',
+            index=models.Index(fields=['liked_account', 'post'], name='likedpost_account_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='likedpost',
+            index=models.Index(condition=models.Q(('read', False)), fields=['poster', 'id'], name='likedpost_unread_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_unread_idx',
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='poster',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='received_comments', to='account.account'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('read', False)), fields=['poster', 'id'], name='comment_unread_idx'),
+        ),
+    ]
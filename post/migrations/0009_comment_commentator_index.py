@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0008_account_relation_constraints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['commentator', 'id'], name='comment_commentator_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0010_tag_legacy_password_hashes'),
+        ('post', '0009_comment_commentator_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='account.account')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='post.post')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('account', 'post'), name='unique_timeline_entry')],
+            },
+        ),
+    ]
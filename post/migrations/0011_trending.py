@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post', '0010_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingPost',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='post.post')),
+                ('channel', models.CharField(max_length=100)),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['score', 'post'], name='trendingpost_score_idx'), models.Index(fields=['channel', 'score', 'post'], name='trendingpost_channel_idx')],
+            },
+        ),
+    ]
@@ -1,35 +1,108 @@
 from django.db import models
 from django.utils.timezone import now
 
+from account.models import Account
+
 # Create your models here.
 class Post(models.Model):
-    title = models.CharField(max_length=200, db_index=True)
+    title = models.CharField(max_length=200)
     content = models.TextField()
     images = models.CharField(max_length=2000)
-    poster_email = models.EmailField(db_index=True)
-    poster_id = models.BigIntegerField(db_index=True)
+    # indexed as the prefix of post_poster_feed_idx
+    poster = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='posts', db_index=False)
+    poster_email = models.EmailField()
     poster_name = models.CharField(max_length=100)
     likes = models.IntegerField(default=0)
     views = models.IntegerField(default=0)
-    channel = models.CharField(max_length=100, db_index=True)
+    channel = models.CharField(max_length=100)
     create_datetime = models.DateTimeField(default=now, blank=True, editable=False)
 
+    class Meta:
+        indexes = [
+            # channel and profile feeds, newest first
+            models.Index(fields=['channel', '-id'], name='post_channel_feed_idx'),
+            models.Index(fields=['poster', '-id'], name='post_poster_feed_idx'),
+        ]
+
 
 class LikedPost(models.Model):
-    liked_account_email = models.EmailField(db_index=True)
+    # indexed as the prefix of likedpost_account_feed_idx
+    liked_account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='likes', db_index=False)
+    liked_account_email = models.EmailField()
     liked_account_name = models.CharField(max_length=100)
-    post = models.ForeignKey(Post, on_delete=models.CASCADE)
-    poster_email = models.EmailField(db_index=True)
+    # indexed as the prefix of unique_liked_post
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, db_index=False)
+    poster = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='received_likes')
+    poster_email = models.EmailField()
     read = models.BooleanField(default=False)
     create_datetime = models.DateTimeField(default=now, blank=True, editable=False)
 
+    class Meta:
+        constraints = [
+            # an account can like a post only once
+            models.UniqueConstraint(fields=['post', 'liked_account'], name='unique_liked_post'),
+        ]
+        indexes = [
+            # liked feed of an account, covers the post ids
+            models.Index(fields=['liked_account', 'post'], name='likedpost_account_feed_idx'),
+            # unread notifications of a poster after a watermark, only unread rows are indexed
+            models.Index(fields=['poster', 'id'], condition=models.Q(read=False), name='likedpost_unread_idx'),
+        ]
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
-    poster_email = models.EmailField(db_index=True)
-    commentator_email = models.EmailField(db_index=True)
-    commentator_id = models.BigIntegerField(db_index=True)
+    # comments of a poster are only looked up while unread, through comment_unread_idx
+    poster = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='received_comments', db_index=False)
+    poster_email = models.EmailField()
+    # indexed as the prefix of comment_commentator_idx
+    commentator = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='comments', db_index=False)
+    commentator_email = models.EmailField()
     commentator_name = models.CharField(max_length=100)
     comment = models.TextField()
     read = models.BooleanField(default=False)
     create_datetime = models.DateTimeField(default=now, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # unread notifications of a poster after a watermark, only unread rows are indexed
+            models.Index(fields=['poster', 'id'], condition=models.Q(read=False), name='comment_unread_idx'),
+            # comments of an account, deleted in id batches with the account
+            models.Index(fields=['commentator', 'id'], name='comment_commentator_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """
+    A post in the following feed of an account, written when the post is published or the poster followed.
+
+    Posts of accounts with more than ``TIMELINE_FANOUT_MAX_FOLLOWERS`` followers are read from their profile feed
+    instead, see post.timeline.
+    """
+    # indexed as the prefix of unique_timeline_entry
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='timeline', db_index=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+
+    class Meta:
+        constraints = [
+            # following feed of an account, newest post first
+            models.UniqueConstraint(fields=['account', 'post'], name='unique_timeline_entry'),
+        ]
+
+
+class TrendingPost(models.Model):
+    """
+    Popularity score of a recent post, rewritten by the update_trending command, see post.trending.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    # copied from the post, so a channel ranking is one index range
+    channel = models.CharField(max_length=100)
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            # rankings read backwards, highest score first and the newest post first among equal scores, the post
+            # is a column of its own as a bigint primary key is not the rowid
+            models.Index(fields=['score', 'post'], name='trendingpost_score_idx'),
+            models.Index(fields=['channel', 'score', 'post'], name='trendingpost_channel_idx'),
+        ]
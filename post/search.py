@@ -0,0 +1,114 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+
+from post.models import Post
+
+# fts5 index over post title and content, kept in sync by triggers on post_post
+search_table = 'post_post_search'
+
+# title matches rank above content matches
+title_weight = 10.0
+content_weight = 1.0
+
+
+# keep the index in sync with post_post, likes and views updates do not touch it
+sync_triggers = {
+    'post_post_search_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS post_post_search_insert AFTER INSERT ON post_post BEGIN
+            INSERT INTO {search_table}(rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+    """,
+    'post_post_search_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS post_post_search_delete AFTER DELETE ON post_post BEGIN
+            INSERT INTO {search_table}({search_table}, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+        END
+    """,
+    'post_post_search_update': f"""
+        CREATE TRIGGER IF NOT EXISTS post_post_search_update AFTER UPDATE OF title, content ON post_post BEGIN
+            INSERT INTO {search_table}({search_table}, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO {search_table}(rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+    """,
+}
+
+
+def search_index_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(keyword):
+    # every word must match, as a prefix of an indexed token
+    words = re.findall(r'\w+', keyword)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_post_ids(keyword, channel=None, limit=20):
+    """
+    Return the ids of the posts matching ``keyword``, best match first.
+    """
+    match_query = build_match_query(keyword)
+    if not match_query:
+        return []
+
+    if not search_index_available():
+        # no fts index on this database, fall back to a table scan
+        words = re.findall(r'\w+', keyword)
+        posts = Post.objects.all()
+        for word in words:
+            posts = posts.filter(Q(title__icontains=word) | Q(content__icontains=word))
+        if channel is not None:
+            posts = posts.filter(channel=channel)
+        return list(posts.order_by('-id').values_list('id', flat=True)[:limit])
+
+    sql = f'''
+        SELECT post.id FROM {search_table}
+        JOIN {Post._meta.db_table} post ON post.id = {search_table}.rowid
+        WHERE {search_table} MATCH %s
+    '''
+    params = [match_query]
+    if channel is not None:
+        sql += ' AND post.channel = %s'
+        params.append(channel)
+    sql += f' ORDER BY bm25({search_table}, %s, %s) LIMIT %s'
+    params += [title_weight, content_weight, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def rebuild_search_index():
+    if not search_index_available():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {search_table}({search_table}) VALUES('rebuild')")
+        cursor.execute(f"INSERT INTO {search_table}({search_table}) VALUES('optimize')")
+    return True
+
+
+def ensure_search_index(using='default'):
+    """
+    Recreate the sync triggers when a migration rebuilt post_post, SQLite drops them with the old table.
+
+    The index may have missed writes while the triggers were gone, so it is rebuilt in that case.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s", [search_table])
+        if cursor.fetchone() is None:
+            # the search index migration has not run yet
+            return False
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'post_post'")
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing.issuperset(sync_triggers):
+            return False
+        for statement in sync_triggers.values():
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {search_table}({search_table}) VALUES('rebuild')")
+    return True
@@ -1,32 +1,49 @@
-from django.test import TestCase
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 
 from account.models import Account, AccountAccessToken, AccountPasscode, Follower
-from post.models import Post, Comment
+from post import views as post_views
+from post import feed_cache as feed_cache_module
+from post.feed_cache import clear_feed_cache, feed_cache, invalidate_feeds
+from post.models import Post, Comment, LikedPost, TimelineEntry, TrendingPost
+from post.trending import trending_score
+from post.view_counts import view_counter
+from server.auth import account_cache
+from server.testcases import QueryCountTestCase
 
 
 # Create your tests here.
 class PostViewTestCase(TestCase):
     def setUp(self):
-        Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i',
-                               password='7fcf4ba391c48784edde599889d6e3f1e47a27db36ecc050cc92f259bfac38afad2c68a1ae804d77075e8fb722503f3eca2b2c1006ee6f6c7b7628cb45fffd1d')
-        Account.objects.create(email='aaaa@gmail.com', name='aaaa',
-                               password='7fcf4ba391c48784edde599889d6e3f1e47a27db36ecc050cc92f259bfac38afad2c68a1ae804d77075e8fb722503f3eca2b2c1006ee6f6c7b7628cb45fffd1d')
-        AccountAccessToken.objects.create(account_email='xi4f3i@gmail.com', access_token='123456')
+        clear_feed_cache()
+        account_cache.clear()
+        account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i',
+                                         password='unsalted_sha512$$7fcf4ba391c48784edde599889d6e3f1e47a27db36ecc050cc92f259bfac38afad2c68a1ae804d77075e8fb722503f3eca2b2c1006ee6f6c7b7628cb45fffd1d')
+        self.other = Account.objects.create(email='aaaa@gmail.com', name='aaaa',
+                                            password='unsalted_sha512$$7fcf4ba391c48784edde599889d6e3f1e47a27db36ecc050cc92f259bfac38afad2c68a1ae804d77075e8fb722503f3eca2b2c1006ee6f6c7b7628cb45fffd1d')
+        AccountAccessToken.objects.create(account=account, account_email='xi4f3i@gmail.com', access_token='123456')
         AccountPasscode.objects.create(account_email='xi4f3i@gmail.com', passcode='123456')
-        Follower.objects.create(follower_email='xi4f3i@gmail.com', follower_name='xi4f3i', follower_id=1,
-                                followed_email='<EMAIL>')
-        Post.objects.create(title='Post Title', content='Post Content', poster_email='xi4f3i@gmail.com', poster_id=1,
-                            poster_name='xi4f3i', likes=0, channel='Western_Cuisine')
+        Follower.objects.create(follower=account, follower_email='xi4f3i@gmail.com', follower_name='xi4f3i',
+                                followed=self.other, followed_email='aaaa@gmail.com')
+        Post.objects.create(title='Post Title', content='Post Content', poster_email='xi4f3i@gmail.com',
+                            poster=account, poster_name='xi4f3i', likes=0, channel='Western_Cuisine')
         Post.objects.create(title='Post Title 2', content='Post Content 2', poster_email='xi4f3i@gmail.com',
-                            poster_id=1, poster_name='xi4f3i', likes=0, channel='Western_Cuisine')
-        Comment.objects.create(post=Post.objects.get(id=1), poster_email='xi4f3i@gmail.com',
-                               commentator_email='aaaa@gmail.com', commentator_id=2, commentator_name='aaaa',
+                            poster=account, poster_name='xi4f3i', likes=0, channel='Western_Cuisine')
+        Comment.objects.create(post=Post.objects.get(id=1), poster=account, poster_email='xi4f3i@gmail.com',
+                               commentator=self.other, commentator_email='aaaa@gmail.com', commentator_name='aaaa',
                                comment='aaaa comment 1')
-        Comment.objects.create(post=Post.objects.get(id=1), poster_email='xi4f3i@gmail.com',
-                               commentator_email='aaaa@gmail.com', commentator_id=2, commentator_name='aaaa',
+        Comment.objects.create(post=Post.objects.get(id=1), poster=account, poster_email='xi4f3i@gmail.com',
+                               commentator=self.other, commentator_email='aaaa@gmail.com', commentator_name='aaaa',
                                comment='aaaa comment 2')
-        Comment.objects.create(post=Post.objects.get(id=1), poster_email='xi4f3i@gmail.com',
-                               commentator_email='aaaa@gmail.com', commentator_id=2, commentator_name='aaaa',
+        Comment.objects.create(post=Post.objects.get(id=1), poster=account, poster_email='xi4f3i@gmail.com',
+                               commentator=self.other, commentator_email='aaaa@gmail.com', commentator_name='aaaa',
                                comment='aaaa comment 3')
 
     def test_query(self):
@@ -62,6 +79,12 @@ class PostViewTestCase(TestCase):
         self.assertEqual(response_data["code"], 1)
         self.assertEqual(len(response_data["data"]), 1)
 
+    def test_delete_likes_counter(self):
+        self.client.post('/api/post/like', {'id': 1, 'access_token': '123456'}, content_type="application/json")
+        self.assertEqual(Account.objects.get(email='xi4f3i@gmail.com').likes_received_count, 1)
+        self.client.post('/api/post/delete', {'id': 1, 'access_token': '123456'}, content_type="application/json")
+        self.assertEqual(Account.objects.get(email='xi4f3i@gmail.com').likes_received_count, 0)
+
     def test_delete(self):
         response = self.client.post('/api/post/delete',{'id': 1, 'access_token': '123456'},
                                     content_type="application/json")
@@ -69,3 +92,506 @@ class PostViewTestCase(TestCase):
         response_data = response.json()
         self.assertEqual(response_data["code"], 1)
         self.assertEqual(response_data["data"], True)
+
+    def test_delete_cascade(self):
+        self.client.post('/api/post/like', {'id': 1, 'access_token': '123456'}, content_type="application/json")
+        LikedPost.objects.create(liked_account=self.other, liked_account_email='aaaa@gmail.com',
+                                 liked_account_name='aaaa', post_id=1, poster_id=1, poster_email='xi4f3i@gmail.com')
+        account = Account.objects.get(email='xi4f3i@gmail.com')
+        account.unread_comments_count = 3
+        account.unread_likes_count = 1
+        account.likes_received_count = 2
+        account.save()
+
+        response = self.client.post('/api/post/delete', {'id': 1, 'access_token': '123456'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["code"], 1)
+        self.assertFalse(LikedPost.objects.filter(post_id=1).exists())
+        self.assertFalse(Comment.objects.filter(post_id=1).exists())
+        account.refresh_from_db()
+        self.assertEqual((account.unread_comments_count, account.unread_likes_count, account.likes_received_count),
+                         (0, 0, 0))
+
+    @override_settings(DELETE_BATCH_SIZE=1)
+    def test_delete_all(self):
+        post = Post.objects.get(id=2)
+        LikedPost.objects.create(liked_account=self.other, liked_account_email='aaaa@gmail.com',
+                                 liked_account_name='aaaa', post=post, poster_id=post.poster_id,
+                                 poster_email='xi4f3i@gmail.com')
+        response = self.client.post('/api/post/delete_all', {'access_token': '123456'},
+                                    content_type="application/json")
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 1)
+        self.assertEqual(response_data["data"], 2)
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(LikedPost.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+
+        response = self.client.post('/api/post/query', {'type': 'All'}, content_type="application/json")
+        self.assertEqual(response.json()["data"], [])
+
+    def test_query_paginated(self):
+        response = self.client.post('/api/post/query', {'type': 'All', 'limit': 1},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 1)
+        self.assertEqual(len(response_data["data"]["posts"]), 1)
+        self.assertEqual(response_data["data"]["posts"][0]["id"], 2)
+        self.assertIsNotNone(response_data["data"]["next_cursor"])
+
+        response = self.client.post('/api/post/query',
+                                    {'type': 'All', 'limit': 1, 'cursor': response_data["data"]["next_cursor"]},
+                                    content_type="application/json")
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 1)
+        self.assertEqual(response_data["data"]["posts"][0]["id"], 1)
+        self.assertIsNone(response_data["data"]["next_cursor"])
+
+    def test_query_paginated_liked(self):
+        post = Post.objects.get(id=1)
+        LikedPost.objects.create(liked_account=self.other, liked_account_email='aaaa@gmail.com',
+                                 liked_account_name='aaaa', post=post, poster_id=post.poster_id,
+                                 poster_email='xi4f3i@gmail.com')
+        response = self.client.post('/api/post/query', {'type': 'like', 'email': 'aaaa@gmail.com', 'limit': 10},
+                                    content_type="application/json")
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 1)
+        self.assertEqual([post["id"] for post in response_data["data"]["posts"]], [1])
+        self.assertIsNone(response_data["data"]["next_cursor"])
+
+    def test_query_invalid_cursor(self):
+        response = self.client.post('/api/post/query', {'type': 'All', 'cursor': 'not-a-cursor'},
+                                    content_type="application/json")
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 0)
+        self.assertEqual(response_data["message"], 'Invalid cursor!')
+
+    def test_query_summary(self):
+        response = self.client.post('/api/post/query', {'type': 'All', 'projection': 'summary'},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 1)
+        self.assertEqual(len(response_data["data"]), 2)
+        self.assertNotIn("content", response_data["data"][0])
+        self.assertEqual(response_data["data"][0]["excerpt"], 'Post Content 2')
+
+    def test_detail(self):
+        response = self.client.post('/api/post/detail', {'id': 1},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 1)
+        self.assertEqual(response_data["data"]["content"], 'Post Content')
+
+    def test_query_cached(self):
+        self.client.post('/api/post/query', {'type': 'Western_Cuisine'}, content_type="application/json")
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/post/query', {'type': 'Western_Cuisine'},
+                                        content_type="application/json")
+        self.assertEqual(len(response.json()["data"]), 2)
+
+    def test_query_cache_invalidated(self):
+        self.client.post('/api/post/query', {'type': 'Western_Cuisine'}, content_type="application/json")
+        self.client.post('/api/post/publish',
+                         {'access_token': '123456', 'title': 'Post Title 3', 'content': 'Post Content 3',
+                          'channel': 'Western_Cuisine'},
+                         content_type="application/json")
+        response = self.client.post('/api/post/query', {'type': 'Western_Cuisine'},
+                                    content_type="application/json")
+        self.assertEqual(len(response.json()["data"]), 3)
+
+        self.client.post('/api/post/like', {'id': 3, 'access_token': '123456'}, content_type="application/json")
+        response = self.client.post('/api/post/query', {'type': 'Western_Cuisine'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["data"][0]["likes"], 1)
+
+    async def test_query_cache_hit_stays_in_process(self):
+        await self.async_client.post('/api/post/query', {'type': 'Western_Cuisine'}, content_type="application/json")
+        shared = type(feed_cache.shared)
+        with mock.patch.object(shared, 'get', side_effect=AssertionError), \
+                mock.patch.object(shared, 'aget', side_effect=AssertionError):
+            response = await self.async_client.post('/api/post/query', {'type': 'Western_Cuisine'},
+                                                    content_type="application/json")
+        self.assertEqual(len(response.json()["data"]), 2)
+
+    def test_query_cache_invalidated_by_other_worker(self):
+        self.client.post('/api/post/query', {'type': 'Western_Cuisine'}, content_type="application/json")
+        feed_cache.shared.incr('feed:generation:Western_Cuisine')
+        # served from the generation this worker read, until FEED_CACHE_GENERATION_TTL lapses
+        with self.assertNumQueries(0):
+            self.client.post('/api/post/query', {'type': 'Western_Cuisine'}, content_type="application/json")
+        feed_cache_module._generations.clear()
+        with self.assertNumQueries(1):
+            self.client.post('/api/post/query', {'type': 'Western_Cuisine'}, content_type="application/json")
+
+    def test_query_cache_invalidated_while_querying(self):
+        # a write committed while the feed is queried bumps the generation, the page it read must not outlive it
+        query_posts = post_views.query_posts
+
+        def invalidate_during_query(*args):
+            invalidate_feeds(['Western_Cuisine'])
+            return query_posts(*args)
+
+        with mock.patch.object(post_views, 'query_posts', side_effect=invalidate_during_query):
+            self.client.post('/api/post/query', {'type': 'Western_Cuisine'}, content_type="application/json")
+        with self.assertNumQueries(1):
+            self.client.post('/api/post/query', {'type': 'Western_Cuisine'}, content_type="application/json")
+
+
+class LikeConcurrencyTestCase(TransactionTestCase):
+    accounts = 8
+    rounds = 5
+
+    def setUp(self):
+        clear_feed_cache()
+        account_cache.clear()
+        for i in range(self.accounts):
+            account = Account.objects.create(email=f'user{i}@gmail.com', name=f'user{i}', password='')
+            AccountAccessToken.objects.create(account=account, account_email=f'user{i}@gmail.com',
+                                              access_token=f'token{i}')
+        self.post = Post.objects.create(title='Post Title', content='Post Content', poster_email='user0@gmail.com',
+                                        poster=Account.objects.get(email='user0@gmail.com'), poster_name='user0',
+                                        channel='Western_Cuisine')
+
+    def toggle(self, access_token, times):
+        results = []
+        try:
+            for _ in range(times):
+                response = self.client_class().post('/api/post/like', {'id': self.post.id, 'access_token': access_token},
+                                                    content_type="application/json")
+                results.append(response.json()["code"])
+        finally:
+            connection.close()
+        return results
+
+    def test_concurrent_likes(self):
+        # every account toggles an odd number of times, so every account ends up liking the post
+        times = self.rounds * 2 + 1
+        with ThreadPoolExecutor(max_workers=self.accounts) as executor:
+            results = list(executor.map(lambda i: self.toggle(f'token{i}', times), range(self.accounts)))
+
+        self.assertEqual(results, [[1] * times] * self.accounts)
+        self.post.refresh_from_db()
+        self.assertEqual(LikedPost.objects.filter(post=self.post).count(), self.accounts)
+        self.assertEqual(self.post.likes, self.accounts)
+        self.assertEqual(Account.objects.get(email='user0@gmail.com').likes_received_count, self.accounts)
+
+    def test_concurrent_likes_same_account(self):
+        # racing toggles of one account must keep the counter equal to the like records
+        with ThreadPoolExecutor(max_workers=self.accounts) as executor:
+            list(executor.map(lambda _: self.toggle('token0', self.rounds), range(self.accounts)))
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes, LikedPost.objects.filter(post=self.post).count())
+        self.assertEqual(Account.objects.get(email='user0@gmail.com').likes_received_count, self.post.likes)
+
+
+class PostQueryCountTestCase(QueryCountTestCase):
+    def setUp(self):
+        clear_feed_cache()
+        account_cache.clear()
+        self.account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i', password='')
+        self.other = Account.objects.create(email='aaaa@gmail.com', name='aaaa', password='')
+        AccountAccessToken.objects.create(account=self.account, account_email='xi4f3i@gmail.com',
+                                          access_token='123456')
+        self.post = self.create_post()
+
+    def create_post(self):
+        return Post.objects.create(title='Post Title', content='Post Content', poster_email='xi4f3i@gmail.com',
+                                   poster=self.account, poster_name='xi4f3i', channel='Western_Cuisine')
+
+    def add_rows(self, count):
+        for i in range(count):
+            post = self.create_post()
+            Comment.objects.create(post=self.post, poster=self.account, poster_email='xi4f3i@gmail.com',
+                                   commentator=self.other, commentator_email='aaaa@gmail.com',
+                                   commentator_name='aaaa', comment=f'comment {i}')
+            LikedPost.objects.create(liked_account=self.account, liked_account_email='xi4f3i@gmail.com',
+                                     liked_account_name='xi4f3i', post=post, poster=self.account,
+                                     poster_email='xi4f3i@gmail.com')
+
+    def test_query(self):
+        self.assertConstantQueries(1, '/api/post/query', {'type': 'All'})
+
+    def test_query_paginated(self):
+        self.assertConstantQueries(1, '/api/post/query', {'type': 'Western_Cuisine', 'limit': 10})
+
+    def test_query_summary(self):
+        self.assertConstantQueries(1, '/api/post/query', {'type': 'publish', 'email': 'xi4f3i@gmail.com',
+                                                           'projection': 'summary'})
+
+    def test_query_liked(self):
+        self.assertConstantQueries(1, '/api/post/query', {'type': 'like', 'email': 'xi4f3i@gmail.com'})
+
+    def test_query_comments(self):
+        self.assertConstantQueries(1, '/api/post/query_comments', {'id': self.post.id})
+
+    def test_query_like_status(self):
+        self.assertConstantQueries(1, '/api/post/query_like_status', {'id': self.post.id, 'access_token': '123456'})
+
+    def test_like_toggle(self):
+        data = {'id': self.post.id, 'access_token': '123456'}
+        # warm up the access token cache
+        self.client.post('/api/post/query_like_status', data, content_type="application/json")
+        # the DELETE, the UPDATE of the post, the INSERT and the UPDATE of the poster, each SAVEPOINT of the test's
+        # transaction and of the INSERT with its RELEASE
+        with self.assertNumQueries(8):
+            self.assertEqual(self.client.post('/api/post/like', data, content_type="application/json").json()["data"],
+                             True)
+        # the DELETE and the UPDATEs of the post and of the poster, SAVEPOINT and RELEASE of the test's transaction
+        with self.assertNumQueries(5):
+            self.assertEqual(self.client.post('/api/post/like', data, content_type="application/json").json()["data"],
+                             False)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes, 0)
+
+
+class PostSearchTestCase(TestCase):
+    def setUp(self):
+        account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i', password='')
+        Post.objects.create(title='Salmon Sushi', content='Sushi rice, salmon and wasabi.',
+                            poster_email='xi4f3i@gmail.com', poster=account, poster_name='xi4f3i',
+                            channel='Japanese_Cuisine')
+        Post.objects.create(title='Tomato Soup', content='Tomatoes, salmon stock and basil.',
+                            poster_email='xi4f3i@gmail.com', poster=account, poster_name='xi4f3i', channel='Soups')
+        Post.objects.create(title='Apple Pie', content='Apples and butter.', poster_email='xi4f3i@gmail.com',
+                            poster=account, poster_name='xi4f3i', channel='Desserts')
+
+    def search(self, data):
+        response = self.client.post('/api/post/search', data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 1)
+        return [post["title"] for post in response_data["data"]]
+
+    def test_search_ranked(self):
+        # title matches rank above content matches
+        self.assertEqual(self.search({'keyword': 'salmon'}), ['Salmon Sushi', 'Tomato Soup'])
+
+    def test_search_prefix(self):
+        self.assertEqual(self.search({'keyword': 'tomat', 'projection': 'summary'}), ['Tomato Soup'])
+
+    def test_search_channel(self):
+        self.assertEqual(self.search({'keyword': 'salmon', 'channel': 'Soups'}), ['Tomato Soup'])
+        self.assertEqual(self.search({'keyword': 'salmon', 'channel': 'All'}), ['Salmon Sushi', 'Tomato Soup'])
+
+    def test_search_invalid_channel(self):
+        for channel in ('publish', 'like', 'Pizza'):
+            response = self.client.post('/api/post/search', {'keyword': 'salmon', 'channel': channel},
+                                        content_type="application/json")
+            self.assertEqual(response.json()["message"], 'Invalid channel!')
+
+    def test_search_index_follows_updates(self):
+        post = Post.objects.get(title='Apple Pie')
+        post.title = 'Pear Tart'
+        post.save()
+        self.assertEqual(self.search({'keyword': 'pie'}), [])
+        self.assertEqual(self.search({'keyword': 'pear'}), ['Pear Tart'])
+        post.delete()
+        self.assertEqual(self.search({'keyword': 'pear'}), [])
+
+
+@override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=1)
+class TimelineTestCase(TestCase):
+    def setUp(self):
+        clear_feed_cache()
+        account_cache.clear()
+        self.accounts = {}
+        for name in ('reader', 'cook', 'chef', 'fan'):
+            account = Account.objects.create(email=f'{name}@gmail.com', name=name, password='')
+            AccountAccessToken.objects.create(account=account, account_email=account.email, access_token=name)
+            self.accounts[name] = account
+        self.publish('cook', 'Old Cook Post')
+        # chef has more followers than TIMELINE_FANOUT_MAX_FOLLOWERS, its posts are not fanned out
+        self.follow('fan', 'chef')
+        self.follow('reader', 'chef')
+        self.follow('reader', 'cook')
+
+    def publish(self, name, title):
+        self.client.post('/api/post/publish', {'access_token': name, 'title': title, 'content': 'Content',
+                                               'channel': 'Soups'}, content_type="application/json")
+
+    def follow(self, name, followed):
+        self.client.post('/api/account/follow', {'access_token': name, 'email': f'{followed}@gmail.com'},
+                         content_type="application/json")
+
+    def following(self, name='reader', **data):
+        response = self.client.post('/api/post/query', {'type': 'following', 'access_token': name, **data},
+                                    content_type="application/json")
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 1)
+        return [post["title"] for post in response_data["data"]["posts"]], response_data["data"]["next_cursor"]
+
+    def test_following_feed(self):
+        self.publish('chef', 'Chef Post')
+        self.publish('cook', 'Cook Post')
+        self.publish('fan', 'Fan Post')
+        self.assertEqual(self.following(), (['Cook Post', 'Chef Post', 'Old Cook Post'], None))
+        self.assertEqual(TimelineEntry.objects.filter(account=self.accounts['reader']).count(), 2)
+        self.assertFalse(TimelineEntry.objects.filter(post__title='Chef Post').exists())
+
+    def test_following_feed_paginated(self):
+        self.publish('chef', 'Chef Post')
+        self.publish('cook', 'Cook Post')
+        titles = []
+        cursor = None
+        while True:
+            page, cursor = self.following(limit=1, projection='summary', **({'cursor': cursor} if cursor else {}))
+            titles += page
+            if cursor is None:
+                break
+        self.assertEqual(titles, ['Cook Post', 'Chef Post', 'Old Cook Post'])
+
+    def test_unfollow_drops_posts(self):
+        self.follow('reader', 'cook')
+        self.assertEqual(self.following(), ([], None))
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_deleted_post_leaves_timelines(self):
+        post = Post.objects.get(title='Old Cook Post')
+        self.client.post('/api/post/delete', {'access_token': 'cook', 'id': post.id}, content_type="application/json")
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_rebuild_timelines(self):
+        Follower.objects.create(follower=self.accounts['fan'], follower_email='fan@gmail.com', follower_name='fan',
+                                followed=self.accounts['cook'], followed_email='cook@gmail.com')
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.following('fan'), (['Old Cook Post'], None))
+        self.assertEqual(self.following(), (['Old Cook Post'], None))
+
+    def test_followers_drop_under_the_limit(self):
+        self.publish('chef', 'Chef Post')
+        # back to TIMELINE_FANOUT_MAX_FOLLOWERS followers, the post is still in no timeline
+        self.follow('fan', 'chef')
+        self.assertEqual(Account.objects.get(email='chef@gmail.com').followers_count, 1)
+        self.publish('chef', 'New Chef Post')
+        self.assertEqual(self.following()[0], ['New Chef Post', 'Chef Post', 'Old Cook Post'])
+
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertFalse(Account.objects.get(email='chef@gmail.com').fanout_disabled)
+        self.assertEqual(TimelineEntry.objects.filter(account=self.accounts['reader']).count(), 3)
+        self.publish('chef', 'Fanned Out Chef Post')
+        self.assertEqual(self.following()[0], ['Fanned Out Chef Post', 'New Chef Post', 'Chef Post', 'Old Cook Post'])
+
+    def test_invalid_access_token(self):
+        response = self.client.post('/api/post/query', {'type': 'following', 'access_token': 'nobody'},
+                                    content_type="application/json")
+        self.assertEqual(response.json()["message"], 'Invalid access token!')
+
+
+class TrendingTestCase(TestCase):
+    def setUp(self):
+        clear_feed_cache()
+        account_cache.clear()
+        self.account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i', password='')
+        AccountAccessToken.objects.create(account=self.account, account_email='xi4f3i@gmail.com',
+                                          access_token='123456')
+        now = timezone.now()
+        self.posts = {}
+        # title -> (channel, likes, views, age in hours)
+        for title, (channel, likes, views, hours) in {
+            'Fresh Soup': ('Soups', 0, 0, 1),
+            'Popular Soup': ('Soups', 40, 100, 60),
+            'Popular Cake': ('Desserts', 10, 0, 2),
+            'Old Soup': ('Soups', 500, 0, 24 * 30),
+        }.items():
+            post = Post.objects.create(title=title, content='Content', poster=self.account,
+                                       poster_email='xi4f3i@gmail.com', poster_name='xi4f3i', channel=channel,
+                                       likes=likes, views=views)
+            Post.objects.filter(id=post.id).update(create_datetime=now - datetime.timedelta(hours=hours))
+            self.posts[title] = post
+
+    def trending(self, query_type, **data):
+        response = self.client.post('/api/post/query', {'type': query_type, 'order': 'trending', **data},
+                                    content_type="application/json")
+        response_data = response.json()
+        self.assertEqual(response_data["code"], 1)
+        return [post["title"] for post in response_data["data"]["posts"]], response_data["data"]["next_cursor"]
+
+    def test_trending_score_decays(self):
+        now = timezone.now()
+        day_old = trending_score(7, 0, 0, now - datetime.timedelta(hours=24))
+        self.assertAlmostEqual(trending_score(3, 0, 0, now), day_old)
+        self.assertGreater(trending_score(1, 0, 0, now), trending_score(0, 0, 0, now))
+
+    def test_trending(self):
+        call_command('update_trending', stdout=StringIO())
+        # the month old post left the window
+        self.assertEqual(self.trending('All'), (['Popular Cake', 'Popular Soup', 'Fresh Soup'], None))
+        self.assertEqual(self.trending('Soups', projection='summary'), (['Popular Soup', 'Fresh Soup'], None))
+
+        titles, cursor = self.trending('All', limit=2)
+        self.assertEqual(titles, ['Popular Cake', 'Popular Soup'])
+        self.assertEqual(self.trending('All', limit=2, cursor=cursor), (['Fresh Soup'], None))
+
+    def test_trending_updates(self):
+        call_command('update_trending', stdout=StringIO())
+        self.assertEqual(self.trending('Soups')[0], ['Popular Soup', 'Fresh Soup'])
+        Post.objects.filter(id=self.posts['Fresh Soup'].id).update(likes=100)
+        Comment.objects.create(post=self.posts['Fresh Soup'], poster=self.account, poster_email='xi4f3i@gmail.com',
+                               commentator=self.account, commentator_email='xi4f3i@gmail.com',
+                               commentator_name='xi4f3i', comment='comment')
+        call_command('update_trending', stdout=StringIO())
+        self.assertEqual(self.trending('Soups')[0], ['Fresh Soup', 'Popular Soup'])
+
+    def test_published_posts_are_ranked(self):
+        self.client.post('/api/post/publish', {'access_token': '123456', 'title': 'New Soup', 'content': 'Content',
+                                               'channel': 'Soups'}, content_type="application/json")
+        self.assertEqual(self.trending('Soups')[0], ['New Soup'])
+        post = Post.objects.get(title='New Soup')
+        self.client.post('/api/post/delete', {'access_token': '123456', 'id': post.id},
+                         content_type="application/json")
+        self.assertFalse(TrendingPost.objects.exists())
+
+    def test_invalid_order(self):
+        response = self.client.post('/api/post/query', {'type': 'like', 'email': 'xi4f3i@gmail.com',
+                                                        'order': 'trending'}, content_type="application/json")
+        self.assertEqual(response.json()["message"], 'Invalid order!')
+
+
+class ViewCounterTestCase(TestCase):
+    def setUp(self):
+        view_counter.clear()
+        account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i', password='')
+        self.posts = [Post.objects.create(title=f'Salmon Sushi {i}', content='Sushi rice and salmon.',
+                                          poster=account, poster_email='xi4f3i@gmail.com', poster_name='xi4f3i',
+                                          channel='Japanese_Cuisine') for i in range(2)]
+
+    def tearDown(self):
+        view_counter.clear()
+
+    def view(self, post):
+        response = self.client.post('/api/post/detail', {'id': post.id}, content_type="application/json")
+        self.assertEqual(response.json()["code"], 1)
+
+    def views(self):
+        return [post.views for post in Post.objects.order_by('id')]
+
+    def test_views_are_buffered(self):
+        self.view(self.posts[0])
+        self.view(self.posts[0])
+        self.view(self.posts[1])
+        self.assertEqual(self.views(), [0, 0])
+
+        self.assertEqual(view_counter.flush(), 3)
+        self.assertEqual(self.views(), [2, 1])
+        self.assertEqual(view_counter.flush(), 0)
+
+    def test_flush_in_batches(self):
+        for post in self.posts:
+            view_counter.record(post.id)
+        # views of a deleted post are dropped
+        view_counter.record(self.posts[1].id + 1)
+        # one UPDATE per batch, in a savepoint of the test transaction
+        with self.assertNumQueries(4):
+            self.assertEqual(view_counter.flush(batch_size=2), 3)
+        self.assertEqual(self.views(), [1, 1])
+
+    @override_settings(POST_VIEW_FLUSH_SIZE=2)
+    def test_full_buffer_is_flushed(self):
+        self.view(self.posts[0])
+        self.assertEqual(self.views(), [0, 0])
+        self.view(self.posts[1])
+        self.assertEqual(self.views(), [1, 1])
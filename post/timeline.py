@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db import transaction
+
+from account.models import Account, Follower
+from post.deletion import raw_delete
+from post.models import Post, TimelineEntry
+
+
+def fans_out(poster_id):
+    # posts of an account are copied into its followers' timelines until it published one without, see fan_out
+    return Account.objects.filter(id=poster_id, fanout_disabled=False).exists()
+
+
+def fan_out(post):
+    """
+    Copy ``post`` into the timelines of its poster's followers. Returns the number of timelines written.
+
+    A poster with more followers than ``TIMELINE_FANOUT_MAX_FOLLOWERS`` is skipped and marked ``fanout_disabled``,
+    its posts are merged into the following feed when it is read. The mark stays when the followers drop under the
+    limit again, the posts published in between are in no timeline until ``rebuild_timelines`` copies them.
+    """
+    fanned_out = Account.objects.filter(id=post.poster_id, fanout_disabled=False,
+                                        followers_count__lte=settings.TIMELINE_FANOUT_MAX_FOLLOWERS)
+    if not fanned_out.exists():
+        Account.objects.filter(id=post.poster_id, fanout_disabled=False).update(fanout_disabled=True)
+        return 0
+    follower_ids = Follower.objects.filter(followed=post.poster_id).values_list('follower_id', flat=True)
+    return len(TimelineEntry.objects.bulk_create([TimelineEntry(account_id=follower_id, post=post)
+                                                  for follower_id in follower_ids]))
+
+
+def backfill_timeline(account_id, followed_id):
+    # latest posts of a newly followed account, posts published from now on are fanned out
+    if not fans_out(followed_id):
+        return
+    post_ids = (Post.objects.filter(poster=followed_id).order_by('-id')
+                .values_list('id', flat=True)[:settings.TIMELINE_BACKFILL_POSTS])
+    TimelineEntry.objects.bulk_create([TimelineEntry(account_id=account_id, post_id=post_id) for post_id in post_ids],
+                                      ignore_conflicts=True)
+
+
+def drop_from_timeline(account_id, followed_id):
+    raw_delete(TimelineEntry.objects.filter(account=account_id, post__poster=followed_id))
+
+
+def rebuild_timeline(account_id):
+    """
+    Rewrite the timeline of ``account_id`` from the accounts it follows, with the latest
+    ``TIMELINE_BACKFILL_POSTS`` posts of each.
+    """
+    followed_ids = (Follower.objects.filter(follower=account_id, followed__fanout_disabled=False)
+                    .values_list('followed_id', flat=True))
+    with transaction.atomic():
+        raw_delete(TimelineEntry.objects.filter(account=account_id))
+        for followed_id in list(followed_ids):
+            backfill_timeline(account_id, followed_id)
+
+
+def rebuild_timelines(batch_size=1000):
+    """
+    Rebuild the timeline of every account, one transaction per account. Returns the number of rebuilt timelines.
+
+    Posters are fanned out again if they are within ``TIMELINE_FANOUT_MAX_FOLLOWERS`` and not if they are over it.
+    Until the timelines of their followers are rebuilt, those followers miss the posts that were not fanned out.
+    """
+    limit = settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+    Account.objects.filter(fanout_disabled=True, followers_count__lte=limit).update(fanout_disabled=False)
+    Account.objects.filter(fanout_disabled=False, followers_count__gt=limit).update(fanout_disabled=True)
+    rebuilt = 0
+    last_id = 0
+    while True:
+        ids = list(Account.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return rebuilt
+        for account_id in ids:
+            rebuild_timeline(account_id)
+        rebuilt += len(ids)
+        last_id = ids[-1]
+
+
+async def afollowing_feeds(account_id):
+    """
+    Post querysets whose union is the following feed of ``account_id``.
+
+    The first is the timeline, followed by the profile feed of every followed account whose posts are not fanned out.
+    Each one is read from its own index, see ``apaginate_merged``.
+    """
+    # ordered by the post_id of the timeline, its unique index is walked instead of sorting the posts
+    feeds = [Post.objects.filter(timeline_entries__account=account_id).order_by('-timeline_entries__post')]
+    not_fanned_out = (Follower.objects.filter(follower=account_id, followed__fanout_disabled=True)
+                      .values_list('followed_id', flat=True))
+    return feeds + [Post.objects.filter(poster=poster_id) async for poster_id in not_fanned_out]
@@ -0,0 +1,63 @@
+import datetime
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from post.deletion import raw_delete
+from post.models import Post, Comment, TrendingPost
+
+
+def trending_score(likes, comments, views, create_datetime):
+    """
+    Engagement of a post decayed by its age, on a log scale.
+
+    Engagement halves in weight every ``TRENDING_HALF_LIFE_HOURS``. Ranking by
+    ``engagement * 2 ** (-age / half_life)`` ranks like ``log2(engagement) + created / half_life`` at any moment,
+    so a score only changes with the engagement of its post and not with the clock.
+    """
+    weights = settings.TRENDING_WEIGHTS
+    engagement = weights['likes'] * likes + weights['comments'] * comments + weights['views'] * views
+    half_lives = create_datetime.timestamp() / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+    return math.log2(1 + engagement) + half_lives
+
+
+def score_posts(posts):
+    # posts are values() rows of id, channel, likes, views and create_datetime
+    comment_counts = dict(Comment.objects.filter(post_id__in=[post['id'] for post in posts]).order_by()
+                          .values('post_id').annotate(total=Count('id')).values_list('post_id', 'total'))
+    return [TrendingPost(post_id=post['id'], channel=post['channel'],
+                         score=trending_score(post['likes'], comment_counts.get(post['id'], 0), post['views'],
+                                              post['create_datetime'])) for post in posts]
+
+
+def update_trending(batch_size=1000):
+    """
+    Score the posts of the last ``TRENDING_WINDOW_DAYS`` days and drop the older ones from the ranking.
+
+    Posts are walked newest first down the primary key until one is older than the window, so the work grows with
+    the posts of the window and not with the table. Every batch is upserted in its own transaction.
+    Returns ``(scored, removed)``.
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=settings.TRENDING_WINDOW_DAYS)
+    scored = 0
+    oldest_id = None
+    while True:
+        posts = Post.objects.order_by('-id')
+        if oldest_id is not None:
+            posts = posts.filter(id__lt=oldest_id)
+        posts = list(posts.values('id', 'channel', 'likes', 'views', 'create_datetime')[:batch_size])
+        recent = [post for post in posts if post['create_datetime'] >= cutoff]
+        if recent:
+            with transaction.atomic():
+                TrendingPost.objects.bulk_create(score_posts(recent), update_conflicts=True,
+                                                 unique_fields=['post'], update_fields=['channel', 'score'])
+            scored += len(recent)
+            oldest_id = recent[-1]['id']
+        if len(recent) < batch_size:
+            break
+
+    stale = TrendingPost.objects.all() if oldest_id is None else TrendingPost.objects.filter(post_id__lt=oldest_id)
+    return scored, raw_delete(stale)
@@ -4,10 +4,13 @@ from . import views
 
 urlpatterns = [
     path('query', views.query, name='query'),
+    path('detail', views.detail, name='detail'),
+    path('search', views.search, name='search'),
     path('publish', views.publish, name='publish'),
     path('query_comments', views.query_comments, name='query_comments'),
     path('query_like_status', views.query_like_status, name='query_like_status'),
     path('like', views.like, name='like'),
     path('comment', views.comment, name='comment'),
     path('delete', views.delete, name='delete'),
+    path('delete_all', views.delete_all, name='delete_all'),
 ]
\ No newline at end of file
@@ -0,0 +1,91 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+
+from post.models import Post
+
+logger = logging.getLogger('post.view_counts')
+
+
+class ViewCounter:
+    """
+    Views of posts counted in memory and added to ``Post.views`` in batches, so a view is not a write.
+
+    The buffer is flushed every ``POST_VIEW_FLUSH_INTERVAL`` seconds by the thread of ``start``, by the request that
+    fills it to ``POST_VIEW_FLUSH_SIZE`` views and when the process exits. Every worker process keeps its own buffer,
+    a crashed one loses the views of one interval at most.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._views = Counter()
+            self._pending = 0
+
+    def record(self, post_id):
+        # returns whether the buffer is full and should be flushed now
+        with self._lock:
+            self._views[post_id] += 1
+            self._pending += 1
+            return self._pending >= settings.POST_VIEW_FLUSH_SIZE
+
+    def flush(self, batch_size=500):
+        """
+        Add the buffered views to their posts, one UPDATE ... CASE per ``batch_size`` posts in one transaction.
+
+        Views that could not be written go back to the buffer for the next flush. Returns the number of written views.
+        """
+        with self._lock:
+            views, pending = self._views, self._pending
+            self._views = Counter()
+            self._pending = 0
+        if not views:
+            return 0
+
+        items = sorted(views.items())
+        try:
+            with transaction.atomic():
+                for start in range(0, len(items), batch_size):
+                    batch = items[start:start + batch_size]
+                    Post.objects.filter(id__in=[post_id for post_id, _ in batch]).update(
+                        views=F('views') + Case(*[When(id=post_id, then=Value(count)) for post_id, count in batch]))
+        except DatabaseError:
+            logger.exception('could not flush %d post views', pending)
+            with self._lock:
+                self._views.update(views)
+                self._pending += pending
+            return 0
+        return pending
+
+    def start(self):
+        """
+        Flush from a daemon thread every ``POST_VIEW_FLUSH_INTERVAL`` seconds and once more when the process exits.
+
+        Called by the ASGI and WSGI entry points, management commands and tests flush explicitly.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='post-view-counter', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(settings.POST_VIEW_FLUSH_INTERVAL)
+            self.flush()
+            # closes the connection once it is older than CONN_MAX_AGE, like the end of a request
+            close_old_connections()
+
+
+view_counter = ViewCounter()
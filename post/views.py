@@ -1,18 +1,73 @@
 import json
 
-from account.models import AccountAccessToken, Account
-from post.models import Post, LikedPost, Comment
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Subquery
+from django.db.models.functions import Substr
+
+from account.models import AccountAccessToken
+from account.notifications import notify, is_notified, remove_unread
+from post.feed_cache import feed_scope, aget_feed_page, aset_feed_page, ainvalidate_feeds, post_scopes
+from post.deletion import delete_post_rows, delete_posts
+from post.models import Post, LikedPost, Comment, TrendingPost
+from post.search import search_post_ids
+from post.timeline import afollowing_feeds, fan_out
+from post.trending import trending_score
+from post.view_counts import view_counter
+from server.auth import aresolve_account
+from server.pagination import PaginationError, apaginate_by_id, apaginate_by_rank, apaginate_merged, \
+    parse_limit
 from server.request_helper import validate_request_data
-from server.response_helper import generate_failed_response, generate_successful_response, generate_posts_response, \
-    generate_missing_fields_response, generate_comments_response
+from server.response_helper import generate_failed_response, generate_successful_response, \
+    generate_missing_fields_response, generate_comments_response, generate_post_response, format_posts, \
+    format_post_summaries, post_summary_fields, with_post_title
+
+# channels of posts
+channels = ['Vegetarian_Cuisine', 'Chinese_Cuisine', 'Western_Cuisine', 'Japanese_Cuisine', 'Desserts', 'Soups']
 
 # valid query types
-types = ['publish', 'like', 'explore', 'All', 'Vegetarian_Cuisine', 'Chinese_Cuisine', 'Western_Cuisine',
-         'Japanese_Cuisine', 'Desserts', 'Soups']
+types = ['publish', 'like', 'following', 'explore', 'All', *channels]
+
+# valid feed projections, 'summary' skips the full content column
+projections = ['full', 'summary']
+excerpt_length = 120
+
+# valid feed orders, 'trending' ranks the recent posts of the explore and channel feeds by their trending score
+orders = ['latest', 'trending']
+
+
+def query_posts(query_type, email=None):
+    if query_type == 'publish':
+        # query posts which account published
+        return Post.objects.filter(poster__email=email)
+    if query_type == 'like':
+        # query posts which account liked, resolved as a subquery so it can be paginated
+        liked_post_ids = LikedPost.objects.filter(liked_account__email=email).values('post_id')
+        return Post.objects.filter(id__in=Subquery(liked_post_ids))
+
+    # query posts for explore
+    if query_type == 'All':
+        return Post.objects.all()
+    return Post.objects.filter(channel=query_type)
+
+
+def trending_posts(query_type):
+    # posts of the ranking, joined to their scores
+    if query_type == 'All':
+        return Post.objects.filter(trending__isnull=False)
+    return Post.objects.filter(trending__channel=query_type)
+
+
+def project_posts(posts, projection):
+    if projection == 'summary':
+        # only load list columns plus a db side excerpt of the content
+        posts = posts.values(*post_summary_fields).annotate(excerpt=Substr('content', 1, excerpt_length))
+        return posts, format_post_summaries
+    return posts, format_posts
 
 
 # Create your views here.
-def query(request):
+async def query(request):
     try:
         req = json.loads(request.body)
         query_type = req.get('type')
@@ -26,30 +81,136 @@ def query(request):
             if email is None:
                 return generate_failed_response('Invalid email address!')
 
-        if query_type == 'publish':
-            # query posts which account published
-            posts = Post.objects.filter(poster_email=email).order_by('-id')
-            return generate_posts_response(posts)
-        elif query_type == 'like':
-            # query posts which account liked
-            liked_posts = LikedPost.objects.filter(liked_account_email=email)
-            post_ids = [post.post_id for post in liked_posts]
-            posts = Post.objects.filter(id__in=post_ids).order_by('-id')
-            return generate_posts_response(posts)
-
-        # query posts for explore
-        if query_type == 'All':
-            posts = Post.objects.all().order_by('-id')
+        projection = req.get('projection', 'full')
+        if projection not in projections:
+            return generate_failed_response('Invalid projection!')
+
+        order = req.get('order', 'latest')
+        if order not in orders or (order == 'trending' and query_type in ('publish', 'like', 'following')):
+            return generate_failed_response('Invalid order!')
+
+        if query_type == 'following':
+            # the following feed is read per account and always paginated
+            account = await aresolve_account(request, req.get('access_token'))
+            feeds = [project_posts(feed, projection) for feed in await afollowing_feeds(account.id)]
+            # every feed is projected alike
+            formatter = feeds[0][1]
+            posts, next_cursor = await apaginate_merged([feed for feed, _ in feeds], req.get('cursor'),
+                                                        req.get('limit'))
+            return generate_successful_response({
+                'posts': formatter(posts),
+                'next_cursor': next_cursor,
+            })
+
+        # serve repeated feed reads from the cache
+        paginated = 'cursor' in req or 'limit' in req
+        scope = feed_scope(query_type, email)
+        cache_params = [query_type, email, projection, order, paginated, req.get('cursor'), req.get('limit')]
+        page_key, data = await aget_feed_page(scope, cache_params)
+        if data is not None:
+            return generate_successful_response(data)
+
+        if order == 'trending':
+            # rankings are always paginated, from the score index of the ranking table
+            posts, formatter = project_posts(trending_posts(query_type), projection)
+            posts, next_cursor = await apaginate_by_rank(posts, 'trending__score', req.get('cursor'),
+                                                         req.get('limit'), id_field='trending__post')
+            data = {
+                'posts': formatter(posts),
+                'next_cursor': next_cursor,
+            }
+        elif paginated:
+            # keyset pagination is enabled when the client sends a cursor or limit
+            posts, formatter = project_posts(query_posts(query_type, email), projection)
+            posts, next_cursor = await apaginate_by_id(posts, req.get('cursor'), req.get('limit'))
+            data = {
+                'posts': formatter(posts),
+                'next_cursor': next_cursor,
+            }
         else:
-            posts = Post.objects.filter(channel=query_type).order_by('-id')
-        return generate_posts_response(posts)
+            posts, formatter = project_posts(query_posts(query_type, email), projection)
+            data = formatter([post async for post in posts.order_by('-id')])
+
+        await aset_feed_page(page_key, data)
+        return generate_successful_response(data)
+    except PaginationError as e:
+        return generate_failed_response(str(e))
+    except AccountAccessToken.DoesNotExist:
+        return generate_failed_response('Invalid access token!')
     except json.JSONDecodeError:
         return generate_failed_response('Invalid JSON!')
     except Exception as e:
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def publish(request):
+async def search(request):
+    try:
+        req = json.loads(request.body)
+        keyword = req.get('keyword')
+        if not isinstance(keyword, str) or not keyword.strip():
+            return generate_failed_response('Invalid keyword!')
+
+        # 'All' searches every channel like a missing channel
+        channel = req.get('channel')
+        if channel == 'All':
+            channel = None
+        if channel is not None and channel not in channels:
+            return generate_failed_response('Invalid channel!')
+
+        projection = req.get('projection', 'full')
+        if projection not in projections:
+            return generate_failed_response('Invalid projection!')
+
+        limit = parse_limit(req.get('limit'))
+        # the match runs on a raw cursor, which has no async interface
+        post_ids = await sync_to_async(search_post_ids)(keyword, channel, limit)
+
+        # load the matches and keep the ranking of the index
+        posts, formatter = project_posts(Post.objects.filter(id__in=post_ids), projection)
+        ranks = {post_id: rank for rank, post_id in enumerate(post_ids)}
+        posts = sorted([post async for post in posts],
+                       key=lambda post: ranks[post['id'] if isinstance(post, dict) else post.id])
+
+        return generate_successful_response(formatter(posts))
+    except PaginationError as e:
+        return generate_failed_response(str(e))
+    except json.JSONDecodeError:
+        return generate_failed_response('Invalid JSON!')
+    except Exception as e:
+        return generate_failed_response('An unexpected error occurred.', data=str(e))
+
+
+async def detail(request):
+    try:
+        req = json.loads(request.body)
+        post_id = req.get('id')
+        if post_id is None:
+            return generate_failed_response('Invalid ID!')
+
+        post = await Post.objects.aget(id=post_id)
+        # counted in memory, the views in the response lag by one flush interval
+        if view_counter.record(post.id):
+            await sync_to_async(view_counter.flush)()
+
+        return generate_post_response(post)
+    except Post.DoesNotExist:
+        return generate_failed_response('Invalid ID!')
+    except json.JSONDecodeError:
+        return generate_failed_response('Invalid JSON!')
+    except Exception as e:
+        return generate_failed_response('An unexpected error occurred.', data=str(e))
+
+
+def publish_post(post):
+    # the post reaches the following feeds of the poster's followers and the trending rankings with it
+    with transaction.atomic():
+        post.save()
+        fan_out(post)
+        TrendingPost.objects.create(post=post, channel=post.channel,
+                                    score=trending_score(0, 0, 0, post.create_datetime))
+
+
+async def publish(request):
     try:
         req = json.loads(request.body)
         missing_fields = validate_request_data(req, ['access_token', 'title', 'content', 'channel'])
@@ -58,8 +219,7 @@ def publish(request):
 
         # query account
         access_token = req.get('access_token')
-        account_access_token = AccountAccessToken.objects.get(access_token=access_token)
-        account = Account.objects.get(email=account_access_token.account_email)
+        account = await aresolve_account(request, access_token)
 
         title = req.get('title')
         content = req.get('content')
@@ -67,7 +227,8 @@ def publish(request):
         # generate a new post
         post = Post(poster_id=account.id, poster_name=account.name, poster_email=account.email, title=title,
                     content=content, channel=channel)
-        post.save()
+        await sync_to_async(publish_post)(post)
+        await ainvalidate_feeds(post_scopes(post.channel, post.poster_email))
 
         return generate_successful_response(None)
     except AccountAccessToken.DoesNotExist:
@@ -78,14 +239,14 @@ def publish(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def query_comments(request):
+async def query_comments(request):
     try:
         req = json.loads(request.body)
         post_id = req.get('id')
         if post_id is None:
             return generate_failed_response('Invalid ID!')
 
-        comments = Comment.objects.filter(post_id=post_id)
+        comments = [comment async for comment in with_post_title(Comment.objects.filter(post_id=post_id))]
 
         return generate_comments_response(comments)
     except json.JSONDecodeError:
@@ -94,7 +255,7 @@ def query_comments(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def query_like_status(request):
+async def query_like_status(request):
     try:
         # validate reuqest body
         req = json.loads(request.body)
@@ -104,12 +265,11 @@ def query_like_status(request):
 
         # query account
         access_token = req.get('access_token')
-        account_access_token = AccountAccessToken.objects.get(access_token=access_token)
+        account = await aresolve_account(request, access_token)
 
         # check has liked post or not
         post_id = req.get('id')
-        liked = LikedPost.objects.filter(post_id=post_id,
-                                         liked_account_email=account_access_token.account_email).count() > 0
+        liked = await LikedPost.objects.filter(post_id=post_id, liked_account=account).acount() > 0
 
         return generate_successful_response(liked)
     except AccountAccessToken.DoesNotExist:
@@ -120,7 +280,64 @@ def query_like_status(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def like(request):
+def delete_like(account_id, post_id):
+    """
+    Delete the like of ``account_id`` on the post in one statement, returns its ``(read, poster_id)`` or None.
+    """
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {quote_name(LikedPost._meta.db_table)} WHERE post_id = %s AND '
+                       f'liked_account_id = %s RETURNING {quote_name("read")}, poster_id', [post_id, account_id])
+        return cursor.fetchone()
+
+
+def add_likes(post_id, delta):
+    """
+    Add ``delta`` to the likes counter of the post and return the post with its poster and channel.
+
+    One UPDATE ... RETURNING instead of a lookup and an update, raises ``Post.DoesNotExist`` like the lookup.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {connection.ops.quote_name(Post._meta.db_table)} SET likes = likes + %s WHERE id = %s '
+                       f'RETURNING poster_id, poster_email, channel', [delta, post_id])
+        row = cursor.fetchone()
+    if row is None:
+        raise Post.DoesNotExist('Post matching query does not exist.')
+    poster_id, poster_email, channel = row
+    return Post(id=post_id, poster_id=poster_id, poster_email=poster_email, channel=channel)
+
+
+def toggle_like(account, post_id):
+    """
+    Drop the like of ``account`` on the post, otherwise record a new one. Returns ``(liked, post)``.
+
+    An unlike is the DELETE and one UPDATE each of the post and its poster, a like adds the INSERT in a savepoint.
+    """
+    with transaction.atomic():
+        # the delete goes first so the write lock is taken before anything is read, its row decides the toggle
+        deleted = delete_like(account.id, post_id)
+        if deleted is not None:
+            read, poster_id = deleted
+            post = add_likes(post_id, -1)
+            unread = not read and is_notified('likes', poster_id, account.id)
+            remove_unread('likes', poster_id, int(unread), likes_received_count=F('likes_received_count') - 1)
+            return False, post
+
+        try:
+            with transaction.atomic():
+                post = add_likes(post_id, 1)
+                like_post = LikedPost.objects.create(liked_account=account, liked_account_email=account.email,
+                                                     liked_account_name=account.name, post_id=post.id,
+                                                     poster_id=post.poster_id, poster_email=post.poster_email)
+                notify('likes', post.poster_id, account.id, like_post.id,
+                       likes_received_count=F('likes_received_count') + 1)
+        except IntegrityError:
+            # a concurrent request of the same account already recorded the like, the savepoint undid the counters
+            post = Post.objects.only('id', 'poster_id', 'poster_email', 'channel').get(id=post_id)
+    return True, post
+
+
+async def like(request):
     try:
         req = json.loads(request.body)
         missing_fields = validate_request_data(req, ['access_token', 'id'])
@@ -129,32 +346,18 @@ def like(request):
 
         # query account
         access_token = req.get('access_token')
-        account_access_token = AccountAccessToken.objects.get(access_token=access_token)
+        account = await aresolve_account(request, access_token)
 
-        # firstly validate like status
+        # the async ORM has no transactions, the toggle runs in a worker thread
         post_id = req.get('id')
-        liked = LikedPost.objects.filter(post_id=post_id,
-                                         liked_account_email=account_access_token.account_email).count() > 0
-
-        if not liked:
-            # record new like item
-            post = Post.objects.get(id=post_id)
-            account = Account.objects.get(email=account_access_token.account_email)
-            like_post = LikedPost(liked_account_email=account.email, liked_account_name=account.name, post_id=post_id,
-                                  poster_email=post.poster_email)
-            post.likes += 1
-            like_post.save()
-            post.save()
-            liked = True
-        else:
-            # remove like item
-            LikedPost.objects.filter(post_id=post_id, liked_account_email=account_access_token.account_email).delete()
-            post = Post.objects.get(id=post_id)
-            post.likes -= 1
-            post.save()
-            liked = False
+        liked, post = await sync_to_async(toggle_like)(account, post_id)
+
+        # the likes counter is part of every cached feed item of this post
+        await ainvalidate_feeds(post_scopes(post.channel, post.poster_email))
 
         return generate_successful_response(liked)
+    except Post.DoesNotExist:
+        return generate_failed_response('Invalid ID!')
     except AccountAccessToken.DoesNotExist:
         return generate_failed_response('Invalid access token!')
     except json.JSONDecodeError:
@@ -163,7 +366,13 @@ def like(request):
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
 
-def comment(request):
+def save_comment(new_comment):
+    with transaction.atomic():
+        new_comment.save()
+        notify('comments', new_comment.poster_id, new_comment.commentator_id, new_comment.id)
+
+
+async def comment(request):
     try:
         req = json.loads(request.body)
         missing_fields = validate_request_data(req, ['access_token', 'id', 'comment'])
@@ -172,19 +381,20 @@ def comment(request):
 
         # query account
         access_token = req.get('access_token')
-        account_access_token = AccountAccessToken.objects.get(access_token=access_token)
-        account = Account.objects.get(email=account_access_token.account_email)
+        account = await aresolve_account(request, access_token)
 
         # query post
         post_id = req.get('id')
-        post = Post.objects.get(id=post_id)
+        post = await Post.objects.aget(id=post_id)
 
         # generate new comment
         comment_text = req.get('comment')
-        new_comment = Comment(post_id=post.id, poster_email=post.poster_email, commentator_email=account.email,
-                              commentator_id=account.id, commentator_name=account.name, comment=comment_text)
+        new_comment = Comment(post_id=post.id, poster_id=post.poster_id, poster_email=post.poster_email,
+                              commentator=account, commentator_email=account.email, commentator_name=account.name,
+                              comment=comment_text)
 
-        new_comment.save()
+        await sync_to_async(save_comment)(new_comment)
+        new_comment.post_title = post.title
 
         return generate_comments_response([new_comment])
     except AccountAccessToken.DoesNotExist:
@@ -194,7 +404,8 @@ def comment(request):
     except Exception as e:
         return generate_failed_response('An unexpected error occurred.', data=str(e))
 
-def delete(request):
+
+async def delete(request):
     try:
         req = json.loads(request.body)
         missing_fields = validate_request_data(req, ['access_token', 'id'])
@@ -203,22 +414,15 @@ def delete(request):
 
         # validate account access token
         access_token = req.get('access_token')
-        account_access_token = AccountAccessToken.objects.get(access_token=access_token)
-        account_email = account_access_token.account_email
+        account_id = (await aresolve_account(request, access_token)).id
 
         # query post
         post_id = req.get('id')
-        post = Post.objects.get(id=post_id, poster_email=account_email)
-
-        # query post like records
-        likes = LikedPost.objects.filter(post_id=post_id, poster_email=account_email)
+        post = await Post.objects.aget(id=post_id, poster=account_id)
 
-        # query post comments
-        comments = Comment.objects.filter(post_id=post_id, poster_email=account_email)
-
-        comments.delete()
-        likes.delete()
-        post.delete()
+        # the likes and comments go with the post in set based deletes, in one transaction
+        await sync_to_async(delete_post_rows)(Post.objects.filter(id=post.id, poster=account_id))
+        await ainvalidate_feeds(post_scopes(post.channel, post.poster_email))
         return generate_successful_response(True)
     except Post.DoesNotExist:
         return generate_failed_response('Invalid ID!')
@@ -227,4 +431,29 @@ def delete(request):
     except json.JSONDecodeError:
         return generate_failed_response('Invalid JSON!')
     except Exception as e:
-        return generate_failed_response('An unexpected error occurred.', data=str(e))
\ No newline at end of file
+        return generate_failed_response('An unexpected error occurred.', data=str(e))
+
+
+async def delete_all(request):
+    try:
+        req = json.loads(request.body)
+        missing_fields = validate_request_data(req, ['access_token'])
+        if missing_fields:
+            return generate_missing_fields_response(missing_fields)
+
+        # validate account access token
+        access_token = req.get('access_token')
+        account = await aresolve_account(request, access_token)
+
+        posts = Post.objects.filter(poster=account.id)
+        posted = [channel async for channel in posts.order_by().values_list('channel', flat=True).distinct()]
+        # popular posts can have many likes and comments, they are deleted in batches
+        deleted = await sync_to_async(delete_posts)(posts)
+        await ainvalidate_feeds({scope for channel in posted for scope in post_scopes(channel, account.email)})
+        return generate_successful_response(deleted)
+    except AccountAccessToken.DoesNotExist:
+        return generate_failed_response('Invalid access token!')
+    except json.JSONDecodeError:
+        return generate_failed_response('Invalid JSON!')
+    except Exception as e:
+        return generate_failed_response('An unexpected error occurred.', data=str(e))
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class ServerConfig(AppConfig):
+    name = 'server'
+
+    def ready(self):
+        from server.database import apply_sqlite_pragmas
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='server.database.apply_sqlite_pragmas')
@@ -3,6 +3,10 @@ ASGI config for server project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The API views are async, serve them with an ASGI server so waiting requests do not hold a worker thread:
+
+    uvicorn server.asgi:application --host 0.0.0.0 --port 8000 --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -13,4 +17,25 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from asgiref.sync import sync_to_async  # noqa: E402
+
+from post.view_counts import view_counter  # noqa: E402
+
+# buffered post views are flushed on a timer from the start
+view_counter.start()
+
+
+async def application(scope, receive, send):
+    # uvicorn re-raises SIGTERM after a graceful shutdown, which skips atexit, the lifespan shutdown flushes instead
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await sync_to_async(view_counter.flush)()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,97 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from account.models import AccountAccessToken
+from server.cache import LRUCache, aget_shared
+
+# access token -> (account, time of the lookup), each worker keeps its own copy for at most ACCESS_TOKEN_CACHE_TTL
+# seconds, or until the token is revoked through the shared cache
+account_cache = LRUCache(settings.ACCESS_TOKEN_CACHE_SIZE, settings.ACCESS_TOKEN_CACHE_TTL)
+
+
+def resolve_account(request, access_token):
+    """
+    Return the account of an access token and attach it to ``request.account``.
+
+    Raises ``AccountAccessToken.DoesNotExist`` like the lookup it replaces.
+    """
+    account = _cached_account(request, access_token)
+    if account is None:
+        resolved_at = time.time()
+        # the token row references its account, one indexed join instead of a second lookup by email
+        account = AccountAccessToken.objects.select_related('account').get(access_token=access_token).account
+        account_cache.set(access_token, (account, resolved_at))
+    return _remember_account(request, access_token, account)
+
+
+async def aresolve_account(request, access_token):
+    """
+    ``resolve_account`` for async views, cache hits only read the revocation of the token from the shared cache.
+    """
+    account = await _acached_account(request, access_token)
+    if account is None:
+        resolved_at = time.time()
+        token = await AccountAccessToken.objects.select_related('account').aget(access_token=access_token)
+        account = token.account
+        account_cache.set(access_token, (account, resolved_at))
+    return _remember_account(request, access_token, account)
+
+
+def _revocation_cache():
+    return caches[settings.ACCESS_TOKEN_REVOCATION_CACHE_ALIAS]
+
+
+def _revocation_key(access_token):
+    return f'auth:revoked:{access_token}'
+
+
+def _is_current(cached, revoked_at):
+    # a lookup that started before the revocation may have read the token row before it was deleted
+    return cached is not None and (revoked_at is None or cached[1] > revoked_at)
+
+
+def _cached_account(request, access_token):
+    if getattr(request, 'access_token', None) == access_token and getattr(request, 'account', None) is not None:
+        return request.account
+    cached = account_cache.get(access_token)
+    if cached is None:
+        return None
+    if not _is_current(cached, _revocation_cache().get(_revocation_key(access_token))):
+        account_cache.delete(access_token)
+        return None
+    return cached[0]
+
+
+async def _acached_account(request, access_token):
+    if getattr(request, 'access_token', None) == access_token and getattr(request, 'account', None) is not None:
+        return request.account
+    cached = account_cache.get(access_token)
+    if cached is None:
+        return None
+    if not _is_current(cached, await aget_shared(_revocation_cache(), _revocation_key(access_token))):
+        account_cache.delete(access_token)
+        return None
+    return cached[0]
+
+
+def _remember_account(request, access_token, account):
+    request.access_token = access_token
+    request.account = account
+    return account
+
+
+def invalidate_access_tokens(access_tokens):
+    """
+    Revoke the cached lookups of ``access_tokens`` in every worker, call it once their rows are deleted.
+
+    The revocation outlives every lookup cached before it.
+    """
+    revoked_at = time.time()
+    revocations = {}
+    for access_token in access_tokens:
+        account_cache.delete(access_token)
+        revocations[_revocation_key(access_token)] = revoked_at
+    if revocations:
+        _revocation_cache().set_many(revocations, settings.ACCESS_TOKEN_CACHE_TTL * 2)
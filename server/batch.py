@@ -0,0 +1,117 @@
+import asyncio
+import copy
+import json
+
+from django.conf import settings
+from django.urls import resolve
+
+from account.models import AccountAccessToken
+from server.auth import aresolve_account
+from server.request_helper import validate_request_data
+from server.response_helper import generate_failed_response, generate_missing_fields_response, \
+    generate_batch_response
+
+# api paths a batch can call -> (whether the view only reads, whether it takes the access token of the batch),
+# consecutive reads run concurrently
+batch_paths = {
+    'post/query': (True, True),
+    'post/detail': (True, False),
+    'post/search': (True, False),
+    'post/query_comments': (True, False),
+    'post/query_like_status': (True, True),
+    'post/publish': (False, True),
+    'post/like': (False, True),
+    'post/comment': (False, True),
+    'post/delete': (False, True),
+    # an access token would turn a profile query into a query of the own account
+    'account/query': (True, False),
+    'account/query_follow_status': (True, True),
+    'account/query_notification': (True, True),
+    'account/unread_counts': (True, True),
+    'account/follow': (False, True),
+    'account/read_notification': (False, True),
+    'account/read_notifications': (False, True),
+}
+
+
+def sub_request(request, path, data):
+    # the sub-request shares the resolved account of the batch, its view finds it on the request
+    sub = copy.copy(request)
+    sub.path = sub.path_info = f'/api/{path}'
+    sub.resolver_match = resolve(sub.path_info)
+    sub._body = json.dumps(data).encode('utf-8')
+    return sub
+
+
+async def invalid_path(request):
+    return generate_failed_response('Invalid path!')
+
+
+async def acall(view, request):
+    return (await view(request)).content
+
+
+async def arun_calls(calls):
+    """
+    Run ``(view, request, read_only)`` calls in order and return the content of their responses.
+
+    Writes run one at a time, the reads between two writes run concurrently. They all share the thread of the batch,
+    and with it its database connection.
+    """
+    contents = []
+    reads = []
+    for view, request, read_only in calls:
+        if read_only:
+            reads.append(acall(view, request))
+            continue
+        contents += await asyncio.gather(*reads)
+        reads = []
+        contents.append(await acall(view, request))
+    contents += await asyncio.gather(*reads)
+    return contents
+
+
+async def batch(request):
+    """
+    Call several post and account api views in one request, ``{"access_token": ..., "requests": [{"path":
+    "post/query_comments", "data": {...}}, ...]}``.
+
+    The access token is resolved once and added to the sub-requests of paths that take one and have none, a stale
+    token fails those calls only. The responses are returned in the order of the requests, a request to a path that
+    cannot be batched gets an 'Invalid path!' response.
+    """
+    try:
+        req = json.loads(request.body)
+        missing_fields = validate_request_data(req, ['requests'])
+        if missing_fields:
+            return generate_missing_fields_response(missing_fields)
+        requests = req['requests']
+        if not isinstance(requests, list) or not requests or len(requests) > settings.BATCH_MAX_REQUESTS:
+            return generate_failed_response('Invalid requests!')
+
+        access_token = req.get('access_token')
+        if access_token is not None:
+            try:
+                await aresolve_account(request, access_token)
+            except AccountAccessToken.DoesNotExist:
+                # every call that takes the token looks it up itself and fails with 'Invalid access token!'
+                pass
+
+        calls = []
+        for item in requests:
+            path = item.get('path') if isinstance(item, dict) else None
+            data = item.get('data', {}) if isinstance(item, dict) else None
+            if not isinstance(path, str) or path not in batch_paths or not isinstance(data, dict):
+                calls.append((invalid_path, request, True))
+                continue
+            read_only, takes_token = batch_paths[path]
+            if access_token is not None and takes_token:
+                data = {'access_token': access_token, **data}
+            sub = sub_request(request, path, data)
+            calls.append((sub.resolver_match.func, sub, read_only))
+
+        return generate_batch_response(await arun_calls(calls))
+    except json.JSONDecodeError:
+        return generate_failed_response('Invalid JSON!')
+    except Exception as e:
+        return generate_failed_response('An unexpected error occurred.', data=str(e))
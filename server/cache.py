@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+_missing = object()
+
+
+async def aget_shared(cache, key, default=None):
+    # in-process backends never block, their async methods would only move the call to a worker thread
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        return cache.get(key, default)
+    return await cache.aget(key, default)
+
+
+class LRUCache:
+    """
+    Bounded in-process cache with least-recently-used eviction and a per-entry TTL.
+    """
+
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _missing)
+            if item is _missing:
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    Local LRU in front of a shared Django cache backend (locmem, file, redis...).
+    """
+
+    def __init__(self, alias, maxsize=256, timeout=300):
+        self.alias = alias
+        self.timeout = timeout
+        self.local = LRUCache(maxsize, timeout)
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _missing)
+        if value is not _missing:
+            return value
+        value = self.shared.get(key, _missing)
+        if value is _missing:
+            return default
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        self.shared.set(key, value, self.timeout)
+
+    async def aget(self, key, default=None):
+        # local hits never leave the event loop
+        value = self.local.get(key, _missing)
+        if value is not _missing:
+            return value
+        value = await self.shared.aget(key, _missing)
+        if value is _missing:
+            return default
+        self.local.set(key, value)
+        return value
+
+    async def aset(self, key, value):
+        self.local.set(key, value)
+        await self.shared.aset(key, value, self.timeout)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
@@ -0,0 +1,14 @@
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Tune every new SQLite connection with ``SQLITE_PRAGMAS``, connected to ``connection_created``.
+
+    journal_mode is stored in the database file, the other pragmas only last as long as the connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    # the raw connection, so the pragmas skip the query wrappers and debug logging
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,221 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger('server.metrics')
+
+# upper bounds of the request duration histogram, in seconds
+duration_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+# statements that only wait for or release the database lock, their time is a lock wait and not a slow query
+transaction_control = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+def is_transaction_control(sql):
+    return sql.lstrip()[:9].upper().startswith(transaction_control)
+
+
+class QueryRecorder:
+    """
+    ``execute_wrapper`` that counts the queries of one request and times them.
+
+    Queries slower than ``SLOW_QUERY_THRESHOLD_MS`` are logged with their view and parameters, transaction control
+    statements are timed but never logged.
+    """
+
+    def __init__(self, view, threshold_ms):
+        self.view = view
+        self.threshold = threshold_ms / 1000
+        self.count = 0
+        self.seconds = 0.0
+        self.slow = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if elapsed >= self.threshold and not is_transaction_control(sql):
+                self.slow += 1
+                logger.warning('slow query in %s (%.1f ms): %s %r', self.view, elapsed * 1000, sql, params)
+
+
+class MetricsRegistry:
+    """
+    Per view counters of this process, rendered in the Prometheus text format.
+
+    Every worker process keeps its own registry, scrape each worker or sum them in the query.
+    """
+
+    def __init__(self, buckets=duration_buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.requests = defaultdict(int)
+            self.durations = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+            self.duration_sums = defaultdict(float)
+            self.queries = defaultdict(int)
+            self.query_seconds = defaultdict(float)
+            self.slow_queries = defaultdict(int)
+            self.response_bytes = defaultdict(int)
+
+    def observe(self, view, method, status, seconds, recorder, response_bytes):
+        with self._lock:
+            self.requests[(view, method, str(status))] += 1
+            counts = self.durations[view]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self.duration_sums[view] += seconds
+            self.queries[view] += recorder.count
+            self.query_seconds[view] += recorder.seconds
+            self.slow_queries[view] += recorder.slow
+            self.response_bytes[view] += response_bytes
+
+    def render(self):
+        with self._lock:
+            lines = []
+
+            def header(name, kind, help_text):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+
+            def sample(name, labels, value):
+                label_text = ','.join(f'{key}="{escape_label(str(label))}"' for key, label in labels)
+                lines.append(f'{name}{{{label_text}}} {format_value(value)}')
+
+            header('api_requests_total', 'counter', 'Requests by view, method and status.')
+            for (view, method, status), value in sorted(self.requests.items()):
+                sample('api_requests_total', (('view', view), ('method', method), ('status', status)), value)
+
+            header('api_request_duration_seconds', 'histogram', 'Wall time of the views.')
+            for view, counts in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    sample('api_request_duration_seconds_bucket', (('view', view), ('le', bound)), cumulative)
+                sample('api_request_duration_seconds_sum', (('view', view),), self.duration_sums[view])
+                sample('api_request_duration_seconds_count', (('view', view),), cumulative)
+
+            for name, help_text, values in (
+                    ('api_db_queries_total', 'Database queries run by the views.', self.queries),
+                    ('api_db_query_seconds_total', 'Time spent in database queries.', self.query_seconds),
+                    ('api_slow_queries_total', 'Queries slower than SLOW_QUERY_THRESHOLD_MS.', self.slow_queries),
+                    ('api_response_bytes_total', 'Bytes of the response bodies.', self.response_bytes)):
+                header(name, 'counter', help_text)
+                for view, value in sorted(values.items()):
+                    sample(name, (('view', view),), value)
+            return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+# recorder of the request being served, context variables follow the async ORM into its worker threads
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    # connections are per thread, the async ORM opens them in threads the middleware never runs in
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder, dispatch_uid='server.metrics.install_query_recorder')
+
+
+class MetricsMiddleware:
+    """
+    Time every request, count and time its queries, and report them in a Server-Timing header and the registry.
+
+    Streaming responses are timed up to the first byte, their size is not known.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        # connections opened before this module was imported never sent connection_created
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+        recorder = QueryRecorder(request.path, settings.SLOW_QUERY_THRESHOLD_MS)
+        token = current_recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        recorder = QueryRecorder(request.path, settings.SLOW_QUERY_THRESHOLD_MS)
+        token = current_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, recorder, started)
+
+    @staticmethod
+    def finish(request, response, recorder, started):
+        seconds = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.route if match is not None else 'unmatched'
+        response_bytes = 0 if response.streaming else len(response.content)
+        registry.observe(view, request.method, response.status_code, seconds, recorder, response_bytes)
+        response['Server-Timing'] = (f'db;dur={recorder.seconds * 1000:.3f};desc="{recorder.count} queries", '
+                                     f'total;dur={seconds * 1000:.3f}')
+        if seconds * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            logger.warning('slow request %s %s (%.1f ms, %d queries, %.1f ms in db)', request.method, view,
+                           seconds * 1000, recorder.count, recorder.seconds * 1000)
+        return response
+
+
+def metrics(request):
+    # scrapers authenticate with the bearer token of METRICS_ACCESS_TOKEN, without one the endpoint is only open in
+    # DEBUG
+    token = settings.METRICS_ACCESS_TOKEN
+    if not token and not settings.DEBUG:
+        return HttpResponseForbidden()
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
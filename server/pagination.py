@@ -0,0 +1,139 @@
+import base64
+import binascii
+import json
+import math
+
+from django.db.models import F
+
+default_page_size = 20
+max_page_size = 100
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    # opaque for clients: url-safe base64 of the keyset values of the last row
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    if cursor is None:
+        return None
+    if not isinstance(cursor, str):
+        raise PaginationError('Invalid cursor!')
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise PaginationError('Invalid cursor!')
+    if not isinstance(values, dict) or not isinstance(values.get('id'), int):
+        raise PaginationError('Invalid cursor!')
+    return values
+
+
+def parse_limit(limit):
+    if limit is None:
+        return default_page_size
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit <= 0:
+        raise PaginationError('Invalid limit!')
+    return min(limit, max_page_size)
+
+
+def _row_value(row, field):
+    # rows may be model instances or values() dicts
+    if isinstance(row, dict):
+        return row[field]
+    return getattr(row, field)
+
+
+def _page_queryset(queryset, cursor, limit):
+    values = decode_cursor(cursor)
+    limit = parse_limit(limit)
+
+    if values is not None:
+        queryset = queryset.filter(id__lt=values['id'])
+
+    # a queryset may come ordered by a column equal to the id, like the post_id of a joined table, so its index
+    # drives the scan
+    if not queryset.query.order_by:
+        queryset = queryset.order_by('-id')
+    # fetch one extra row to know whether there is a next page
+    return queryset[:limit + 1], limit
+
+
+def _page(rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({'id': _row_value(rows[-1], 'id')})
+    return rows, next_cursor
+
+
+def paginate_by_id(queryset, cursor=None, limit=None):
+    """
+    Keyset pagination over a queryset ordered by ``-id``.
+
+    Seeks with ``id < last_id`` instead of OFFSET, so every page costs the same
+    regardless of depth. Returns ``(rows, next_cursor)``.
+    """
+    queryset, limit = _page_queryset(queryset, cursor, limit)
+    return _page(list(queryset), limit)
+
+
+async def apaginate_by_id(queryset, cursor=None, limit=None):
+    """
+    ``paginate_by_id`` for async views, the page is fetched through the async ORM.
+    """
+    queryset, limit = _page_queryset(queryset, cursor, limit)
+    return _page([row async for row in queryset], limit)
+
+
+async def apaginate_merged(querysets, cursor=None, limit=None):
+    """
+    ``apaginate_by_id`` over the union of ``querysets``.
+
+    Every queryset is paged on its own index and the pages are merged, rows found by several querysets are
+    returned once.
+    """
+    limit = parse_limit(limit)
+    rows = {}
+    for queryset in querysets:
+        page, _ = _page_queryset(queryset, cursor, limit)
+        async for row in page:
+            rows.setdefault(_row_value(row, 'id'), row)
+    return _page([rows[row_id] for row_id in sorted(rows, reverse=True)][:limit + 1], limit)
+
+
+def _rank_page_queryset(queryset, rank_field, id_field, cursor, limit):
+    values = decode_cursor(cursor)
+    limit = parse_limit(limit)
+
+    if values is not None:
+        rank = values.get('rank')
+        if isinstance(rank, bool) or not isinstance(rank, (int, float)) or not math.isfinite(rank):
+            raise PaginationError('Invalid cursor!')
+        # a range on the rank index, only the rows of equal rank are compared by id
+        queryset = (queryset.filter(**{f'{rank_field}__lte': rank})
+                    .exclude(**{rank_field: rank, f'{id_field}__gte': values['id']}))
+
+    queryset = queryset.annotate(rank=F(rank_field)).order_by(f'-{rank_field}', f'-{id_field}')
+    return queryset[:limit + 1], limit
+
+
+async def apaginate_by_rank(queryset, rank_field, cursor=None, limit=None, id_field='id'):
+    """
+    Keyset pagination over a queryset ordered by ``-rank_field`` then ``-id_field``, for rankings.
+
+    ``id_field`` is a column equal to the id that is ordered together with the rank in one index, like the primary
+    key of the ranking table. Returns ``(rows, next_cursor)``.
+    """
+    queryset, limit = _rank_page_queryset(queryset, rank_field, id_field, cursor, limit)
+    rows = [row async for row in queryset]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({'rank': _row_value(rows[-1], 'rank'), 'id': _row_value(rows[-1], 'id')})
+    return rows, next_cursor
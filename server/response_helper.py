@@ -1,26 +1,98 @@
-from django.http import JsonResponse
+import functools
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger('server.response_helper')
+
+_django_encoder = DjangoJSONEncoder()
+
+
+def encode_json_stdlib(data):
+    # the bytes of JsonResponse: ', ' and ': ' separators, non-ASCII characters escaped
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+def encode_json_orjson(data):
+    # the same JSON values as the stdlib path, written compact and as UTF-8 instead of escaped, datetimes are passed
+    # through to the django encoder so they keep its format
+    return orjson.dumps(data, default=_django_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+# encoder -> separator between the items of a JSON array it writes
+json_encoders = {
+    'stdlib': (encode_json_stdlib, b', '),
+    'orjson': (encode_json_orjson, b','),
+}
+
+
+@functools.cache
+def _warn_orjson_missing():
+    logger.warning('JSON_RESPONSE_ENCODER is orjson but orjson is not installed, using stdlib')
+
+
+def get_json_encoder(name=None):
+    name = name or settings.JSON_RESPONSE_ENCODER
+    if name == 'orjson' and orjson is None:
+        # warned once per process, the responses are still served
+        _warn_orjson_missing()
+        name = 'stdlib'
+    return json_encoders[name]
+
+
+def format_datetime(value):
+    """
+    The string ``DjangoJSONEncoder`` writes for a datetime.
+
+    The formatters below call it while they build their rows from the queryset, so neither encoder has to call back
+    into python for every datetime of a page.
+    """
+    return _django_encoder.default(value)
+
+
+def generate_json_response(payload):
+    encode, _ = get_json_encoder()
+    return HttpResponse(encode(payload), content_type='application/json', status=200)
 
 
 def generate_successful_response(data):
-    return JsonResponse({
+    return generate_json_response({
         'code': 1,
         'data': data,
-    }, status=200)
+    })
 
 
 def generate_failed_response(message: str, code=0, data=None):
-    return JsonResponse({
+    return generate_json_response({
         'code': code,
         'message': message,
         'data': data,
-    }, status=200)
+    })
+
+
+def generate_batch_response(contents):
+    # the responses of the batched views are already encoded, they are joined as they are into the envelope the
+    # encoder writes for an empty list
+    encode, separator = get_json_encoder()
+    envelope = encode({'code': 1, 'data': []})
+    return HttpResponse(envelope[:-2] + separator.join(contents) + envelope[-2:], content_type='application/json',
+                        status=200)
 
 
 def generate_missing_fields_response(missing_fields):
     return generate_failed_response(f"Missing fields: {', '.join(missing_fields)}!")
 
 
-def generate_account_response(account, followers=0, following=0, likes=0, access_token=None):
+def generate_account_response(account, access_token=None):
     return generate_successful_response({
         'id': account.id,
         'email': account.email,
@@ -29,16 +101,46 @@ def generate_account_response(account, followers=0, following=0, likes=0, access
         'bio': account.bio,
         'avatar': account.avatar,
         'wallpaper': account.wallpaper,
-        'create_datetime': account.create_datetime,
+        'create_datetime': format_datetime(account.create_datetime),
         'access_token': access_token,
-        'following': following,
-        'followers': followers,
-        'likes': likes,
+        'following': account.following_count,
+        'followers': account.followers_count,
+        'likes': account.likes_received_count,
     })
 
 
 def generate_posts_response(posts):
-    return generate_successful_response([{
+    return generate_successful_response(format_posts(posts))
+
+
+def generate_post_response(post):
+    return generate_successful_response(format_posts([post])[0])
+
+
+# columns loaded for feed list items, the full content is served by post/detail
+post_summary_fields = ('id', 'title', 'images', 'poster_email', 'poster_id', 'poster_name', 'likes', 'views',
+                       'channel', 'create_datetime')
+
+
+def format_post_summaries(posts):
+    # posts are values() rows of post_summary_fields annotated with an excerpt
+    return [{
+        'id': post['id'],
+        'title': post['title'],
+        'excerpt': post['excerpt'],
+        'images': post['images'],
+        'poster_email': post['poster_email'],
+        'poster_id': post['poster_id'],
+        'poster_name': post['poster_name'],
+        'likes': post['likes'],
+        'views': post['views'],
+        'channel': post['channel'],
+        'create_datetime': format_datetime(post['create_datetime']),
+    } for post in posts]
+
+
+def format_posts(posts):
+    return [{
         'id': post.id,
         'title': post.title,
         'content': post.content,
@@ -49,26 +151,32 @@ def generate_posts_response(posts):
         'likes': post.likes,
         'views': post.views,
         'channel': post.channel,
-        'create_datetime': post.create_datetime,
-    } for post in posts])
+        'create_datetime': format_datetime(post.create_datetime),
+    } for post in posts]
 
 
 def generate_comments_response(comments):
     return generate_successful_response(format_comments(comments))
 
 
+def with_post_title(comments):
+    # join the post title in the same query instead of loading every related post
+    return comments.annotate(post_title=F('post__title'))
+
+
 def format_comments(comments):
+    # comments are expected to come from with_post_title()
     return [{
         'id': comment.id,
-        'post': comment.post.id,
-        'post_title': comment.post.title,
+        'post': comment.post_id,
+        'post_title': comment.post_title,
         'poster_email': comment.poster_email,
         'commentator_email': comment.commentator_email,
         'commentator_id': comment.commentator_id,
         'commentator_name': comment.commentator_name,
         'comment': comment.comment,
         'read': comment.read,
-        'create_datetime': comment.create_datetime,
+        'create_datetime': format_datetime(comment.create_datetime),
     } for comment in comments]
 
 
@@ -80,7 +188,7 @@ def format_likes(likes):
         'post_id': like.post_id,
         'poster_email': like.poster_email,
         'read': like.read,
-        'create_datetime': like.create_datetime,
+        'create_datetime': format_datetime(like.create_datetime),
     } for like in likes]
 
 
@@ -92,5 +200,5 @@ def format_followers(followers):
         'follower_id': follower.follower_id,
         'followed_email': follower.followed_email,
         'read': follower.read,
-        'create_datetime': follower.create_datetime,
+        'create_datetime': format_datetime(follower.create_datetime),
     } for follower in followers]
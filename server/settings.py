@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,9 +42,12 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'account.apps.AccountConfig',
     'post.apps.PostConfig',
+    'server.apps.ServerConfig',
 ]
 
 MIDDLEWARE = [
+    # first, so the timings cover the other middlewares too
+    'server.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,7 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'server.static_files.AsyncWhiteNoiseMiddleware',
 ]
 
 ROOT_URLCONF = 'server.urls'
@@ -81,14 +85,217 @@ WSGI_APPLICATION = 'server.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# 'sqlite' by default, 'postgresql' switches to the POSTGRES_* settings below
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+
+# seconds a connection is kept open for the next request of its thread. ASGI runs the queries of every request in a
+# new thread, whose connection no later request can reuse, so by default it is closed when its request ends.
+# server.wsgi raises it for the threaded WSGI workers, which do reuse their connections
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 0))
+
+# milliseconds a writer waits for the lock of another writer before "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+# applied to every new SQLite connection by server.database
+SQLITE_PRAGMAS = {
+    # readers keep reading while a writer commits
+    'journal_mode': 'wal',
+    # fsync at checkpoints instead of every commit, a power loss can only drop the last commits
+    'synchronous': 'normal',
+    'busy_timeout': SQLITE_BUSY_TIMEOUT_MS,
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # negative sizes are in KiB
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+}
+
+if DATABASE_ENGINE == 'postgresql':
+    # needs psycopg with its pool: pip install "psycopg[binary,pool]"
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'gla_it_project'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # the pool owns the connections, django returns them after every request
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+                    'timeout': 10,
+                },
+            },
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            # benchmarks point the app and its server processes at a throwaway database
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+                # take the write lock when a transaction starts, a deferred transaction that reads first
+                # fails at once when it has to upgrade its lock, whatever the busy timeout
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # a file based test database lets concurrency tests use one connection per thread
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# the feeds cache is shared between workers, point it to redis or a file based cache in production
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'feeds': {
+        'BACKEND': os.environ.get('FEED_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('FEED_CACHE_LOCATION', 'feeds'),
+    },
+    # revoked access tokens, kept apart from the feeds so clearing feed pages does not drop them
+    'revocations': {
+        'BACKEND': os.environ.get('REVOCATION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('REVOCATION_CACHE_LOCATION', 'revocations'),
+    },
+}
+
+FEED_CACHE_ALIAS = 'feeds'
+# max pages kept in the in-process LRU in front of the shared cache
+FEED_CACHE_LOCAL_SIZE = 256
+FEED_CACHE_TIMEOUT = 300
+# seconds a worker trusts its copy of a feed's generation, and may serve its pages after another worker bumped it
+FEED_CACHE_GENERATION_TTL = 1
+
+# resolved access tokens cached per worker, logout, login and account deletion revoke them in every worker through
+# the shared revocations cache, every cache hit reads the revocation of its token
+ACCESS_TOKEN_CACHE_SIZE = 10000
+ACCESS_TOKEN_CACHE_TTL = 60
+ACCESS_TOKEN_REVOCATION_CACHE_ALIAS = 'revocations'
+
+# following feeds: posts are copied into the timelines of the poster's followers when published, unless the poster
+# has more followers than this, then its posts are merged into the feed when it is read
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.environ.get('TIMELINE_FANOUT_MAX_FOLLOWERS', 1000))
+# latest posts of an account copied into a timeline when it is followed or the timeline is rebuilt
+TIMELINE_BACKFILL_POSTS = int(os.environ.get('TIMELINE_BACKFILL_POSTS', 100))
+
+# trending rankings, scored by the update_trending command from the engagement of recent posts
+TRENDING_WEIGHTS = {'likes': 1.0, 'comments': 2.0, 'views': 0.1}
+# weight of the engagement halves every TRENDING_HALF_LIFE_HOURS
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 24))
+# posts older than this are dropped from the rankings
+TRENDING_WINDOW_DAYS = int(os.environ.get('TRENDING_WINDOW_DAYS', 7))
+
+# views of posts are buffered per worker and added to Post.views every POST_VIEW_FLUSH_INTERVAL seconds, or as soon
+# as POST_VIEW_FLUSH_SIZE views are buffered
+POST_VIEW_FLUSH_INTERVAL = float(os.environ.get('POST_VIEW_FLUSH_INTERVAL', 5))
+POST_VIEW_FLUSH_SIZE = int(os.environ.get('POST_VIEW_FLUSH_SIZE', 1000))
+
+# sub-requests accepted by one api/batch request
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+
+# rows deleted per transaction when posts and accounts are deleted with large cascades
+DELETE_BATCH_SIZE = int(os.environ.get('DELETE_BATCH_SIZE', 1000))
+
+# encoder of api responses: 'stdlib' writes the bytes of JsonResponse, 'orjson' the same values compact and as UTF-8,
+# falls back to 'stdlib' with a warning when orjson is not installed
+JSON_RESPONSE_ENCODER = os.environ.get('JSON_RESPONSE_ENCODER', 'stdlib')
+
+# queries and requests slower than these thresholds are logged by server.metrics
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 500))
+# bearer token required by /api/metrics, when it is empty the endpoint is denied unless DEBUG is on
+METRICS_ACCESS_TOKEN = os.environ.get('METRICS_ACCESS_TOKEN', '')
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'server.metrics': {
+            'handlers': ['console'],
+            # the test suite hashes passwords and contends for the database lock on purpose, its slow requests are
+            # expected, tests of the logging capture it with assertLogs
+            'level': os.environ.get('METRICS_LOG_LEVEL', 'ERROR' if sys.argv[1:2] == ['test'] else 'WARNING'),
+            'propagate': False,
+        },
+        'account.mail': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'post.view_counts': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'server.response_helper': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
 
+# Email
+# https://docs.djangoproject.com/en/5.1/topics/email/
+
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '').lower() in ('1', 'true')
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@gla-it-project.onrender.com')
+
+# requests queue emails, python manage.py deliver_emails sends them
+EMAIL_BATCH_SIZE = 50
+EMAIL_MAX_ATTEMPTS = 5
+# delay before the first retry, doubled after every failed attempt
+EMAIL_RETRY_SECONDS = 60
+# a claimed email is retried after this long when its worker did not finish it
+EMAIL_CLAIM_SECONDS = 300
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.1/topics/auth/passwords/
+
+PASSWORD_HASHERS = [
+    'account.hashers.PBKDF2PasswordHasher',
+    # needs argon2-cffi, set PASSWORD_HASHER=argon2 to hash new passwords with it
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    # legacy digests, upgraded on login
+    'account.hashers.UnsaltedSHA512PasswordHasher',
+]
+if os.environ.get('PASSWORD_HASHER') == 'argon2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+
+# django 5.1 default, passwords hashed with another cost are rehashed on login
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 870000))
+# threads per process hashing passwords, login and signup wait for one instead of blocking the server
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
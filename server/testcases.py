@@ -0,0 +1,26 @@
+from django.test import TestCase
+
+from post.feed_cache import clear_feed_cache
+
+
+class QueryCountTestCase(TestCase):
+    """
+    Check that the query count of an endpoint does not depend on the number of rows it returns.
+
+    Subclasses add the rows an endpoint returns in ``add_rows``. The feed cache is cleared before every request, so
+    the counted request always reaches the database.
+    """
+
+    def add_rows(self, count):
+        raise NotImplementedError
+
+    def assertConstantQueries(self, num, path, data):
+        for count in (1, 20):
+            self.add_rows(count)
+            clear_feed_cache()
+            # warm up the access token cache
+            self.client.post(path, data, content_type="application/json")
+            clear_feed_cache()
+            with self.assertNumQueries(num):
+                response = self.client.post(path, data, content_type="application/json")
+            self.assertEqual(response.json()["code"], 1)
@@ -0,0 +1,445 @@
+import asyncio
+import datetime
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import JsonResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from account.counters import counter_expressions
+from account.models import Account, AccountAccessToken
+from post.feed_cache import clear_feed_cache
+from post.models import Post, LikedPost
+from server.auth import account_cache
+from server.metrics import QueryRecorder, registry
+from server.response_helper import encode_json_stdlib, encode_json_orjson, orjson, format_datetime, \
+    generate_batch_response, generate_failed_response, _warn_orjson_missing
+
+
+# Create your tests here.
+class ResponseEncoderTestCase(SimpleTestCase):
+    payload = {
+        'code': 1,
+        'data': [{
+            'id': 1,
+            'title': 'Mapo Tofu 麻婆豆腐',
+            'likes': 3,
+            'read': False,
+            'images': None,
+            'create_datetime': datetime.datetime(2025, 3, 13, 17, 3, 1, 123456, tzinfo=datetime.timezone.utc),
+        }],
+    }
+
+    def test_stdlib_encoder(self):
+        encoded = encode_json_stdlib(self.payload)
+        self.assertEqual(encoded, JsonResponse(self.payload).content)
+        self.assertIn(b'"create_datetime": "2025-03-13T17:03:01.123Z"', encoded)
+        self.assertIn(b'\\u9ebb\\u5a46', encoded)
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_encoder(self):
+        encoded = encode_json_orjson(self.payload)
+        self.assertEqual(json.loads(encoded), json.loads(encode_json_stdlib(self.payload)))
+        # compact and UTF-8
+        self.assertIn(b'"create_datetime":"2025-03-13T17:03:01.123Z"', encoded)
+        self.assertIn('麻婆豆腐'.encode('utf-8'), encoded)
+
+    @override_settings(JSON_RESPONSE_ENCODER='orjson')
+    def test_missing_orjson_falls_back_to_stdlib(self):
+        _warn_orjson_missing.cache_clear()
+        with mock.patch('server.response_helper.orjson', None), \
+                self.assertLogs('server.response_helper', 'WARNING') as logs:
+            responses = [generate_failed_response('Invalid JSON!') for _ in range(2)]
+        self.assertEqual(len(logs.output), 1)
+        self.assertEqual(responses[1].content,
+                         JsonResponse({'code': 0, 'message': 'Invalid JSON!', 'data': None}).content)
+
+    def test_formatted_datetime(self):
+        create_datetime = self.payload['data'][0]['create_datetime']
+        self.assertEqual(format_datetime(create_datetime), '2025-03-13T17:03:01.123Z')
+
+    @override_settings(JSON_RESPONSE_ENCODER='stdlib')
+    def test_batch_envelope(self):
+        contents = [encode_json_stdlib({'code': 1, 'data': i}) for i in range(2)]
+        self.assertEqual(generate_batch_response(contents).content,
+                         JsonResponse({'code': 1, 'data': [{'code': 1, 'data': i} for i in range(2)]}).content)
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Run every endpoint and check the query plan of each statement it issues.
+
+    A scan is only accepted when it walks the primary key or an index in the ORDER BY direction and stops at the
+    LIMIT of a page.
+    """
+
+    def setUp(self):
+        clear_feed_cache()
+        account_cache.clear()
+        account = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i', password='')
+        other = Account.objects.create(email='aaaa@gmail.com', name='aaaa', password='')
+        AccountAccessToken.objects.create(account=account, account_email='xi4f3i@gmail.com', access_token='123456')
+        AccountAccessToken.objects.create(account=other, account_email='aaaa@gmail.com', access_token='654321')
+        for i in range(3):
+            Post.objects.create(title=f'Salmon Sushi {i}', content='Sushi rice and salmon.',
+                                poster_email='xi4f3i@gmail.com', poster=account, poster_name='xi4f3i',
+                                channel='Japanese_Cuisine')
+        self.statements = []
+
+    def capture(self, execute, sql, params, many, context):
+        if sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE'):
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+    def request(self, path, data):
+        with connection.execute_wrapper(self.capture):
+            response = self.client.post(path, data, content_type="application/json")
+        self.assertEqual(response.json()["code"], 1, path)
+
+    def assertIndexedPlans(self):
+        self.assertTrue(self.statements)
+        failures = []
+        for sql, params in self.statements:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = [row[-1] for row in cursor.fetchall()]
+            # a full-text match is ranked after the index lookup, its sort only sees the matched rows
+            ranked = any('VIRTUAL TABLE' in line for line in plan)
+            sorted_in_memory = any('TEMP B-TREE' in line for line in plan)
+            paged = ' LIMIT ' in sql and not sorted_in_memory
+            for line in plan:
+                # a page may walk an index in the order of the feed. SQLite shows a walk of the rowid as a bare SCAN
+                # of the table, which is only a walk when nothing is filtered, a filtered one can read the whole
+                # table to fill a short page
+                walks_index = ' USING ' in line or ' WHERE ' not in sql
+                if line.startswith('SCAN') and 'VIRTUAL TABLE' not in line and not (paged and walks_index):
+                    failures.append(f'{line}: {sql}')
+                if 'TEMP B-TREE' in line and not ranked:
+                    failures.append(f'{line}: {sql}')
+        self.assertEqual(failures, [])
+
+    def test_filtered_scan_is_rejected(self):
+        # limited, ordered by the primary key, but every post is read until three match
+        self.statements = [('SELECT "id" FROM "post_post" WHERE "content" = %s ORDER BY "id" DESC LIMIT 3', ['x'])]
+        with self.assertRaises(AssertionError):
+            self.assertIndexedPlans()
+        self.statements = [('SELECT "id" FROM "post_post" ORDER BY "id" DESC LIMIT 3', [])]
+        self.assertIndexedPlans()
+
+    def test_post_endpoints(self):
+        self.request('/api/account/follow', {'access_token': '654321', 'email': 'xi4f3i@gmail.com'})
+        self.request('/api/post/publish', {'access_token': '123456', 'title': 'Miso Soup', 'content': 'Miso.',
+                                           'channel': 'Soups'})
+        self.request('/api/post/like', {'access_token': '654321', 'id': 1})
+        self.request('/api/post/like', {'access_token': '654321', 'id': 2})
+        self.request('/api/post/like', {'access_token': '654321', 'id': 2})
+        self.request('/api/post/comment', {'access_token': '654321', 'id': 1, 'comment': 'yummy'})
+        for data in ({'type': 'All', 'limit': 2}, {'type': 'Japanese_Cuisine', 'limit': 2},
+                     {'type': 'publish', 'email': 'xi4f3i@gmail.com', 'limit': 2, 'projection': 'summary'},
+                     {'type': 'like', 'email': 'aaaa@gmail.com', 'limit': 2},
+                     {'type': 'following', 'access_token': '654321', 'limit': 2},
+                     {'type': 'All', 'order': 'trending', 'limit': 2},
+                     {'type': 'Soups', 'order': 'trending', 'limit': 1, 'projection': 'summary'},
+                     {'type': 'Japanese_Cuisine'}, {'type': 'publish', 'email': 'xi4f3i@gmail.com'}):
+            clear_feed_cache()
+            self.request('/api/post/query', data)
+        self.request('/api/post/detail', {'id': 1})
+        self.request('/api/post/search', {'keyword': 'salmon', 'channel': 'Japanese_Cuisine'})
+        self.request('/api/post/query_comments', {'id': 1})
+        self.request('/api/post/query_like_status', {'access_token': '654321', 'id': 1})
+        self.request('/api/post/delete', {'access_token': '123456', 'id': 1})
+        self.assertIndexedPlans()
+
+    def test_account_endpoints(self):
+        self.request('/api/account/follow', {'access_token': '654321', 'email': 'xi4f3i@gmail.com'})
+        self.request('/api/account/query', {'id': 1})
+        self.request('/api/account/query', {'access_token': '123456'})
+        self.request('/api/account/query_follow_status', {'access_token': '654321', 'email': 'xi4f3i@gmail.com'})
+        self.request('/api/account/query_notification', {'access_token': '123456'})
+        self.request('/api/account/query_notification', {'access_token': '123456', 'since_ids': {'followers': 0},
+                                                          'limit': 10})
+        self.request('/api/account/unread_counts', {'access_token': '123456'})
+        self.request('/api/account/read_notification', {'access_token': '123456', 'type': 'followers', 'id': 1})
+        self.request('/api/account/read_notifications', {'access_token': '123456', 'up_to': {'likes': 10},
+                                                          'comments': [1, 2]})
+        self.request('/api/account/follow', {'access_token': '654321', 'email': 'xi4f3i@gmail.com'})
+        self.request('/api/account/send_passcode', {'email': 'bbbb@gmail.com'})
+        self.request('/api/account/logout', {'access_token': '123456'})
+        self.assertIndexedPlans()
+
+
+@override_settings(METRICS_ACCESS_TOKEN='scrape')
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        registry.clear()
+        clear_feed_cache()
+
+    def metrics(self):
+        return self.client.get('/api/metrics', headers={'Authorization': 'Bearer scrape'}).content.decode()
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.post('/api/post/query', {'type': 'explore'},
+                                    content_type="application/json")
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries", total;dur=[\d.]+$')
+
+        text = self.metrics()
+        self.assertIn('api_requests_total{view="api/post/query",method="POST",status="200"} 1', text)
+        self.assertIn('api_request_duration_seconds_count{view="api/post/query"} 1', text)
+        self.assertIn('api_request_duration_seconds_bucket{view="api/post/query",le="+Inf"} 1', text)
+        self.assertRegex(text, r'api_db_queries_total\{view="api/post/query"\} [1-9]')
+        self.assertIn(f'api_response_bytes_total{{view="api/post/query"}} {len(response.content)}', text)
+
+    async def test_async_requests_are_recorded(self):
+        # the ASGI handler runs the middleware and views async, the queries run in a worker thread
+        response = await self.async_client.post('/api/post/query', {'type': 'explore'},
+                                                content_type="application/json")
+        self.assertEqual(response.json()['code'], 1)
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    def test_transaction_control_is_not_a_slow_query(self):
+        recorder = QueryRecorder('api/post/like', 0)
+        with connection.execute_wrapper(recorder), self.assertNoLogs('server.metrics', 'WARNING'):
+            with connection.cursor() as cursor:
+                cursor.execute('SAVEPOINT metrics')
+                cursor.execute('RELEASE SAVEPOINT metrics')
+        self.assertEqual((recorder.count, recorder.slow), (2, 0))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_are_logged(self):
+        with self.assertLogs('server.metrics', 'WARNING') as logs:
+            self.client.post('/api/post/query', {'type': 'explore'}, content_type="application/json")
+        self.assertIn('slow query in /api/post/query', logs.output[0])
+        self.assertRegex(self.metrics(),
+                         r'api_slow_queries_total\{view="api/post/query"\} [1-9]')
+
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        response = self.client.get('/api/metrics', headers={'Authorization': 'Bearer scrape'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    @override_settings(METRICS_ACCESS_TOKEN='')
+    def test_metrics_denied_without_token(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/api/metrics').status_code, 200)
+
+
+class BatchTestCase(TestCase):
+
+    def setUp(self):
+        clear_feed_cache()
+        account_cache.clear()
+        poster = Account.objects.create(email='xi4f3i@gmail.com', name='xi4f3i', password='')
+        viewer = Account.objects.create(email='aaaa@gmail.com', name='aaaa', password='')
+        AccountAccessToken.objects.create(account=viewer, account_email='aaaa@gmail.com', access_token='654321')
+        self.post = Post.objects.create(title='Salmon Sushi', content='Sushi rice and salmon.', poster=poster,
+                                        poster_email='xi4f3i@gmail.com', poster_name='xi4f3i',
+                                        channel='Japanese_Cuisine')
+
+    def batch(self, data):
+        response = self.client.post('/api/batch', data, content_type="application/json")
+        return response.json()
+
+    def post_dialog(self):
+        return [
+            {'path': 'post/query_comments', 'data': {'id': self.post.id}},
+            {'path': 'account/query_follow_status', 'data': {'email': 'xi4f3i@gmail.com'}},
+            {'path': 'post/query_like_status', 'data': {'id': self.post.id}},
+        ]
+
+    def test_batch(self):
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            response = self.batch({'access_token': '654321', 'requests': self.post_dialog()})
+        self.assertEqual(response['code'], 1)
+        self.assertEqual([(result['code'], result['data']) for result in response['data']],
+                         [(1, []), (1, False), (1, False)])
+        # the access token is resolved once for the whole batch
+        self.assertEqual(len([sql for sql in queries if 'account_accountaccesstoken' in sql]), 1)
+
+    def test_writes_run_in_order(self):
+        response = self.batch({'access_token': '654321', 'requests': [
+            {'path': 'post/like', 'data': {'id': self.post.id}},
+            {'path': 'account/follow', 'data': {'email': 'xi4f3i@gmail.com'}},
+            *self.post_dialog(),
+        ]})
+        self.assertEqual([result['data'] for result in response['data']], [True, True, [], True, True])
+
+    def test_own_access_token(self):
+        response = self.batch({'requests': [
+            {'path': 'post/query_like_status', 'data': {'id': self.post.id, 'access_token': '654321'}},
+            {'path': 'post/query_like_status', 'data': {'id': self.post.id}},
+        ]})
+        self.assertEqual([result['code'] for result in response['data']], [1, 0])
+
+    def test_stale_access_token(self):
+        # only the calls that need the token fail, the comments load without it
+        response = self.batch({'access_token': '123456', 'requests': self.post_dialog()})
+        self.assertEqual(response['code'], 1)
+        self.assertEqual([(result['code'], result['message'] if result['code'] != 1 else result['data'])
+                          for result in response['data']],
+                         [(1, []), (0, 'Invalid access token!'), (0, 'Invalid access token!')])
+
+    def test_profile_query(self):
+        # the token of the batch does not turn a query of another profile into a query of the own account
+        response = self.batch({'access_token': '654321', 'requests': [
+            {'path': 'account/query', 'data': {'id': self.post.poster_id}},
+        ]})
+        self.assertEqual(response['data'][0]['data']['email'], 'xi4f3i@gmail.com')
+
+    def test_invalid_requests(self):
+        response = self.batch({'access_token': '654321', 'requests': [
+            {'path': 'account/login', 'data': {}},
+            {'path': 'post/detail', 'data': {'id': self.post.id}},
+            {'path': ['post/detail']},
+            'post/detail',
+        ]})
+        self.assertEqual([result['code'] for result in response['data']], [0, 1, 0, 0])
+        self.assertEqual(response['data'][0]['message'], 'Invalid path!')
+
+        self.assertEqual(self.batch({'requests': {}})['message'], 'Invalid requests!')
+        self.assertEqual(self.batch({})['message'], 'Missing fields: requests!')
+        with self.settings(BATCH_MAX_REQUESTS=2):
+            self.assertEqual(self.batch({'requests': self.post_dialog()})['message'], 'Invalid requests!')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite profile')
+class DatabaseProfileTestCase(TestCase):
+
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            pragmas = {}
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size'):
+                cursor.execute(f'PRAGMA {name}')
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {
+            'journal_mode': 'wal',
+            # NORMAL
+            'synchronous': 1,
+            'busy_timeout': settings.SQLITE_BUSY_TIMEOUT_MS,
+            'cache_size': settings.SQLITE_PRAGMAS['cache_size'],
+        })
+
+
+class AsgiConnectionTestCase(TransactionTestCase):
+    """
+    Requests through the ASGI handler as uvicorn serves them, the test client keeps connections open for the test.
+    """
+
+    def setUp(self):
+        clear_feed_cache()
+        self.opened = []
+        connection_created.connect(self.record_connection)
+
+    def tearDown(self):
+        connection_created.disconnect(self.record_connection)
+
+    def record_connection(self, sender, connection, **kwargs):
+        self.opened.append(connection)
+
+    async def request(self, path, data):
+        messages = []
+        body = json.dumps(data).encode('utf-8')
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'path': path,
+                 'raw_path': path.encode('ascii'), 'root_path': '', 'scheme': 'http', 'query_string': b'',
+                 'headers': [(b'content-type', b'application/json')], 'client': ('127.0.0.1', 50000),
+                 'server': ('testserver', 80)}
+        received = []
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # the client stays connected until the response is sent
+            await asyncio.Future()
+
+        async def send(message):
+            messages.append(message)
+
+        await ASGIHandler()(scope, receive, send)
+        return json.loads(b''.join(message.get('body', b'') for message in messages
+                                   if message['type'] == 'http.response.body'))
+
+    def test_connections_are_closed(self):
+        for limit in (1, 2):
+            opened = len(self.opened)
+            # a new event loop, like a server's, every request runs its queries in a thread of its own
+            response = asyncio.run(self.request('/api/post/query', {'type': 'All', 'limit': limit}))
+            self.assertEqual(response['code'], 1)
+            # every request ran in a new thread with a new connection, closed when the request ended
+            self.assertEqual(len(self.opened), opened + 1)
+            self.assertIsNone(self.opened[-1].connection)
+
+
+class ConcurrentWriterTestCase(TransactionTestCase):
+    """
+    Writers of every kind race on the same rows, none may fail with "database is locked".
+    """
+    accounts = 8
+    rounds = 4
+
+    def setUp(self):
+        clear_feed_cache()
+        account_cache.clear()
+        self.posts = []
+        for i in range(self.accounts):
+            account = Account.objects.create(email=f'user{i}@gmail.com', name=f'user{i}', password='')
+            AccountAccessToken.objects.create(account=account, account_email=account.email, access_token=f'token{i}')
+            self.posts.append(Post.objects.create(title=f'Post Title {i}', content='Post Content',
+                                                  poster=account, poster_email=account.email,
+                                                  poster_name=account.name, channel='Western_Cuisine').id)
+
+    def write(self, i):
+        client = self.client_class()
+        token = f'token{i}'
+        results = []
+
+        def post(path, data):
+            response = client.post(path, data, content_type="application/json").json()
+            results.append((path, response['code'], response.get('message'), response['data']))
+            return response['data']
+
+        try:
+            for r in range(self.rounds):
+                # everyone writes to the same few posts and accounts
+                target = (i + r) % 2
+                post('/api/post/like', {'access_token': token, 'id': self.posts[target]})
+                post('/api/post/comment', {'access_token': token, 'id': self.posts[target], 'comment': 'Comment'})
+                post('/api/account/follow', {'access_token': token, 'email': f'user{(i + r + 1) % 2}@gmail.com'})
+                post('/api/post/publish', {'access_token': token, 'title': f'Post {i} {r}', 'content': 'Content',
+                                           'channel': 'Soups'})
+                own = post('/api/post/query', {'type': 'publish', 'email': f'user{i}@gmail.com', 'limit': 1})
+                post('/api/post/delete', {'access_token': token, 'id': own['posts'][0]['id']})
+                post('/api/account/read_notifications', {'access_token': token, 'up_to': {'likes': 10 ** 9}})
+        finally:
+            connection.close()
+        return results
+
+    def test_concurrent_writers(self):
+        with ThreadPoolExecutor(max_workers=self.accounts) as executor:
+            results = [result for results in executor.map(self.write, range(self.accounts)) for result in results]
+
+        failures = [result for result in results if result[1] != 1]
+        self.assertEqual(failures, [])
+        for post in Post.objects.all():
+            self.assertEqual(post.likes, LikedPost.objects.filter(post=post).count())
+        # the maintained counters equal a recount
+        fields = list(counter_expressions())
+        counters = list(Account.objects.order_by('id').values_list(*fields))
+        recounted = list(Account.objects.order_by('id').annotate(
+            **{f'recount_{name}': expression for name, expression in counter_expressions().items()}
+        ).values_list(*[f'recount_{name}' for name in fields]))
+        self.assertEqual(counters, recounted)
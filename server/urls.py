@@ -17,12 +17,19 @@ Including another URLconf
 from django.urls import path, re_path, include
 from django.views.generic import TemplateView
 
+from server.batch import batch
+from server.metrics import metrics
+
 urlpatterns = [
     # path('admin/', admin.site.urls),
     # Account module API path
     path('api/account/', include('account.urls')),
     # Post module API path
     path('api/post/', include('post.urls')),
+    # Several post and account API calls in one request
+    path('api/batch', batch, name='batch'),
+    # Prometheus metrics of this worker
+    path('api/metrics', metrics, name='metrics'),
     # To resolve vue router history mode
     re_path(r'^.*$', TemplateView.as_view(template_name="index.html"), name='index'),
 ]
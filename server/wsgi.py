@@ -12,5 +12,12 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+# the threads of a WSGI worker serve request after request, each keeps its connection for the next one
+os.environ.setdefault('DATABASE_CONN_MAX_AGE', '60')
 
 application = get_wsgi_application()
+
+# buffered post views are flushed on a timer and when the worker exits
+from post.view_counts import view_counter  # noqa: E402
+
+view_counter.start()
@@ -1,6 +1,6 @@
 import { defineStore } from 'pinia'
 import { ref } from 'vue'
-import { sendRequest } from '@/utils/http.ts'
+import { sendBatchRequest, sendRequest } from '@/utils/http.ts'
 
 export interface IPost {
   id: number
@@ -175,6 +175,38 @@ export const usePostsStore = defineStore('posts', () => {
     }
   }
 
+  // comments, follow status and like status of the post dialog in one request
+  async function queryPostDialog(post: IPost) {
+    // nothing of the previously opened post is shown if a call fails
+    comments.value = []
+    followStatus.value = true
+    liked.value = false
+    try {
+      const resp = await sendBatchRequest([
+        { path: 'post/query_comments', data: { id: post.id } },
+        { path: 'account/query_follow_status', data: { email: post.poster_email } },
+        { path: 'post/query_like_status', data: { id: post.id } },
+      ])
+      if (resp.code !== 1) {
+        throw new Error(resp?.message ?? 'Failed to query post!')
+      }
+
+      // each call fails on its own, e.g. the follow and like status with an expired access token
+      const [commentsResp, followResp, likedResp] = resp.data || []
+      if (commentsResp?.code === 1) {
+        comments.value = (commentsResp.data as Array<IComment>) || []
+      }
+      if (followResp?.code === 1) {
+        followStatus.value = followResp.data as boolean
+      }
+      if (likedResp?.code === 1) {
+        liked.value = likedResp.data as boolean
+      }
+    } catch (err) {
+      console.warn(err)
+    }
+  }
+
   async function deletePost(post: IPost) {
     try {
       const resp = await sendRequest<
@@ -212,6 +244,7 @@ export const usePostsStore = defineStore('posts', () => {
     followStatus,
     queryFollowStatus,
     follow,
+    queryPostDialog,
     deletePost,
   }
 })
@@ -34,3 +34,20 @@ export async function sendRequest<TReq, TRes>(
 
   return await resp.json()
 }
+
+export interface IBatchRequest {
+  path: string
+  data?: object
+}
+
+// several api calls in one round trip, the responses come back in the order of the requests
+export async function sendBatchRequest(
+  requests: Array<IBatchRequest>,
+  options?: ISendRequestOptions,
+): Promise<IResponse<Array<IResponse<unknown>>>> {
+  return await sendRequest<{ requests: Array<IBatchRequest> }, Array<IResponse<unknown>>>(
+    '/api/batch',
+    options,
+    { requests: requests },
+  )
+}